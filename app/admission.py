@@ -0,0 +1,151 @@
+import asyncio
+import bisect
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List
+
+from app.metrics import RP_ADMISSION_INFLIGHT, RP_ADMISSION_QUEUE_DEPTH, RP_ADMISSION_REJECTED, RP_ADMISSION_WAIT
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class AdmissionConfig:
+    max_inflight: int = int(os.getenv("RP_MAX_INFLIGHT", "64"))
+    max_per_user: int = int(os.getenv("RP_MAX_INFLIGHT_PER_USER", "4"))
+    max_queue: int = int(os.getenv("RP_MAX_QUEUE", "256"))
+    max_wait: float = float(os.getenv("RP_MAX_QUEUE_WAIT", "10"))
+
+# lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    user: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    weight: int = field(default=1, compare=False)
+
+# ----------- ADMISSION CONTROLLER -----------
+class AdmissionController:
+    # Global in-flight cap + per-user cap in front of the LLM backend. Requests
+    # over capacity wait in a bounded priority queue; beyond that (or after
+    # max_wait) they are rejected with a retry-after hint. A request holding
+    # several sequences (a multi-prompt batch) takes one slot per sequence.
+    def __init__(self, cfg: AdmissionConfig):
+        self.cfg = cfg
+        self.inflight = 0
+        self._per_user: Dict[str, int] = {}
+        self._queued_per_user: Dict[str, int] = {}
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._avg_hold = 1.0
+
+    @asynccontextmanager
+    async def admit(self, user: str, priority: int = PRIORITY_INTERACTIVE, weight: int = 1) -> AsyncIterator[None]:
+        weight = self.clamp(weight)
+        await self.acquire(user, priority, weight)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.perf_counter() - started)
+            self.release(user, weight)
+
+    def clamp(self, weight: int) -> int:
+        # the most slots one request can ever be granted
+        return max(1, min(weight, self.cfg.max_inflight, self.cfg.max_per_user))
+
+    def retry_after(self) -> float:
+        backlog = (len(self._queue) + 1) / max(1, self.cfg.max_inflight)
+        return round(max(1.0, self._avg_hold * backlog), 1)
+
+    async def acquire(self, user: str, priority: int = PRIORITY_INTERACTIVE, weight: int = 1) -> None:
+        if not self._queue and self._runnable(user, weight):
+            self._grant(user, weight)
+            RP_ADMISSION_WAIT.labels(priority=str(priority)).observe(0.0)
+            return
+
+        if len(self._queue) >= self.cfg.max_queue:
+            self._reject("queue_full")
+        if self._queued_per_user.get(user, 0) >= self.cfg.max_per_user:
+            self._reject("user_queue_full")
+
+        waiter = _Waiter(priority, next(self._seq), user, asyncio.get_running_loop().create_future(), weight)
+        bisect.insort(self._queue, waiter)
+        self._queued_per_user[user] = self._queued_per_user.get(user, 0) + 1
+        RP_ADMISSION_QUEUE_DEPTH.set(len(self._queue))
+        self._dispatch()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.cfg.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # slot was granted while we were giving up; hand it back
+                self.release(user, weight)
+            else:
+                waiter.future.cancel()
+                self._dequeue(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("timeout")
+            raise
+        finally:
+            RP_ADMISSION_WAIT.labels(priority=str(priority)).observe(time.perf_counter() - started)
+
+    def release(self, user: str, weight: int = 1) -> None:
+        self.inflight -= weight
+        left = self._per_user.get(user, 0) - weight
+        if left > 0:
+            self._per_user[user] = left
+        else:
+            self._per_user.pop(user, None)
+        RP_ADMISSION_INFLIGHT.set(self.inflight)
+        self._dispatch()
+
+    def _runnable(self, user: str, weight: int = 1) -> bool:
+        return (
+            self.inflight + weight <= self.cfg.max_inflight
+            and self._per_user.get(user, 0) + weight <= self.cfg.max_per_user
+        )
+
+    def _grant(self, user: str, weight: int = 1) -> None:
+        self.inflight += weight
+        self._per_user[user] = self._per_user.get(user, 0) + weight
+        RP_ADMISSION_INFLIGHT.set(self.inflight)
+
+    def _dispatch(self) -> None:
+        # queue is kept sorted by (priority, arrival); skip users at their cap
+        i = 0
+        while i < len(self._queue) and self.inflight < self.cfg.max_inflight:
+            waiter = self._queue[i]
+            if self._runnable(waiter.user, waiter.weight):
+                self._dequeue(waiter)
+                self._grant(waiter.user, waiter.weight)
+                waiter.future.set_result(None)
+            else:
+                i += 1
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        try:
+            self._queue.remove(waiter)
+        except ValueError:
+            return
+        left = self._queued_per_user.get(waiter.user, 0) - 1
+        if left > 0:
+            self._queued_per_user[waiter.user] = left
+        else:
+            self._queued_per_user.pop(waiter.user, None)
+        RP_ADMISSION_QUEUE_DEPTH.set(len(self._queue))
+
+    def _reject(self, reason: str) -> None:
+        RP_ADMISSION_REJECTED.labels(reason=reason).inc()
+        raise AdmissionRejected(f"Server busy ({reason}), retry later", self.retry_after())
@@ -1,15 +1,84 @@
+from app.balancer import Backend, BackendPool, TrackedStream
+from app.cache import LRUCache
+from app.instrumentation import LLMTimer, record_usage
+from app.metrics import RP_DEDUP
 from app.prompts import PromptManager
+from app.templates import ChatTemplate, HistoryRenderer, chat_messages
+from app.tokenizer import PromptEncoder, PromptText, TokenCounter
 from dataclasses import dataclass, field
-from openai import AsyncOpenAI, AsyncStream
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, AsyncStream
 from openai.types.completion import Completion
-from typing import Dict, Literal, Optional, List, Any
+from typing import Callable, Dict, Literal, Optional, List, Any
+import asyncio
+import hashlib
+import httpx
+import json
+import logging
 import os
+import random
+
+log = logging.getLogger(__name__)
 
 # ----------- CONFIGURATION -----------
 @dataclass(frozen=True)
 class ModelConfig:
     base_url: str = os.getenv("VLLM_BASE_URL", "http://0.0.0.0:4001/v1")
+    # comma-separated replicas; overrides base_url when set
+    base_urls: str = os.getenv("VLLM_BASE_URLS", "")
+    # "least_outstanding" or "kv_cache" (also weighs vLLM's KV-cache usage and queue)
+    routing: str = os.getenv("VLLM_ROUTING", "least_outstanding")
+    health_interval: float = float(os.getenv("VLLM_HEALTH_INTERVAL", "5"))
+    sticky_slack: int = int(os.getenv("VLLM_STICKY_SLACK", "4"))
     model_name: str = "TheDrummer/Big-Tiger-Gemma-27B-v1"
+    max_model_len: int = int(os.getenv("VLLM_MAX_MODEL_LEN", "8192"))
+    # HTTP transport
+    max_connections: int = int(os.getenv("VLLM_MAX_CONNECTIONS", "512"))
+    max_keepalive: int = int(os.getenv("VLLM_MAX_KEEPALIVE", "128"))
+    keepalive_expiry: float = float(os.getenv("VLLM_KEEPALIVE_EXPIRY", "30"))
+    # HTTP/2 needs the optional h2 package (pip install httpx[http2])
+    http2: bool = os.getenv("VLLM_HTTP2", "false").lower() in ("1", "true", "yes")
+    connect_timeout: float = float(os.getenv("VLLM_CONNECT_TIMEOUT", "5"))
+    pool_timeout: float = float(os.getenv("VLLM_POOL_TIMEOUT", "10"))
+    # whole-response budget for non-streamed calls
+    read_timeout: float = float(os.getenv("VLLM_READ_TIMEOUT", "120"))
+    # send prompts to vLLM as token ids tokenized here (needs tokenizer.fixed)
+    prompt_token_ids: bool = os.getenv("VLLM_PROMPT_TOKEN_IDS", "false").lower() in ("1", "true", "yes")
+    # max silence between two chunks of a streamed call
+    stream_idle_timeout: float = float(os.getenv("VLLM_STREAM_IDLE_TIMEOUT", "30"))
+    # retries apply to non-streamed calls only
+    max_retries: int = int(os.getenv("VLLM_MAX_RETRIES", "2"))
+    retry_backoff: float = float(os.getenv("VLLM_RETRY_BACKOFF", "0.25"))
+
+@dataclass(frozen=True)
+class CacheConfig:
+    preamble_size: int = int(os.getenv("RP_PREAMBLE_CACHE_SIZE", "256"))
+    preamble_ttl: float = float(os.getenv("RP_PREAMBLE_CACHE_TTL", "600"))
+    token_count_size: int = int(os.getenv("RP_TOKEN_COUNT_CACHE_SIZE", "50000"))
+    # completion_once: share one backend call between concurrent identical requests
+    dedup: bool = os.getenv("RP_DEDUP", "true").lower() in ("1", "true", "yes")
+    # short-lived replies for deterministic (temperature 0) requests; ttl 0 disables
+    response_size: int = int(os.getenv("RP_RESPONSE_CACHE_SIZE", "1024"))
+    response_ttl: float = float(os.getenv("RP_RESPONSE_CACHE_TTL", "30"))
+    # rendered conversation histories kept for incremental prompt builds
+    history_size: int = int(os.getenv("RP_HISTORY_CACHE_SIZE", "1024"))
+    # token ids of stable prompt prefixes (VLLM_PROMPT_TOKEN_IDS)
+    segment_size: int = int(os.getenv("RP_SEGMENT_CACHE_SIZE", "4096"))
+
+@dataclass(frozen=True)
+class PromptConfig:
+    # "legacy": character card before the closing rules (original layout)
+    # "prefix": shared rules first, then the card, then the conversation
+    # "chat": prefix preamble in real alternating turns via the tokenizer's chat template
+    layout: str = os.getenv("RP_PROMPT_LAYOUT", "legacy")
+
+@dataclass(frozen=True)
+class BatchConfig:
+    # "fanout": one request per item, bounded concurrency, results as each finishes
+    # "multi": one multi-prompt request per distinct character
+    mode: str = os.getenv("RP_TWITTER_BATCH_MODE", "fanout")
+    max_items: int = int(os.getenv("RP_TWITTER_BATCH_MAX_ITEMS", "64"))
+    # keep at or below RP_MAX_INFLIGHT_PER_USER so fan-out does not trip admission limits
+    concurrency: int = int(os.getenv("RP_TWITTER_BATCH_CONCURRENCY", "4"))
 
 @dataclass
 class GenDefaults:
@@ -41,99 +110,349 @@ class GenDefaults:
         return kw
 
 # ----------- LLM WRAPPER -----------
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+def build_http_client(cfg: ModelConfig) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=cfg.http2,
+        limits=httpx.Limits(
+            max_connections=cfg.max_connections,
+            max_keepalive_connections=cfg.max_keepalive,
+            keepalive_expiry=cfg.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(cfg.read_timeout, connect=cfg.connect_timeout, pool=cfg.pool_timeout),
+    )
+
+class Reply(str):
+    # Completion text that remembers why generation ended ("length" means it
+    # hit max_tokens) and how many tokens it took, when vLLM reported it.
+    finish_reason: Optional[str] = None
+    completion_tokens: Optional[int] = None
+
+    def __new__(cls, text: str, finish_reason: Optional[str] = None, completion_tokens: Optional[int] = None) -> "Reply":
+        obj = super().__new__(cls, text)
+        obj.finish_reason = finish_reason
+        obj.completion_tokens = completion_tokens
+        return obj
+
+class _Flight:
+    # one shared backend call and the number of callers still waiting on it
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
 class LLMClient:
-    def __init__(self, cfg: ModelConfig):
-        self.client = AsyncOpenAI(base_url=cfg.base_url, api_key="EMPTY")
+    def __init__(
+        self,
+        cfg: ModelConfig,
+        http_client: Optional[httpx.AsyncClient] = None,
+        dedup: bool = True,
+        response_cache: Optional[LRUCache] = None,
+        encoder: Optional[PromptEncoder] = None,
+    ):
+        self.cfg = cfg
+        # token-id prompts need the real tokenizer; the heuristic counter cannot encode
+        self.encoder = encoder if cfg.prompt_token_ids else None
+        if cfg.prompt_token_ids and encoder is None:
+            log.warning("VLLM_PROMPT_TOKEN_IDS is set but no tokenizer is loaded; sending text prompts")
+        urls = [u.strip() for u in cfg.base_urls.split(",") if u.strip()] or [cfg.base_url]
+        backends = [
+            # retries are handled here so streamed calls are never replayed
+            Backend(url, AsyncOpenAI(
+                base_url=url,
+                api_key="EMPTY",
+                http_client=http_client or build_http_client(cfg),
+                max_retries=0,
+            ))
+            for url in urls
+        ]
+        self.pool = BackendPool(backends, cfg.routing, cfg.sticky_slack)
         self.model = cfg.model_name
-
-    async def stream_completion(self, prompt: str, **kwargs) -> AsyncStream[Completion]:
-        return await self.client.completions.create(
-            model=self.model, prompt=prompt, stream=True, **kwargs
+        self._stream_timeout = httpx.Timeout(
+            cfg.stream_idle_timeout, connect=cfg.connect_timeout, pool=cfg.pool_timeout
         )
+        self.dedup = dedup
+        self.response_cache = response_cache
+        self._inflight: Dict[str, _Flight] = {}
+
+    async def start(self) -> None:
+        if len(self.pool.backends) > 1:
+            self.pool.start_health_checks(self.cfg.health_interval, self.cfg.connect_timeout)
+
+    def _mark_down(self, backend: Backend, e: Exception) -> None:
+        # health checks bring it back; with a single backend there is nothing to fail over to.
+        # A timeout only means slow (or our own pool full), not down: taking it out
+        # under load would push everything onto the other replicas.
+        if isinstance(e, APIConnectionError) and not isinstance(e, APITimeoutError) and len(self.pool.backends) > 1:
+            backend.healthy = False
+
+    def encode_prompt(self, prompt: Any) -> Any:
+        # Text prompts become [BOS] + token ids, so vLLM skips tokenizing them;
+        # the text carries no BOS of its own (vLLM adds one to text prompts).
+        if self.encoder is None:
+            return prompt
+        if isinstance(prompt, list):
+            return [self.encode_prompt(p) for p in prompt]
+        if not isinstance(prompt, str):
+            return prompt
+        return self.encoder.encode(prompt)
+
+    async def stream_completion(self, prompt: str, affinity: Optional[str] = None, **kwargs) -> TrackedStream:
+        # Fail over only until the stream is established; a started stream stays on its backend.
+        last_error: Optional[Exception] = None
+        prompt = self.encode_prompt(prompt)
+        for backend in self.pool.candidates(affinity):
+            backend.outstanding += 1
+            try:
+                with LLMTimer("stream"):
+                    stream = await backend.client.completions.create(
+                        model=self.model, prompt=prompt, stream=True, timeout=self._stream_timeout,
+                        # final chunk carries prompt/completion token counts
+                        stream_options={"include_usage": True}, **kwargs
+                    )
+            except (APIConnectionError, APIStatusError) as e:
+                backend.outstanding -= 1
+                if not self._retryable(e):
+                    raise
+                self._mark_down(backend, e)
+                last_error = e
+                continue
+            return TrackedStream(stream, lambda b=backend: setattr(b, "outstanding", b.outstanding - 1))
+        raise last_error
+
+    async def _create(self, call: str, prompt: Any, affinity: Optional[str], **kwargs) -> Completion:
+        # non-streamed calls are idempotent, so they may be retried (on another replica)
+        attempt = 0
+        prompt = self.encode_prompt(prompt)
+        while True:
+            backend = self.pool.candidates(affinity)[0]
+            backend.outstanding += 1
+            try:
+                with LLMTimer(call):
+                    resp = await backend.client.completions.create(
+                        model=self.model, prompt=prompt, **kwargs
+                    )
+                record_usage(call, resp.usage)
+                return resp
+            except (APIConnectionError, APIStatusError) as e:
+                if attempt >= self.cfg.max_retries or not self._retryable(e):
+                    raise
+                self._mark_down(backend, e)
+                # full jitter: spread retries of a burst instead of synchronizing them
+                await asyncio.sleep(random.uniform(0, self.cfg.retry_backoff * 2 ** attempt))
+                attempt += 1
+            finally:
+                backend.outstanding -= 1
+
+    async def _complete_text(self, prompt: str, affinity: Optional[str], **kwargs) -> str:
+        resp = await self._create("once", prompt, affinity, **kwargs)
+        choice = resp.choices[0]
+        tokens = resp.usage.completion_tokens if resp.usage is not None else None
+        return Reply((choice.text or "").strip(), choice.finish_reason, tokens)
+
+    @staticmethod
+    def request_key(prompt: Any, kwargs: Dict[str, Any]) -> str:
+        # affinity only picks a replica, so it is not part of the key
+        blob = json.dumps({"prompt": prompt, **kwargs}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    async def _single_flight(self, key: str, prompt: str, affinity: Optional[str], kwargs: Dict[str, Any]) -> str:
+        flight = self._inflight.get(key)
+        if flight is None:
+            RP_DEDUP.labels(result="miss").inc()
+            flight = _Flight(asyncio.create_task(self._complete_text(prompt, affinity, **kwargs)))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(
+                lambda _, f=flight: self._inflight.pop(key) if self._inflight.get(key) is f else None
+            )
+        else:
+            RP_DEDUP.labels(result="coalesced").inc()
+        flight.waiters += 1
+        try:
+            # shielded so one caller's cancellation does not fail the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # nobody is left waiting: abort the backend request
+                flight.task.cancel()
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+
+    async def completion_once(self, prompt: str, affinity: Optional[str] = None, **kwargs) -> str:
+        cacheable = self.response_cache is not None and kwargs.get("temperature") == 0
+        if not (self.dedup or cacheable):
+            return await self._complete_text(prompt, affinity, **kwargs)
+
+        key = self.request_key(prompt, kwargs)
+        if cacheable:
+            text = self.response_cache.get(key)
+            if text is not None:
+                RP_DEDUP.labels(result="cached").inc()
+                return text
+        if self.dedup:
+            text = await self._single_flight(key, prompt, affinity, kwargs)
+        else:
+            text = await self._complete_text(prompt, affinity, **kwargs)
+        if cacheable:
+            self.response_cache.set(key, text)
+        return text
+
+    async def completion_batch(self, prompts: List[str], affinity: Optional[str] = None, **kwargs) -> List[str]:
+        # one completions request with a prompt list; choices come back tagged with their prompt index
+        resp = await self._create("batch", prompts, affinity, **kwargs)
+        texts = [""] * len(prompts)
+        for choice in resp.choices:
+            # usage covers the whole request, so per-reply lengths are unknown
+            texts[choice.index] = Reply((choice.text or "").strip(), choice.finish_reason)
+        return texts
+
+    @staticmethod
+    def _retryable(e: Exception) -> bool:
+        if isinstance(e, APIStatusError):
+            return e.status_code in RETRYABLE_STATUS
+        # a timeout already spent the whole read (or pool) timeout; retrying
+        # would hold the caller and its admission slot for several more
+        return isinstance(e, APIConnectionError) and not isinstance(e, APITimeoutError)
+
+    async def aclose(self) -> None:
+        await self.pool.stop_health_checks()
+        for backend in self.pool.backends:
+            await backend.client.close()
+
+
+# ----------- CHARACTER -----------
+def character_fields(character: Dict) -> Dict[str, Any]:
+    return {
+        "name": character.get("name") or "",
+        "description": character.get("description") or "",
+        "personality": character.get("personality") or "",
+        "speaking_style": character.get("speakingStyle") or character.get("speaking_style") or "",
+        "samples": list(character.get("samples") or []),
+    }
+
+def character_key(character: Dict) -> str:
+    blob = json.dumps(character_fields(character), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
 
-    async def completion_once(self, prompt: str, **kwargs) -> str:
-        resp = await self.client.completions.create(
-            model=self.model, prompt=prompt, **kwargs
-        )
-        return (resp.choices[0].text or "").strip()
-    
 # ----------- PROMPT BUILDER -----------
+# marks where the variable part of a prompt starts
+_CUT = "\x00"
+
 class RPFormatter:
-    def __init__(self, prompt_manager: PromptManager):
+    LAYOUTS = ("legacy", "prefix", "chat")
+    # slack for tokenizer merges across separately counted segments
+    CONTEXT_MARGIN = 32
+
+    def __init__(
+        self,
+        prompt_manager: PromptManager,
+        cache: Optional[LRUCache] = None,
+        layout: str = "legacy",
+        counter: Optional[TokenCounter] = None,
+        context_len: int = 8192,
+        history: Optional[HistoryRenderer] = None,
+        chat: Optional[ChatTemplate] = None,
+    ):
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown prompt layout: {layout!r}")
         self.pm = prompt_manager
+        self.cache = cache if cache is not None else LRUCache(name="preamble")
+        self.layout = layout
+        self.counter = counter
+        self.context_len = context_len
+        self._scaffold_tokens: Optional[int] = None
+        self.history = history or HistoryRenderer(self.pm.turn_block)
+        self.chat = chat if chat is not None or layout != "chat" else ChatTemplate()
 
-    def _preamble(self, character: Dict) -> str:
-        name = character.get("name", "")
-        description = character.get("description", "")
-        personality = character.get("personality", "")
-        speaking_style = character.get("speakingStyle") or character.get("speaking_style") or ""
-        samples = character.get("samples", []) or []
-        card = self.pm.generate_character_prompt(
-            name=name,
-            description=description,
-            personality=personality,
-            speakingStyle=speaking_style,
-            samples=samples,
+    def _card(self, character: Dict) -> str:
+        f = character_fields(character)
+        return self.pm.generate_character_prompt(
+            name=f["name"],
+            description=f["description"],
+            personality=f["personality"],
+            speakingStyle=f["speaking_style"],
+            samples=f["samples"],
         )
-        return self.pm.build_preamble(card)
-
-    def build_twitter_prompt(self, character: Dict, previous_mentions: str) -> str:
-        name = character.get("name", "")
-        description = character.get("description", "")
-        personality = character.get("personality", "")
-        speaking_style = character.get("speakingStyle") or character.get("speaking_style") or ""
-        samples = character.get("samples", []) or []
-
-        card = self.pm.generate_character_prompt(
-            name=name,
-            description=description,
-            personality=personality,
-            speakingStyle=speaking_style,
-            samples=samples,
+
+    # `key` is character_key(character) when the caller already has it; hashing
+    # the card is the costly part of a preamble cache hit
+    def _cached_preamble(self, kind: str, character: Dict, build: Callable[[str], str], key: Optional[str] = None) -> str:
+        return self.cache.get_or_set(
+            (kind, self.layout, key or character_key(character)),
+            lambda: build(self._card(character)),
         )
 
-        pre = self.pm.build_twitter_preamble(card)
-        mentions = (previous_mentions or "").strip()
+    def _preamble(self, character: Dict, key: Optional[str] = None) -> str:
+        build = self.pm.build_preamble if self.layout == "legacy" else self.pm.build_prefix_preamble
+        return self._cached_preamble("manual", character, build, key)
 
-        return (
-            "<start_of_turn>user\n"
-            f"{pre}\n\n"
-            "## Previous Mentions\n"
-            f"{mentions}\n"
-            "## Reply\n"
-            "Compose your in-character reply to the latest mention only.\n"
-            "<end_of_turn>\n"
-            "<start_of_turn>model\n"
-        )
+    def _twitter_preamble(self, character: Dict, key: Optional[str] = None) -> str:
+        build = self.pm.build_twitter_preamble if self.layout == "legacy" else self.pm.build_twitter_prefix_preamble
+        return self._cached_preamble("twitter", character, build, key)
+
+    def build_twitter_prompt(self, character: Dict, previous_mentions: str, key: Optional[str] = None) -> str:
+        pre = self._twitter_preamble(character, key)
+        mentions = (previous_mentions or "").strip()
+        if self.layout == "chat":
+            body = self.pm.TWITTER_BODY_TEMPLATE.format(preamble=pre, mentions=mentions)
+            return self._segmented(self.chat.render([{"role": "user", "content": body}]), pre)
+        return self._segmented(self.pm.TWITTER_TEMPLATE.format(preamble=pre, mentions=mentions), pre)
 
     @staticmethod
-    def _render_turns(hist: List[Dict[str, str]]) -> str:
+    def _segmented(prompt: str, pre: str) -> PromptText:
+        # everything through the preamble is shared by all prompts of the character
+        start = prompt.find(pre)
+        return PromptText(prompt, start + len(pre) if start >= 0 else 0)
+
+    def _render_turns(self, hist: List[Dict[str, str]]) -> str:
         # hist already sanitized to alternate, end with assistant
-        blocks = []
-        for m in hist:
-            role = (m.get("role") or "").lower()
-            content = (m.get("content") or "").strip()
-            if role in ("user", "assistant") and content:
-                blocks.append(f"<start_of_turn>{role}\n{content}\n<end_of_turn>")
-        return "\n".join(blocks)
-
-    def build_manual_prompt(self, character: Dict, history: List[Dict[str, str]], user_input: str) -> str:
-        pre = self._preamble(character)
-        hist_txt = self._render_turns(history)
+        return self.history.render(hist)
+
+    def _manual_layout(self, pre: str, hist_txt: str, ui: str) -> str:
+        return self.pm.MANUAL_TEMPLATE.format(preamble=pre, history=hist_txt, user_input=ui)
+
+    def _chat_layout(self, pre: str, history: List[Dict[str, str]], ui: str) -> str:
+        return self.chat.render(chat_messages(pre, history, ui))
+
+    def build_manual_prompt(
+        self, character: Dict, history: List[Dict[str, str]], user_input: str, key: Optional[str] = None
+    ) -> str:
+        pre = self._preamble(character, key)
         ui = (user_input or "").strip()
-        return (
-            "<start_of_turn>user\n"
-            f"{pre}\n\n"
-            "## Conversation So Far\n"
-            f"{hist_txt}\n"
-            "## Conversation Continues\n"
-            f"{ui}\n"
-            "<end_of_turn>\n"
-            "<start_of_turn>model\n"
-        )
+        if self.layout == "chat":
+            return self._segmented(self._chat_layout(pre, history, ui), pre)
+        hist_txt = self._render_turns(history)
+        return self._segmented(self._manual_layout(pre, hist_txt, ui), pre)
+
+    def warmup_prompt(self, character: Dict, kind: str = "manual", key: Optional[str] = None) -> str:
+        # the prefix every prompt of this kind for the character starts with
+        if kind == "twitter":
+            prompt = self.build_twitter_prompt(character, _CUT, key)
+        elif self.layout == "chat":
+            prompt = self._chat_layout(self._preamble(character, key), [], _CUT)
+        else:
+            prompt = self._manual_layout(self._preamble(character, key), _CUT, "")
+        return prompt[:prompt.index(_CUT)]
+
+    def fit_history(
+        self, character: Dict, history: List[Dict[str, str]], user_input: str, max_tokens: int, key: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        # Drop the oldest pairs until preamble + history + input + completion fit the context window.
+        if self.counter is None:
+            return history
+        count = self.counter.count
+        if self._scaffold_tokens is None:
+            scaffold = self._chat_layout("", [], "") if self.layout == "chat" else self._manual_layout("", "", "")
+            self._scaffold_tokens = count(scaffold)
+        fixed = self._scaffold_tokens + count(self._preamble(character, key)) + count((user_input or "").strip())
+        budget = self.context_len - max_tokens - self.CONTEXT_MARGIN
+        return truncate_history(history, fixed, budget, count)
 
 # ----------- HISTORY SANITIZER -----------
-def sanitize_history(raw_hist: Optional[List[Dict[str, str]]], max_pairs: int = 10) -> List[Dict[str, str]]:
+def sanitize_history(raw_hist: Optional[List[Dict[str, str]]], max_pairs: Optional[int] = None) -> List[Dict[str, str]]:
     clean = []
     for m in (raw_hist or []):
         role = (m.get("role") or "").lower()
@@ -155,8 +474,25 @@ def sanitize_history(raw_hist: Optional[List[Dict[str, str]]], max_pairs: int =
     if out and out[-1]["role"] != "assistant":
         out = out[:-1]
 
-    # keep only last N pairs
-    if len(out) > 2 * max_pairs:
+    # optional hard cap on pairs; the token budget is enforced by truncate_history
+    if max_pairs is not None and len(out) > 2 * max_pairs:
         out = out[-2 * max_pairs :]
 
     return out
+
+# "<start_of_turn>role\n" + "\n<end_of_turn>" + joining newline
+TURN_OVERHEAD_TOKENS = 6
+
+def truncate_history(
+    history: List[Dict[str, str]], fixed_tokens: int, budget: int, count: Callable[[str], int]
+) -> List[Dict[str, str]]:
+    # history is sanitized (user/assistant pairs); drop whole pairs from the front
+    costs = [count(m["content"]) + TURN_OVERHEAD_TOKENS for m in history]
+    total = fixed_tokens + sum(costs)
+    start = 0
+    while total > budget and start < len(history):
+        total -= sum(costs[start : start + 2])
+        start += 2
+    if total > budget:
+        raise ValueError(f"Prompt needs {total} tokens but only {budget} fit in the context window")
+    return history[start:]
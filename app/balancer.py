@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+# ----------- BACKENDS -----------
+@dataclass(eq=False)
+class Backend:
+    url: str
+    client: AsyncOpenAI
+    outstanding: int = 0
+    healthy: bool = True
+    # scraped from vLLM's /metrics when routing is KV-cache aware
+    kv_cache_usage: float = 0.0
+    waiting: int = 0
+    root: str = field(init=False)
+
+    def __post_init__(self):
+        self.root = re.sub(r"/v1/?$", "", self.url.rstrip("/"))
+
+_GAUGE = r"^{name}(?:\{{[^}}]*\}})?\s+([0-9.eE+-]+)$"
+_KV_USAGE = re.compile(_GAUGE.format(name=r"vllm:(?:gpu_cache_usage_perc|kv_cache_usage_perc)"), re.M)
+_WAITING = re.compile(_GAUGE.format(name=r"vllm:num_requests_waiting"), re.M)
+
+class BackendPool:
+    POLICIES = ("least_outstanding", "kv_cache")
+
+    def __init__(self, backends: List[Backend], policy: str = "least_outstanding", sticky_slack: int = 4):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown routing policy: {policy!r}")
+        self.backends = backends
+        self.policy = policy
+        # a sticky backend is kept until it is this much busier than the least loaded one
+        self.sticky_slack = sticky_slack
+        self._health_task: Optional[asyncio.Task] = None
+
+    def load(self, b: Backend) -> float:
+        if self.policy == "kv_cache":
+            return b.outstanding + b.waiting + b.kv_cache_usage * self.sticky_slack
+        return b.outstanding
+
+    def _affinity_order(self, affinity: str, backends: List[Backend]) -> List[Backend]:
+        # rendezvous hashing: stable owner per key, minimal reshuffle when a backend leaves
+        score = lambda b: hashlib.blake2b(f"{affinity}|{b.url}".encode(), digest_size=8).digest()
+        return sorted(backends, key=score, reverse=True)
+
+    def candidates(self, affinity: Optional[str] = None) -> List[Backend]:
+        # preferred backend first, then the rest by load as failover targets
+        healthy = [b for b in self.backends if b.healthy] or list(self.backends)
+        by_load = sorted(healthy, key=self.load)
+        if affinity is None:
+            first = by_load[0]
+        else:
+            first = self._affinity_order(affinity, healthy)[0]
+            if self.load(first) > self.load(by_load[0]) + self.sticky_slack:
+                first = by_load[0]
+        rest = [b for b in by_load if b is not first]
+        rest += [b for b in self.backends if b not in healthy]
+        return [first] + rest
+
+    # ---------- health ----------
+    async def check(self, b: Backend, http: httpx.AsyncClient) -> None:
+        try:
+            resp = await http.get(f"{b.root}/health")
+            b.healthy = resp.status_code == 200
+            if b.healthy and self.policy == "kv_cache":
+                text = (await http.get(f"{b.root}/metrics")).text
+                usage, waiting = _KV_USAGE.search(text), _WAITING.search(text)
+                b.kv_cache_usage = float(usage.group(1)) if usage else 0.0
+                b.waiting = int(float(waiting.group(1))) if waiting else 0
+        except httpx.HTTPError:
+            b.healthy = False
+
+    async def _health_loop(self, interval: float, timeout: float) -> None:
+        async with httpx.AsyncClient(timeout=timeout) as http:
+            while True:
+                await asyncio.gather(*(self.check(b, http) for b in self.backends))
+                await asyncio.sleep(interval)
+
+    def start_health_checks(self, interval: float, timeout: float = 2.0) -> None:
+        if self._health_task is None and interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop(interval, timeout))
+
+    async def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+# ----------- STREAM TRACKING -----------
+class TrackedStream:
+    # Wraps an AsyncStream so the backend's outstanding count drops exactly once,
+    # whether the stream is exhausted, fails, or is closed early.
+    def __init__(self, stream: Any, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def _done(self) -> None:
+        if not self._released:
+            self._released = True
+            self._release()
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._iter()
+
+    async def _iter(self) -> AsyncIterator[Any]:
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            self._done()
+
+    async def close(self) -> None:
+        try:
+            await self._stream.close()
+        finally:
+            self._done()
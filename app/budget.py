@@ -0,0 +1,99 @@
+import math
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+from app.ai import GenDefaults
+from app.cache import LRUCache
+from app.metrics import RP_MAX_TOKENS, RP_TRUNCATED_REPLIES
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class BudgetConfig:
+    # max_tokens ceiling per endpoint profile; vLLM reserves KV-cache for the
+    # whole budget, so oversized ceilings cost batch concurrency
+    start_tokens: int = int(os.getenv("RP_MAX_TOKENS_START", "512"))
+    once_tokens: int = int(os.getenv("RP_MAX_TOKENS_ONCE", "512"))
+    twitter_tokens: int = int(os.getenv("RP_MAX_TOKENS_TWITTER", "192"))
+    # learn per-character budgets below the ceiling from observed reply lengths
+    learn: bool = os.getenv("RP_MAX_TOKENS_LEARN", "false").lower() in ("1", "true", "yes")
+    percentile: float = float(os.getenv("RP_MAX_TOKENS_PERCENTILE", "0.95"))
+    headroom: float = float(os.getenv("RP_MAX_TOKENS_HEADROOM", "1.25"))
+    min_tokens: int = int(os.getenv("RP_MAX_TOKENS_MIN", "64"))
+    min_samples: int = int(os.getenv("RP_MAX_TOKENS_MIN_SAMPLES", "20"))
+    window: int = int(os.getenv("RP_MAX_TOKENS_WINDOW", "200"))
+    max_characters: int = int(os.getenv("RP_MAX_TOKENS_CHARACTERS", "4096"))
+
+# event -> profile; rp_room_start generates the same kind of reply as rp_start
+PROFILES = {
+    "rp_start": "start",
+    "rp_room_start": "start",
+    "rp_once": "once",
+    "rp_twitter": "twitter",
+    "rp_twitter_batch": "twitter",
+}
+
+class _Lengths:
+    # recent completion lengths for one (profile, character) and the budget derived from them
+    __slots__ = ("samples", "budget")
+
+    def __init__(self, window: int):
+        self.samples: Deque[int] = deque(maxlen=max(1, window))
+        self.budget: Optional[int] = None
+
+# ----------- TOKEN BUDGET -----------
+class TokenBudget:
+    # Hands out generation kwargs per endpoint. With learning on, a character
+    # with enough history gets max_tokens = percentile(length) * headroom,
+    # clamped to [min_tokens, ceiling]. A reply cut by its budget (vLLM's
+    # finish_reason "length") is recorded at the ceiling, so truncation
+    # pushes the budget back up.
+    def __init__(self, defaults: GenDefaults, cfg: Optional[BudgetConfig] = None):
+        self.defaults = defaults
+        self.cfg = cfg or BudgetConfig()
+        self._ceilings = {
+            "start": self.cfg.start_tokens,
+            "once": self.cfg.once_tokens,
+            "twitter": self.cfg.twitter_tokens,
+        }
+        self._lengths = LRUCache(self.cfg.max_characters, name="max_tokens")
+
+    def ceiling(self, event: str) -> int:
+        return self._ceilings.get(PROFILES.get(event, ""), self.defaults.max_tokens)
+
+    def max_tokens(self, event: str, character_key: Optional[str] = None) -> int:
+        ceiling = self.ceiling(event)
+        if not self.cfg.learn or character_key is None:
+            return ceiling
+        lengths = self._lengths.get((PROFILES.get(event, event), character_key))
+        if lengths is None or lengths.budget is None:
+            return ceiling
+        return min(ceiling, lengths.budget)
+
+    def kwargs(self, event: str, character_key: Optional[str] = None) -> Dict[str, Any]:
+        max_tokens = self.max_tokens(event, character_key)
+        RP_MAX_TOKENS.labels(event=event).observe(max_tokens)
+        return {**self.defaults.as_kwargs(), "max_tokens": max_tokens}
+
+    def observe(
+        self, event: str, character_key: str, tokens: int, max_tokens: int, truncated: Optional[bool] = None,
+    ) -> None:
+        if truncated is None:
+            # no finish_reason to go by
+            truncated = tokens >= max_tokens
+        if truncated:
+            RP_TRUNCATED_REPLIES.labels(event=event).inc()
+        if not self.cfg.learn:
+            return
+        key = (PROFILES.get(event, event), character_key)
+        lengths = self._lengths.get(key)
+        if lengths is None:
+            lengths = _Lengths(self.cfg.window)
+            self._lengths.set(key, lengths)
+        # the true length of a truncated reply is unknown: count it as the ceiling
+        lengths.samples.append(self.ceiling(event) if truncated else tokens)
+        if len(lengths.samples) >= self.cfg.min_samples:
+            ordered = sorted(lengths.samples)
+            p = ordered[min(len(ordered) - 1, int(self.cfg.percentile * len(ordered)))]
+            lengths.budget = max(self.cfg.min_tokens, math.ceil(p * self.cfg.headroom))
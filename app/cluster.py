@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+log = logging.getLogger(__name__)
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class ClusterConfig:
+    # pub/sub backend shared by all workers; empty = single process
+    redis_url: str = os.getenv("RP_REDIS_URL", "")
+    channel: str = os.getenv("RP_SIO_CHANNEL", "rp-socketio")
+    # uvicorn's own worker-count variable, used only to warn about a missing backend
+    workers: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# ----------- CLIENT MANAGERS -----------
+class LocalFirstMixin:
+    # A pub/sub manager publishes every emit so other workers can deliver it.
+    # Sockets are pinned to one worker, so an emit to a sid this worker owns
+    # (every rp_token frame) is delivered directly, skipping the broker.
+    async def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        target = to or room
+        if target is not None and callback is None and self.is_connected(target, namespace or "/"):
+            return await socketio.AsyncManager.emit(
+                self, event, data, namespace or "/", room=target, skip_sid=skip_sid, **kwargs
+            )
+        return await super().emit(
+            event, data, namespace=namespace, room=room, skip_sid=skip_sid, callback=callback, to=to, **kwargs
+        )
+
+class LocalFirstRedisManager(LocalFirstMixin, socketio.AsyncRedisManager):
+    pass
+
+class InProcessBus:
+    # Stand-in for the Redis channel: fans messages out to every manager
+    # subscribed in this process (tests, single-process multi-server setups).
+    def __init__(self):
+        self._queues: List[asyncio.Queue] = []
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._queues.append(queue)
+        return queue
+
+    def publish(self, message: Any) -> None:
+        for queue in self._queues:
+            queue.put_nowait(message)
+
+class InProcessManager(LocalFirstMixin, AsyncPubSubManager):
+    name = "inprocess"
+
+    def __init__(self, bus: InProcessBus, channel: str = "socketio", write_only: bool = False):
+        super().__init__(channel=channel, write_only=write_only)
+        self.bus = bus
+        self._queue = bus.subscribe()
+
+    async def _publish(self, data: Any) -> None:
+        self.bus.publish(data)
+
+    async def _listen(self) -> AsyncIterator[Any]:
+        while True:
+            yield await self._queue.get()
+
+def create_client_manager(cfg: ClusterConfig) -> Optional[socketio.AsyncManager]:
+    if cfg.redis_url:
+        # needs the optional redis package (pip install redis)
+        return LocalFirstRedisManager(cfg.redis_url, channel=cfg.channel)
+    if cfg.workers > 1:
+        log.warning(
+            "WEB_CONCURRENCY=%d without RP_REDIS_URL: emits only reach sockets on the same worker "
+            "and conversations are not shared", cfg.workers,
+        )
+    return None
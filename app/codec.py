@@ -0,0 +1,60 @@
+import json
+from typing import Any
+
+try:  # optional: pip install orjson
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# ----------- JSON CODECS -----------
+_COMPACT = (",", ":")
+
+class OrjsonCodec:
+    # The json-module subset python-socketio/engineio call (dumps with compact
+    # separators, loads). orjson output is always compact; anything it cannot
+    # honour (other separators, indent, ...) or encode goes to the json module.
+    @staticmethod
+    def dumps(obj: Any, *args, default: Any = None, separators: Any = None, sort_keys: bool = False, **kwargs) -> str:
+        if args or kwargs or (separators is not None and tuple(separators) != _COMPACT):
+            return json.dumps(obj, *args, default=default, separators=separators, sort_keys=sort_keys, **kwargs)
+        # int/float/bool/None dict keys become strings, as with json
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode("utf-8")
+        except TypeError:
+            # e.g. integers beyond 64 bits
+            return json.dumps(obj, default=default, separators=_COMPACT, sort_keys=sort_keys, ensure_ascii=False)
+
+    @staticmethod
+    def loads(s: str | bytes, *args, **kwargs) -> Any:
+        return orjson.loads(s)
+
+def json_codec(name: str = "auto") -> Any:
+    # "auto": orjson when installed, else the stdlib json module
+    if name == "stdlib" or (name == "auto" and orjson is None):
+        return json
+    if name in ("auto", "orjson"):
+        if orjson is None:
+            raise RuntimeError("RP_JSON_CODEC=orjson but orjson is not installed")
+        return OrjsonCodec
+    raise ValueError(f"Unknown JSON codec: {name!r}")
+
+# ----------- PACKET TEMPLATES -----------
+SIO_EVENT = "2"  # Socket.IO EVENT packet type; engineio adds the MESSAGE prefix
+
+class EventTemplate:
+    # Pre-encoded Socket.IO EVENT packet for the default namespace:
+    #   2["<event>",{<fixed fields>,"<field>":<value>}]
+    # Only the per-emit value is serialized.
+    __slots__ = ("_codec", "_head")
+
+    def __init__(self, codec: Any, event: str, fixed: dict, field: str):
+        self._codec = codec
+        body = codec.dumps(fixed, separators=(",", ":"))
+        sep = "," if fixed else ""
+        self._head = (
+            SIO_EVENT + "[" + codec.dumps(event) + "," + body[:-1] + sep + codec.dumps(field) + ":"
+        )
+
+    def encode(self, value: Any) -> str:
+        return self._head + self._codec.dumps(value) + "}]"
@@ -1,16 +1,17 @@
-from transformers import PreTrainedTokenizerFast
 import os
 
 SRC = os.getenv("TOKENIZER_SRC", "/workspace/app/tokenizer.json")
 DST_DIR = os.getenv("TOKENIZER_OUT_DIR", "/tokenizer")
 DST = os.path.join(DST_DIR, "tokenizer.fixed")
 
+# Also the server's fallback for RP_PROMPT_LAYOUT=chat (see app/templates.py),
+# so this module must stay importable without transformers.
 CHAT_TEMPLATE = r"""{{- bos_token -}}
 {%- if messages[0]["role"] == "system" -%}
   {{- raise_exception("System role not supported") -}}
 {%- endif -%}
 {%- for message in messages -%}
-  {%- if message["role"] == "user" != (loop.index0 % 2 == 0) -%}
+  {%- if (message["role"] == "user") != (loop.index0 % 2 == 0) -%}
     {{- raise_exception("Conversation roles must alternate user/assistant/user/assistant/...") -}}
   {%- endif -%}
   {%- if message["role"] == "assistant" -%}
@@ -25,26 +26,33 @@ CHAT_TEMPLATE = r"""{{- bos_token -}}
 {%- endif -%}
 """
 
-tok = PreTrainedTokenizerFast(tokenizer_file=SRC)
-
-# additional specials
-need = ["<start_of_turn>", "<end_of_turn>"]
-existing = set(tok.get_vocab().keys())
-to_add = [t for t in need if t not in existing]
-if to_add:
-    tok.add_special_tokens({"additional_special_tokens": to_add})
-
-# core specials
-if tok.bos_token is None: tok.add_special_tokens({"bos_token": "<bos>"})
-if tok.eos_token is None: tok.add_special_tokens({"eos_token": "<eos>"})
-if tok.unk_token is None: tok.add_special_tokens({"unk_token": "<unk>"})
-if tok.pad_token is None:
-    if "<pad>" in tok.get_vocab(): tok.add_special_tokens({"pad_token": "<pad>"})
-    else: tok.pad_token = tok.eos_token
-
-# Attach template and save
-tok.chat_template = CHAT_TEMPLATE
-os.makedirs(DST_DIR, exist_ok=True)
-tok.save_pretrained(DST)
-print("Tokenizer src:", SRC)
-print("Tokenizer path:", DST)
\ No newline at end of file
+def main() -> None:
+    # transformers is heavy; only the build step needs it
+    from transformers import PreTrainedTokenizerFast
+
+    tok = PreTrainedTokenizerFast(tokenizer_file=SRC)
+
+    # additional specials
+    need = ["<start_of_turn>", "<end_of_turn>"]
+    existing = set(tok.get_vocab().keys())
+    to_add = [t for t in need if t not in existing]
+    if to_add:
+        tok.add_special_tokens({"additional_special_tokens": to_add})
+
+    # core specials
+    if tok.bos_token is None: tok.add_special_tokens({"bos_token": "<bos>"})
+    if tok.eos_token is None: tok.add_special_tokens({"eos_token": "<eos>"})
+    if tok.unk_token is None: tok.add_special_tokens({"unk_token": "<unk>"})
+    if tok.pad_token is None:
+        if "<pad>" in tok.get_vocab(): tok.add_special_tokens({"pad_token": "<pad>"})
+        else: tok.pad_token = tok.eos_token
+
+    # Attach template and save
+    tok.chat_template = CHAT_TEMPLATE
+    os.makedirs(DST_DIR, exist_ok=True)
+    tok.save_pretrained(DST)
+    print("Tokenizer src:", SRC)
+    print("Tokenizer path:", DST)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import time
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from app.metrics import (
+    RP_ACTIVE_STREAMS,
+    RP_COMPLETION_TOKENS,
+    RP_INTER_TOKEN,
+    RP_LLM_ERRORS,
+    RP_LLM_LATENCY,
+    RP_PROMPT_TOKENS,
+    RP_REQUEST_ERRORS,
+    RP_REQUEST_LATENCY,
+    RP_TTFT,
+)
+
+def error_type(e: BaseException) -> str:
+    return type(e).__name__
+
+def record_error(event: str, e: BaseException) -> None:
+    RP_REQUEST_ERRORS.labels(event=event, type=error_type(e)).inc()
+
+def record_usage(call: str, usage: Any) -> None:
+    if usage is None:
+        return
+    RP_PROMPT_TOKENS.labels(call=call).inc(usage.prompt_tokens or 0)
+    RP_COMPLETION_TOKENS.labels(call=call).inc(usage.completion_tokens or 0)
+
+# ----------- HANDLERS -----------
+def timed(event: str) -> Callable:
+    # wall time of a Socket.IO handler, whatever way it ends
+    hist = RP_REQUEST_LATENCY.labels(event=event)
+
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        async def wrapper(*args, **kwargs) -> Any:
+            t0 = time.perf_counter()
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+class LLMTimer:
+    # times one completion call and counts its failures by exception type
+    __slots__ = ("call", "t0")
+
+    def __init__(self, call: str):
+        self.call = call
+
+    def __enter__(self) -> "LLMTimer":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            RP_LLM_ERRORS.labels(call=self.call, type=error_type(exc)).inc()
+        else:
+            RP_LLM_LATENCY.labels(call=self.call).observe(time.perf_counter() - self.t0)
+
+# ----------- STREAMS -----------
+class StreamStats:
+    # Per-stream token timing. token() only stores timestamps; histograms are
+    # observed once when the stream ends, so the token path stays cheap.
+    __slots__ = ("event", "start", "first", "last", "chunks", "usage")
+
+    def __init__(self, event: str):
+        self.event = event
+        self.start = 0.0
+        self.first: Optional[float] = None
+        self.last = 0.0
+        self.chunks = 0
+        self.usage: Any = None
+
+    def __enter__(self) -> "StreamStats":
+        RP_ACTIVE_STREAMS.inc()
+        self.start = time.perf_counter()
+        return self
+
+    def token(self) -> None:
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.chunks += 1
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        RP_ACTIVE_STREAMS.dec()
+        if self.first is not None:
+            RP_TTFT.labels(event=self.event).observe(self.first - self.start)
+        if self.chunks > 1:
+            RP_INTER_TOKEN.labels(event=self.event).observe((self.last - self.first) / (self.chunks - 1))
+        if self.usage is not None:
+            record_usage("stream", self.usage)
+        else:
+            # cancelled or usage not reported: one chunk is one token on vLLM
+            RP_COMPLETION_TOKENS.labels(call="stream").inc(self.chunks)
@@ -0,0 +1,146 @@
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app.codec import json_codec
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class LogConfig:
+    level: str = os.getenv("RP_LOG_LEVEL", "INFO")
+    # python-socketio / engineio log every packet at INFO; keep them quiet by default
+    sio_level: str = os.getenv("RP_SIO_LOG_LEVEL", "WARNING")
+    # "json" (one object per line) or "text"
+    format: str = os.getenv("RP_LOG_FORMAT", "json")
+    # fraction of streamed tokens logged at DEBUG
+    token_sample: float = float(os.getenv("RP_LOG_TOKEN_SAMPLE", "0.01"))
+    # records beyond this are dropped rather than blocking the event loop
+    queue_size: int = int(os.getenv("RP_LOG_QUEUE_SIZE", "10000"))
+
+# ----------- REQUEST CONTEXT -----------
+sid_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("rp_sid", default=None)
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("rp_request_id", default=None)
+
+def bind(sid: Optional[str] = None, request_id: Optional[str] = None) -> None:
+    # python-socketio runs every event in its own task, so this is per request
+    if sid is not None:
+        sid_var.set(sid)
+    if request_id is not None:
+        request_id_var.set(request_id)
+
+class ContextFilter(logging.Filter):
+    # runs in the logging caller, where the request's context is visible
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.sid = sid_var.get()
+        record.request_id = request_id_var.get()
+        return True
+
+# ----------- FORMATTERS -----------
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sid", "request_id"}
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__()
+        self._json = json_codec("auto")
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "sid", None):
+            out["sid"] = record.sid
+        if getattr(record, "request_id", None):
+            out["request_id"] = record.request_id
+        # anything passed with extra={...}
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return self._json.dumps(out, default=str)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [sid=%(sid)s rid=%(request_id)s] %(message)s"
+
+# ----------- NON-BLOCKING HANDLER -----------
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # The event loop only enqueues; a listener thread does the formatting and
+    # the (possibly slow) write. When the queue is full records are dropped.
+    def __init__(self, q: "queue.Queue[Any]"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # keep the record intact for the formatter on the listener thread;
+        # only resolve the message so args are not held across threads
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging(cfg: Optional[LogConfig] = None, stream: Any = None) -> DroppingQueueHandler:
+    # idempotent; replaces handlers on the root logger
+    global _listener
+    cfg = cfg or LogConfig()
+    if _listener is not None:
+        _listener.stop()
+
+    out = logging.StreamHandler(stream or sys.stdout)
+    if cfg.format == "json":
+        out.setFormatter(JsonFormatter())
+    else:
+        out.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    handler = DroppingQueueHandler(queue.Queue(max(1, cfg.queue_size)))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(cfg.level.upper())
+    for name in ("socketio", "engineio"):
+        logging.getLogger(name).setLevel(cfg.sio_level.upper())
+
+    _listener = logging.handlers.QueueListener(handler.queue, out, respect_handler_level=False)
+    _listener.start()
+    return handler
+
+def shutdown_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown_logging)
+
+# ----------- TOKEN SAMPLING -----------
+class TokenLogSampler:
+    # Decides once per stream whether token logging is on at all, so the
+    # per-token cost with DEBUG off is one attribute check.
+    __slots__ = ("enabled", "rate", "_log")
+
+    def __init__(self, log: logging.Logger, rate: float):
+        self._log = log
+        self.rate = rate
+        self.enabled = rate > 0 and log.isEnabledFor(logging.DEBUG)
+
+    def token(self, index: int, text: str) -> None:
+        if random.random() < self.rate:
+            self._log.debug("token", extra={"index": index, "token": text})
@@ -0,0 +1,200 @@
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+# ----------- STREAMING -----------
+RP_FRAMES_PER_REPLY = Histogram(
+    "rp_frames_per_reply",
+    "Socket.IO rp_token frames emitted per streamed reply",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+RP_FLUSH_LATENCY = Histogram(
+    "rp_flush_latency_seconds",
+    "Time from the first buffered token to its frame being emitted",
+    buckets=(0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0),
+)
+
+# ----------- CACHES -----------
+RP_CACHE_REQUESTS = Counter(
+    "rp_cache_requests_total",
+    "Cache lookups by cache name and result",
+    ["cache", "result"],
+)
+
+# ----------- ADMISSION -----------
+RP_ADMISSION_QUEUE_DEPTH = Gauge(
+    "rp_admission_queue_depth",
+    "Requests waiting for an LLM slot",
+    # summed over live workers when PROMETHEUS_MULTIPROC_DIR is set
+    multiprocess_mode="livesum",
+)
+
+RP_ADMISSION_INFLIGHT = Gauge(
+    "rp_admission_inflight",
+    "Requests currently holding an LLM slot",
+    multiprocess_mode="livesum",
+)
+
+RP_ADMISSION_WAIT = Histogram(
+    "rp_admission_wait_seconds",
+    "Time spent waiting for an LLM slot",
+    ["priority"],
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+RP_ADMISSION_REJECTED = Counter(
+    "rp_admission_rejected_total",
+    "Requests rejected by admission control",
+    ["reason"],
+)
+
+# ----------- CANCELLATION -----------
+RP_CANCELLED = Counter(
+    "rp_generations_cancelled_total",
+    "Generations cancelled before completion",
+    ["reason"],
+)
+
+RP_TOKENS_SAVED = Counter(
+    "rp_cancelled_tokens_saved_total",
+    "Upper bound of completion tokens not generated thanks to cancellation (max_tokens minus tokens produced)",
+    ["reason"],
+)
+
+# ----------- ROOMS -----------
+RP_ROOM_LATE_JOINS = Counter(
+    "rp_room_late_joins_total",
+    "Sockets that joined a room mid-generation and were sent the buffered prefix",
+)
+
+# ----------- REQUESTS -----------
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+RP_REQUEST_LATENCY = Histogram(
+    "rp_request_latency_seconds",
+    "Handler wall time per Socket.IO event, including admission wait",
+    ["event"],
+    buckets=LATENCY_BUCKETS,
+)
+
+RP_REQUEST_ERRORS = Counter(
+    "rp_request_errors_total",
+    "Requests answered with rp_error, by event and exception type",
+    ["event", "type"],
+)
+
+RP_TTFT = Histogram(
+    "rp_time_to_first_token_seconds",
+    "Time from opening the completion stream request to its first token",
+    ["event"],
+    buckets=(0.025, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0),
+)
+
+RP_INTER_TOKEN = Histogram(
+    "rp_inter_token_latency_seconds",
+    "Mean gap between tokens of a stream, observed once per stream",
+    ["event"],
+    buckets=(0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0),
+)
+
+RP_ACTIVE_STREAMS = Gauge(
+    "rp_active_streams",
+    "Streamed generations in progress",
+    multiprocess_mode="livesum",
+)
+
+RP_CONNECTED_SOCKETS = Gauge(
+    "rp_connected_sockets",
+    "Authenticated Socket.IO connections",
+    multiprocess_mode="livesum",
+)
+
+# ----------- LLM -----------
+RP_LLM_LATENCY = Histogram(
+    "rp_llm_request_latency_seconds",
+    "Completion call latency by call kind; for streams, until the response headers",
+    ["call"],
+    buckets=LATENCY_BUCKETS,
+)
+
+RP_LLM_ERRORS = Counter(
+    "rp_llm_errors_total",
+    "Failed completion calls by call kind and exception type, retries included",
+    ["call", "type"],
+)
+
+RP_PROMPT_TOKENS = Counter(
+    "rp_prompt_tokens_total",
+    "Prompt tokens reported by the backend",
+    ["call"],
+)
+
+RP_COMPLETION_TOKENS = Counter(
+    "rp_completion_tokens_total",
+    "Completion tokens reported by the backend (streamed chunks when usage is missing)",
+    ["call"],
+)
+
+RP_DEDUP = Counter(
+    "rp_completion_dedup_total",
+    "completion_once lookups: miss (own backend call), coalesced (joined an identical in-flight call), cached",
+    ["result"],
+)
+
+RP_PROMPT_SEGMENTS = Counter(
+    "rp_prompt_segment_lookups_total",
+    "Token-id prompt encodes: hit (cached prefix ids reused), miss (prefix cached), unsafe (boundary not reusable), none",
+    ["result"],
+)
+
+# ----------- WARM-UP -----------
+RP_WARMUPS = Counter(
+    "rp_prefix_warmups_total",
+    "Prefix warm-up requests by outcome (scheduled, duplicate, busy, rate_limited, disabled, done, failed)",
+    ["result"],
+)
+
+# ----------- TOKEN BUDGETS -----------
+RP_MAX_TOKENS = Histogram(
+    "rp_max_tokens",
+    "max_tokens granted per request",
+    ["event"],
+    buckets=(32, 64, 96, 128, 192, 256, 384, 512, 768, 1024, 2048),
+)
+
+RP_TRUNCATED_REPLIES = Counter(
+    "rp_truncated_replies_total",
+    "Replies that used their whole max_tokens budget",
+    ["event"],
+)
+
+# ----------- STOP SEQUENCES -----------
+RP_STOP_MATCHES = Counter(
+    "rp_stop_matches_total",
+    "Replies cut short by the server-side stop matcher",
+    ["event"],
+)
+
+RP_STOP_TOKENS_SAVED = Counter(
+    "rp_stop_tokens_saved_total",
+    "Upper bound of completion tokens not generated because a stream was closed on a stop match",
+    ["event"],
+)
+
+# ----------- EXPOSITION -----------
+async def _metrics(request: Request) -> Response:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # several uvicorn workers: aggregate every worker's metric files
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def metrics_app() -> Starlette:
+    # mounted as socketio.ASGIApp(other_asgi_app=...), so it serves every non Socket.IO path
+    return Starlette(routes=[Route("/metrics", _metrics)])
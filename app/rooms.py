@@ -0,0 +1,93 @@
+import asyncio
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, Optional, Set
+
+from app.cache import LRUCache
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class RoomConfig:
+    # frames kept for late joiners; older frames are dropped first
+    buffer_frames: int = int(os.getenv("RP_ROOM_BUFFER_FRAMES", "2048"))
+    # who may join or start in each room, kept per worker
+    max_rooms: int = int(os.getenv("RP_ROOM_MAX", "10000"))
+    ttl: float = float(os.getenv("RP_ROOM_TTL", "86400"))
+
+ROOM_PREFIX = "rp-room:"
+
+def room_target(name: str) -> str:
+    # Socket.IO room name; prefixed so a room can never collide with a sid's own room
+    return ROOM_PREFIX + name
+
+def room_scope(owner: str, room: str) -> str:
+    # rooms belong to the user who opened them, so names never clash across users
+    return f"{owner}:{room}"
+
+class RoomAccess:
+    __slots__ = ("owner", "members")
+
+    def __init__(self, owner: str, members: Iterable[str] = ()):
+        self.owner = owner
+        self.members: Set[str] = set(members)
+
+    def allows(self, subject: str) -> bool:
+        return subject == self.owner or subject in self.members
+
+# ----------- ROOM GENERATIONS -----------
+class RoomStream:
+    # One generation broadcast to a room. Frames go through a ring buffer so a
+    # late joiner can be sent the prefix; `lock` is held around each broadcast
+    # and around a join, so a joiner never misses or duplicates a frame.
+    def __init__(self, room: str, rid: str, max_frames: int):
+        self.room = room
+        self.rid = rid
+        self.frames: Deque[str] = deque(maxlen=max(1, max_frames))
+        self.dropped = 0
+        self.lock = asyncio.Lock()
+
+    def record(self, frame: str) -> None:
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+
+    def prefix(self) -> str:
+        return "".join(self.frames)
+
+class RoomRegistry:
+    # room name -> the generation currently streaming to it (at most one)
+    def __init__(self, cfg: Optional[RoomConfig] = None):
+        self.cfg = cfg or RoomConfig()
+        self._active: Dict[str, RoomStream] = {}
+        self._access = LRUCache(self.cfg.max_rooms, self.cfg.ttl, name="room_access")
+
+    def open(self, scope: str, owner: str, members: Optional[Iterable[str]] = None) -> RoomAccess:
+        # the owner opens a room and names its members; None keeps the current list
+        access = self._access.get(scope)
+        if access is None:
+            access = RoomAccess(owner)
+        if members is not None:
+            access.members = {m for m in members if isinstance(m, str)}
+        self._access.set(scope, access)
+        return access
+
+    def allows(self, scope: str, subject: str) -> bool:
+        access = self._access.get(scope)
+        return access is not None and access.allows(subject)
+
+    def start(self, room: str, rid: str) -> RoomStream:
+        if room in self._active:
+            raise ValueError(f"Room {room!r} is already generating a reply")
+        stream = self._active[room] = RoomStream(room, rid, self.cfg.buffer_frames)
+        return stream
+
+    def get(self, room: str) -> Optional[RoomStream]:
+        return self._active.get(room)
+
+    def finish(self, stream: RoomStream) -> None:
+        if self._active.get(stream.room) is stream:
+            del self._active[stream.room]
+
+    def __len__(self) -> int:
+        return len(self._active)
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.cache import LRUCache
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class SessionConfig:
+    # defaults to the cluster's Redis so conversations follow users across workers
+    redis_url: str = os.getenv("RP_SESSION_REDIS_URL", os.getenv("RP_REDIS_URL", ""))
+    max_conversations: int = int(os.getenv("RP_SESSION_MAX", "10000"))
+    ttl: float = float(os.getenv("RP_SESSION_TTL", "3600"))
+    # stored turns are capped; the prompt itself is cut to the token budget at build time
+    max_turns: int = int(os.getenv("RP_SESSION_MAX_TURNS", "200"))
+
+# ----------- CONVERSATION STATE -----------
+@dataclass
+class Conversation:
+    conversation_id: str
+    character: Dict[str, Any]
+    history: List[Dict[str, str]] = field(default_factory=list)
+    updated_at: float = field(default_factory=time.time)
+
+    def append_exchange(self, user_input: str, reply: str, max_turns: int) -> None:
+        user_input, reply = (user_input or "").strip(), (reply or "").strip()
+        if not user_input or not reply:
+            return
+        self.history += [
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": reply},
+        ]
+        # whole exchanges only, and always at least the newest one
+        keep = max(2, max_turns - max_turns % 2)
+        if len(self.history) > keep:
+            self.history = self.history[-keep:]
+        self.updated_at = time.time()
+
+    def copy(self) -> "Conversation":
+        # turns work on a copy; the store only sees it once the reply is in
+        return Conversation(self.conversation_id, self.character, list(self.history), self.updated_at)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> "Conversation":
+        return cls(**json.loads(raw))
+
+class _KeyLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class TurnLocks:
+    # One turn at a time per conversation, so a turn always builds on the
+    # previous one's exchange instead of racing it. Per worker: a user's
+    # sockets on different workers are not serialized against each other.
+    def __init__(self):
+        self._locks: Dict[str, _KeyLock] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+# ----------- STORES -----------
+class SessionStore(ABC):
+    @abstractmethod
+    async def get(self, conversation_id: str) -> Optional[Conversation]: ...
+
+    @abstractmethod
+    async def put(self, conv: Conversation) -> None: ...
+
+    @abstractmethod
+    async def delete(self, conversation_id: str) -> None: ...
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, max_conversations: int = 10000, ttl: Optional[float] = 3600):
+        self._cache = LRUCache(max_conversations, ttl, name="sessions")
+
+    async def get(self, conversation_id: str) -> Optional[Conversation]:
+        return self._cache.get(conversation_id)
+
+    async def put(self, conv: Conversation) -> None:
+        self._cache.set(conv.conversation_id, conv)
+
+    async def delete(self, conversation_id: str) -> None:
+        self._cache.pop(conversation_id)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+class RedisSessionStore(SessionStore):
+    # Works with any client exposing redis.asyncio's get/set(ex=)/delete.
+    def __init__(self, client: Any, ttl: float = 3600, prefix: str = "rp:conv:"):
+        self.client = client
+        self.ttl = int(ttl) or None
+        self.prefix = prefix
+
+    async def get(self, conversation_id: str) -> Optional[Conversation]:
+        raw = await self.client.get(self.prefix + conversation_id)
+        return Conversation.from_json(raw) if raw else None
+
+    async def put(self, conv: Conversation) -> None:
+        await self.client.set(self.prefix + conv.conversation_id, conv.to_json(), ex=self.ttl)
+
+    async def delete(self, conversation_id: str) -> None:
+        await self.client.delete(self.prefix + conversation_id)
+
+def create_session_store(cfg: SessionConfig) -> SessionStore:
+    if cfg.redis_url:
+        # optional dependency, only needed when a shared backend is configured
+        import redis.asyncio as redis
+        return RedisSessionStore(redis.from_url(cfg.redis_url), cfg.ttl)
+    return InMemorySessionStore(cfg.max_conversations, cfg.ttl)
@@ -0,0 +1,133 @@
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Markers the model emits when it starts writing the partner's turn. vLLM
+# only stops on <end_of_turn>; these are caught while streaming instead.
+DEFAULT_STOPS = ("<start_of_turn>", "<end_of_turn>", "\nUser:", "\nuser:")
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class StopConfig:
+    enabled: bool = os.getenv("RP_STOP_MATCHER", "true").lower() in ("1", "true", "yes")
+    # JSON list of extra stop strings, e.g. '["\\nNarrator:"]'; added to DEFAULT_STOPS
+    sequences: str = os.getenv("RP_STOP_SEQUENCES", "")
+
+    def global_stops(self) -> Tuple[str, ...]:
+        extra = json.loads(self.sequences) if self.sequences.strip() else []
+        if not isinstance(extra, list) or not all(isinstance(s, str) for s in extra):
+            raise ValueError("RP_STOP_SEQUENCES must be a JSON list of strings")
+        return DEFAULT_STOPS + tuple(extra)
+
+def character_stops(character: Dict, base: Iterable[str] = DEFAULT_STOPS) -> Tuple[str, ...]:
+    # per character: explicit "stop" strings, and "<partner>:" lines when the
+    # card names who the character is talking to
+    stops = list(base)
+    extra = character.get("stop") or []
+    if isinstance(extra, str):
+        # a single stop string, not a list of characters
+        extra = [extra]
+    stops.extend(s for s in extra if isinstance(s, str))
+    partner = (character.get("partner_name") or character.get("user_name") or "").strip()
+    if partner:
+        stops.append(f"\n{partner}:")
+    # sorted so equal sets share one compiled automaton
+    return tuple(sorted({s for s in stops if s}))
+
+# ----------- AHO-CORASICK AUTOMATON -----------
+class StopAutomaton:
+    # Trie of the stop strings with failure links. depth[n] is the length of
+    # the text suffix state n stands for: that many trailing characters may
+    # still turn into a match and must be held back.
+    __slots__ = ("goto", "fail", "depth", "match")
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.depth: List[int] = [0]
+        # length of the longest stop string ending at the node (0 = none)
+        self.match: List[int] = [0]
+        for pattern in patterns:
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.depth.append(self.depth[node] + 1)
+                    self.match.append(0)
+                node = nxt
+            self.match[node] = max(self.match[node], len(pattern))
+
+        # breadth-first, so a node's failure target is final before its children need it
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, child in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                # a stop string that is a suffix of this path also ends here
+                self.match[child] = max(self.match[child], self.match[self.fail[child]])
+                queue.append(child)
+
+    def step(self, node: int, ch: str) -> int:
+        goto, fail = self.goto, self.fail
+        while node and ch not in goto[node]:
+            node = fail[node]
+        return goto[node].get(ch, 0)
+
+@lru_cache(maxsize=1024)
+def compile_stops(patterns: Tuple[str, ...]) -> StopAutomaton:
+    return StopAutomaton(patterns)
+
+# ----------- STREAMING MATCHER -----------
+class StopMatcher:
+    # Feed streamed chunks, emit what feed() returns. Text that could be the
+    # start of a stop string split across chunks is held back until the next
+    # chunk decides it; once a stop string completes, `stopped` is set and the
+    # reply is cut right before it.
+    __slots__ = ("_ac", "_node", "_held", "stopped")
+
+    def __init__(self, automaton: StopAutomaton):
+        self._ac = automaton
+        self._node = 0
+        self._held = ""
+        self.stopped = False
+
+    def feed(self, chunk: str) -> str:
+        if self.stopped:
+            return ""
+        ac, node = self._ac, self._node
+        text = self._held + chunk
+        base = len(self._held)
+        for i, ch in enumerate(chunk):
+            node = ac.step(node, ch)
+            if ac.match[node]:
+                self.stopped = True
+                self._held = ""
+                return text[:base + i + 1 - ac.match[node]]
+        self._node = node
+        keep = ac.depth[node]
+        self._held = text[len(text) - keep:] if keep else ""
+        return text[:len(text) - keep]
+
+    def finish(self) -> str:
+        # the stream ended on the beginning of a marker: drop it
+        self._held = ""
+        return ""
+
+def stop_matcher(patterns: Tuple[str, ...]) -> Optional[StopMatcher]:
+    return StopMatcher(compile_stops(patterns)) if patterns else None
+
+def trim_stops(text: str, patterns: Tuple[str, ...]) -> str:
+    # non-streamed replies get the same cut as streamed ones
+    matcher = stop_matcher(patterns)
+    if matcher is None:
+        return text
+    return matcher.feed(text) + matcher.finish()
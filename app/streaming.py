@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from app.metrics import RP_FLUSH_LATENCY, RP_FRAMES_PER_REPLY
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class StreamConfig:
+    coalesce_ms: float = float(os.getenv("RP_COALESCE_MS", "30"))
+    coalesce_bytes: int = int(os.getenv("RP_COALESCE_BYTES", "512"))
+    max_inflight_emits: int = int(os.getenv("RP_MAX_INFLIGHT_EMITS", "1"))
+    # "auto" (orjson when installed), "orjson" or "stdlib"; used for every Socket.IO packet
+    json_codec: str = os.getenv("RP_JSON_CODEC", "auto")
+    # write rp_token frames from a pre-encoded packet template instead of sio.emit
+    token_templates: bool = os.getenv("RP_TOKEN_TEMPLATES", "true").lower() in ("1", "true", "yes")
+
+# ----------- PER-CONNECTION BACKPRESSURE -----------
+class EmitGates:
+    # One semaphore per sid, shared by every stream on that connection, so a
+    # slow client holds at most `limit` emits in flight; the rest coalesce.
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._gates: Dict[str, asyncio.Semaphore] = {}
+        self._refs: Dict[str, int] = {}
+
+    @contextmanager
+    def gate(self, sid: str) -> Iterator[asyncio.Semaphore]:
+        sem = self._gates.get(sid)
+        if sem is None:
+            sem = self._gates[sid] = asyncio.Semaphore(self.limit)
+        self._refs[sid] = self._refs.get(sid, 0) + 1
+        try:
+            yield sem
+        finally:
+            refs = self._refs[sid] - 1
+            if refs:
+                self._refs[sid] = refs
+            else:
+                del self._refs[sid]
+                del self._gates[sid]
+
+    def __len__(self) -> int:
+        return len(self._gates)
+
+# ----------- TOKEN COALESCER -----------
+class TokenCoalescer:
+    # Buffers tokens and hands them to `emit` as one frame once the time window
+    # since the first buffered token elapses or the byte budget is reached.
+    # A single writer task per reply means emits never pile up: tokens that
+    # arrive while an emit is in flight simply join the next frame.
+    def __init__(
+        self,
+        emit: Callable[[str], Awaitable[Any]],
+        cfg: StreamConfig,
+        gate: Optional[asyncio.Semaphore] = None,
+    ):
+        self._emit = emit
+        self._window = max(0.0, cfg.coalesce_ms / 1000)
+        self._budget = max(1, cfg.coalesce_bytes)
+        self._gate = gate
+        self._buf: List[str] = []
+        self._size = 0
+        self._first_at = 0.0
+        self._pending = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._closed = False
+        self._observed = False
+        self.frames = 0
+        self._task = asyncio.create_task(self._run())
+
+    async def __aenter__(self) -> "TokenCoalescer":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def push(self, tok: str) -> None:
+        if self._task.done():
+            self._task.result()
+            raise RuntimeError("Token coalescer is closed")
+        if not self._buf:
+            self._first_at = time.perf_counter()
+        self._buf.append(tok)
+        self._size += len(tok.encode("utf-8"))
+        self._pending.set()
+        if self._size >= self._budget:
+            self._wake.set()
+
+    async def close(self) -> None:
+        self._closed = True
+        self._pending.set()
+        self._wake.set()
+        try:
+            await self._task
+        finally:
+            if not self._observed:
+                self._observed = True
+                RP_FRAMES_PER_REPLY.observe(self.frames)
+
+    async def _run(self) -> None:
+        while True:
+            await self._pending.wait()
+            if self._buf and not self._closed and self._size < self._budget:
+                remaining = self._first_at + self._window - time.perf_counter()
+                if remaining > 0:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            await self._flush()
+            if self._closed and not self._buf:
+                return
+
+    async def _flush(self) -> None:
+        self._pending.clear()
+        if not self._buf:
+            return
+        text, first_at = "".join(self._buf), self._first_at
+        self._buf, self._size = [], 0
+        if self._gate is None:
+            await self._emit(text)
+        else:
+            async with self._gate:
+                await self._emit(text)
+        self.frames += 1
+        RP_FLUSH_LATENCY.observe(time.perf_counter() - first_at)
@@ -0,0 +1,188 @@
+import logging
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# ----------- INCREMENTAL HISTORY -----------
+_ROLE_CONTENT = itemgetter("role", "content")
+
+class _Rendered:
+    # key: the (role, content) of every message; text: their joined blocks.
+    # Message i's text starts at starts[i] - base (the start of the next
+    # rendered block if message i renders to nothing).
+    __slots__ = ("key", "text", "starts", "base")
+
+    def __init__(self, key: Tuple, text: str, starts: List[int], base: int):
+        self.key = key
+        self.text = text
+        self.starts = starts
+        self.base = base
+
+class HistoryRenderer:
+    # Renders history as newline-joined turn blocks and remembers the result,
+    # indexed by its last exchange. The next turn of a conversation is the
+    # previous history, possibly cut at the front to fit the context, plus one
+    # new exchange: its text is a slice of the stored text plus the new blocks,
+    # so earlier messages are never formatted again.
+    def __init__(
+        self,
+        turn: Callable[[str, str], str],
+        roles: Tuple[str, ...] = ("user", "assistant"),
+        maxsize: int = 1024,
+        min_messages: int = 16,
+    ):
+        self.turn = turn
+        self.roles = roles
+        self.maxsize = max(1, maxsize)
+        # below this, formatting every message is cheaper than the bookkeeping
+        self.min_messages = min_messages
+        # a plain LRU: this sits on every prompt build, so no per-lookup metrics
+        self._rendered: "OrderedDict[Tuple, _Rendered]" = OrderedDict()
+
+    def block(self, role: str, content: str) -> Optional[str]:
+        role = (role or "").lower()
+        content = (content or "").strip()
+        if role not in self.roles or not content:
+            return None
+        return self.turn(role, content)
+
+    def _reuse(self, key: Tuple, m: int) -> Optional[Tuple[str, List[int], int]]:
+        # a stored history ending with key[:m]: its text from that point on
+        if m <= 0:
+            return None
+        tail = key[max(0, m - 2):m]
+        entry = self._rendered.get(tail)
+        if entry is None:
+            return None
+        drop = len(entry.key) - m
+        if drop < 0 or entry.key[drop:] != key[:m]:
+            return None
+        self._rendered.move_to_end(tail)
+        if drop == 0 and m == len(key):
+            return entry.text, entry.starts, entry.base
+        start = entry.starts[drop]
+        return entry.text[start - entry.base:], entry.starts[drop:], start
+
+    def render(self, history: List[Dict[str, Any]]) -> str:
+        if len(history) < self.min_messages:
+            blocks = (self.block(m.get("role") or "", m.get("content") or "") for m in history)
+            return "\n".join(b for b in blocks if b is not None)
+        try:
+            key = tuple(map(_ROLE_CONTENT, history))
+        except KeyError:
+            key = tuple((m.get("role") or "", m.get("content") or "") for m in history)
+        n = len(key)
+        if not n:
+            return ""
+
+        # the same history again, or a stored one plus the newest exchange
+        for m in (n, n - 2, n - 1):
+            reused = self._reuse(key, m)
+            if reused is not None:
+                break
+        else:
+            m, reused = 0, ("", [], 0)
+        text, starts, base = reused
+        if m < n:
+            text, starts = self._extend(text, starts, base, key[m:])
+        tail = key[-2:]
+        entry = self._rendered.get(tail)
+        if entry is None or entry.key is not key and entry.key != key:
+            self._rendered[tail] = _Rendered(key, text, starts, base)
+            self._rendered.move_to_end(tail)
+            if len(self._rendered) > self.maxsize:
+                self._rendered.popitem(last=False)
+        return text
+
+    def _extend(self, text: str, starts: List[int], base: int, items: Tuple) -> Tuple[str, List[int]]:
+        parts = [text] if text else []
+        end = pos = len(text)
+        new_starts: List[Optional[int]] = []
+        for role, content in items:
+            block = self.block(role, content)
+            if block is None:
+                new_starts.append(None)
+                continue
+            if parts:
+                pos += 1  # joining newline
+            new_starts.append(pos)
+            parts.append(block)
+            pos += len(block)
+        # messages that render to nothing start where the next block does
+        nxt = pos
+        for i in range(len(new_starts) - 1, -1, -1):
+            if new_starts[i] is None:
+                new_starts[i] = nxt
+            else:
+                nxt = new_starts[i]
+        starts = starts + [p + base for p in new_starts]
+        # stored messages that rendered to nothing at the very end now start at the first new block
+        i = len(starts) - len(new_starts) - 1
+        while i >= 0 and starts[i] == end + base and nxt != end:
+            starts[i] = nxt + base
+            i -= 1
+        return "\n".join(parts), starts
+
+# ----------- CHAT TEMPLATES -----------
+_PROBE = [
+    {"role": "user", "content": "a"},
+    {"role": "assistant", "content": "b"},
+    {"role": "user", "content": "c"},
+]
+
+def _raise_exception(message: str) -> None:
+    raise ValueError(message)
+
+class ChatTemplate:
+    # The tokenizer's Jinja chat template, compiled once and rendered the way
+    # transformers' apply_chat_template does, without loading transformers.
+    def __init__(self, source: Optional[str] = None, bos_token: str = "<bos>", eos_token: str = "<eos>"):
+        # jinja2 ships with transformers; import only when the chat layout is used
+        from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+        if source is None:
+            from app.fix_tokenizer import CHAT_TEMPLATE
+            source = CHAT_TEMPLATE
+        env = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True, extensions=["jinja2.ext.loopcontrols"])
+        env.globals["raise_exception"] = _raise_exception
+        self._template = env.from_string(source)
+        self.bos_token = bos_token
+        self.eos_token = eos_token
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer: Any = None) -> "ChatTemplate":
+        # the template saved with tokenizer.fixed, else the one fix_tokenizer.py attaches
+        if tokenizer is None or not getattr(tokenizer, "chat_template", None):
+            return cls()
+        bos, eos = tokenizer.bos_token or "<bos>", tokenizer.eos_token or "<eos>"
+        template = cls(tokenizer.chat_template, bos, eos)
+        try:
+            # tokenizer.fixed files built before the role check was fixed reject every user turn
+            template.render(_PROBE)
+        except Exception as e:
+            log.warning("tokenizer chat template failed a user/model/user probe (%s); using the built-in one. "
+                        "Re-run app/fix_tokenizer.py to update tokenizer.fixed", e)
+            return cls(None, bos, eos)
+        return template
+
+    def render(self, messages: List[Dict[str, str]], add_generation_prompt: bool = True) -> str:
+        text = self._template.render(
+            messages=messages,
+            add_generation_prompt=add_generation_prompt,
+            bos_token=self.bos_token,
+            eos_token=self.eos_token,
+        )
+        # vLLM adds BOS when it tokenizes a text prompt; a second one hurts quality
+        if self.bos_token and text.startswith(self.bos_token):
+            text = text[len(self.bos_token):]
+        return text
+
+def chat_messages(preamble: str, history: List[Dict[str, str]], user_input: str) -> List[Dict[str, str]]:
+    # Gemma has no system role: the preamble opens the first user turn, so it
+    # stays the prompt's prefix as the conversation grows
+    messages = [{"role": m["role"], "content": m["content"]} for m in history]
+    messages.append({"role": "user", "content": user_input})
+    messages[0] = {"role": "user", "content": f"{preamble}\n\n{messages[0]['content']}"}
+    return messages
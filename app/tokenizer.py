@@ -0,0 +1,112 @@
+import logging
+import math
+import os
+from functools import lru_cache
+from typing import Any, List, Optional
+
+from app.cache import LRUCache
+from app.metrics import RP_PROMPT_SEGMENTS
+
+log = logging.getLogger(__name__)
+
+# Same location app/fix_tokenizer.py writes the fixed Gemma tokenizer to.
+TOKENIZER_PATH = os.getenv(
+    "TOKENIZER_PATH",
+    os.path.join(os.getenv("TOKENIZER_OUT_DIR", "/tokenizer"), "tokenizer.fixed"),
+)
+
+@lru_cache(maxsize=None)
+def load_tokenizer(path: str = TOKENIZER_PATH):
+    # transformers is heavy; import only when a tokenizer is actually needed
+    from transformers import PreTrainedTokenizerFast
+    return PreTrainedTokenizerFast.from_pretrained(path)
+
+# ----------- TOKEN COUNTER -----------
+class TokenCounter:
+    # Memoized token counts. Without a tokenizer it falls back to a
+    # conservative characters-per-token estimate so budgets still hold.
+    def __init__(self, tokenizer: Optional[Any] = None, cache: Optional[LRUCache] = None, chars_per_token: float = 3.0):
+        self.tokenizer = tokenizer
+        self.cache = cache if cache is not None else LRUCache(50_000, name="token_count")
+        self.chars_per_token = chars_per_token
+
+    @classmethod
+    def load(cls, path: str = TOKENIZER_PATH, cache: Optional[LRUCache] = None) -> "TokenCounter":
+        try:
+            tokenizer = load_tokenizer(path)
+        except Exception as e:
+            log.warning("tokenizer %s unavailable, estimating token counts: %s", path, e)
+            tokenizer = None
+        return cls(tokenizer, cache)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        n = self.cache.get(text)
+        if n is None:
+            if self.tokenizer is not None:
+                n = len(self.tokenizer.encode(text, add_special_tokens=False))
+            else:
+                n = math.ceil(len(text) / self.chars_per_token)
+            self.cache.set(text, n)
+        return n
+
+# ----------- PROMPT ENCODER -----------
+class PromptText(str):
+    # A prompt that knows where its stable part (rules + character card) ends,
+    # so the encoder can reuse that part's token ids. Behaves as a plain str.
+    prefix_len: int = 0
+
+    def __new__(cls, text: str, prefix_len: int = 0) -> "PromptText":
+        obj = super().__new__(cls, text)
+        obj.prefix_len = max(0, prefix_len)
+        return obj
+
+_UNSAFE = object()
+
+class PromptEncoder:
+    # [BOS] + token ids for text prompts, with the ids of each stable prefix
+    # cached by its text. The prefix is cut at the start of a newline run, and
+    # the first time a prefix is seen the split encoding is checked against
+    # encoding the whole prompt; a prefix whose ids would differ across the
+    # boundary is remembered and always encoded in full.
+    def __init__(self, tokenizer: Any, cache: Optional[LRUCache] = None):
+        self.tokenizer = tokenizer
+        self.cache = cache if cache is not None else LRUCache(4096, name="prompt_segments")
+        self.bos = tokenizer.bos_token_id
+
+    def _encode(self, text: str) -> List[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False) if text else []
+
+    @staticmethod
+    def cut(text: str, prefix_len: int) -> int:
+        # last newline-run start at or before prefix_len (0: nothing to reuse)
+        i = text.rfind("\n", 0, prefix_len + 1)
+        while i > 0 and text[i - 1] == "\n":
+            i -= 1
+        return max(0, i)
+
+    def encode(self, text: str) -> List[int]:
+        ids = self._encode_body(text)
+        return ids if self.bos is None else [self.bos] + ids
+
+    def _encode_body(self, text: str) -> List[int]:
+        cut = self.cut(text, getattr(text, "prefix_len", 0))
+        if cut == 0:
+            RP_PROMPT_SEGMENTS.labels(result="none").inc()
+            return self._encode(text)
+        prefix = text[:cut]
+        cached = self.cache.get(prefix)
+        if cached is _UNSAFE:
+            RP_PROMPT_SEGMENTS.labels(result="unsafe").inc()
+            return self._encode(text)
+        if cached is not None:
+            RP_PROMPT_SEGMENTS.labels(result="hit").inc()
+            return cached + self._encode(text[cut:])
+        # first use: verify the split against the full encoding
+        full = self._encode(text)
+        prefix_ids = self._encode(prefix)
+        ok = full[:len(prefix_ids)] == prefix_ids and full[len(prefix_ids):] == self._encode(text[cut:])
+        self.cache.set(prefix, prefix_ids if ok else _UNSAFE)
+        RP_PROMPT_SEGMENTS.labels(result="miss" if ok else "unsafe").inc()
+        return full
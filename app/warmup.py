@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.ai import LLMClient, RPFormatter, character_key
+from app.cache import LRUCache
+from app.metrics import RP_WARMUPS
+
+log = logging.getLogger(__name__)
+
+# prompt kinds with a warm-up prefix (see RPFormatter.warmup_prompt)
+KINDS = ("manual", "twitter")
+
+# ----------- CONFIGURATION -----------
+@dataclass(frozen=True)
+class WarmupConfig:
+    enabled: bool = os.getenv("RP_WARMUP", "true").lower() in ("1", "true", "yes")
+    # a warmed character is not warmed again for this long
+    ttl: float = float(os.getenv("RP_WARMUP_TTL", "300"))
+    # token bucket per user: sustained warm-ups per second and burst size
+    rate: float = float(os.getenv("RP_WARMUP_RATE", "2"))
+    burst: int = int(os.getenv("RP_WARMUP_BURST", "5"))
+    max_users: int = int(os.getenv("RP_WARMUP_MAX_USERS", "10000"))
+    max_inflight: int = int(os.getenv("RP_WARMUP_MAX_INFLIGHT", "2"))
+    max_characters: int = int(os.getenv("RP_WARMUP_MAX_CHARACTERS", "4096"))
+
+class _Bucket:
+    __slots__ = ("tokens", "refilled_at")
+
+    def __init__(self, tokens: float, refilled_at: float):
+        self.tokens = tokens
+        self.refilled_at = refilled_at
+
+# ----------- PREFIX WARMER -----------
+class PrefixWarmer:
+    # Sends a max_tokens=1 completion of a character's shared prompt prefix so
+    # vLLM's prefix cache holds it before the first real request. Best effort:
+    # requests over the user's rate, over max_inflight or already warm are dropped.
+    def __init__(
+        self,
+        llm: LLMClient,
+        fmt: RPFormatter,
+        cfg: Optional[WarmupConfig] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.llm = llm
+        self.fmt = fmt
+        self.cfg = cfg or WarmupConfig()
+        self.clock = clock
+        self.warm_keys = LRUCache(self.cfg.max_characters, self.cfg.ttl, name="warmup")
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        # one bucket per user, so a single client cannot spend everyone's warm-ups
+        self._buckets = LRUCache(self.cfg.max_users, name="warmup_buckets")
+
+    def _take_token(self, user: str) -> bool:
+        now = self.clock()
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            bucket = _Bucket(float(self.cfg.burst), now)
+            self._buckets.set(user, bucket)
+        bucket.tokens = min(float(self.cfg.burst), bucket.tokens + (now - bucket.refilled_at) * self.cfg.rate)
+        bucket.refilled_at = now
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def _decide(self, key: Tuple[str, str], user: str) -> str:
+        if not self.cfg.enabled:
+            return "disabled"
+        if key in self._inflight or key in self.warm_keys:
+            return "duplicate"
+        if len(self._inflight) >= self.cfg.max_inflight:
+            return "busy"
+        if not self._take_token(user):
+            return "rate_limited"
+        return "scheduled"
+
+    def warm(self, character: Dict[str, Any], kind: str = "manual", user: str = "") -> str:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown warm-up kind {kind!r}; expected one of {', '.join(KINDS)}")
+        affinity = character_key(character)
+        key = (kind, affinity)
+        result = self._decide(key, user)
+        RP_WARMUPS.labels(result=result).inc()
+        if result == "scheduled":
+            prompt = self.fmt.warmup_prompt(character, kind, affinity)
+            task = asyncio.create_task(self._run(key, prompt, affinity))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return result
+
+    async def _run(self, key: Tuple[str, str], prompt: str, affinity: str) -> None:
+        try:
+            # same affinity as real requests, so the replica that serves them is the one warmed
+            await self.llm.completion_once(prompt, affinity, max_tokens=1)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            RP_WARMUPS.labels(result="failed").inc()
+            log.warning("%s prefix warm-up failed: %s", key[0], e)
+            return
+        self.warm_keys.set(key, True)
+        RP_WARMUPS.labels(result="done").inc()
+
+    async def aclose(self) -> None:
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
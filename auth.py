@@ -1,36 +1,220 @@
 import os
 import jwt
+import json
+import time
 import asyncio
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
 from functools import wraps
 from dotenv import load_dotenv
-from typing import Any, Callable
+from typing import Any, Callable, Dict, List, Optional
+
+from app.cache import LRUCache
 
 load_dotenv()
 
 JWT_SECRET: str | None = os.getenv("JWT_SECRET")
+JWT_ALGORITHMS: List[str] = [a.strip() for a in os.getenv("JWT_ALGORITHMS", "HS256").split(",") if a.strip()]
+# JWKS file for asymmetric keys (RS*/ES*/PS*/EdDSA need PyJWT[crypto])
+JWT_JWKS_FILE: str = os.getenv("JWT_JWKS_FILE", "")
+JWT_CACHE_SIZE: int = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_TTL: float = float(os.getenv("JWT_CACHE_TTL", "300"))
+AUTH_MAX_SESSIONS: int = int(os.getenv("AUTH_MAX_SESSIONS", "100000"))
+AUTH_SWEEP_INTERVAL: float = float(os.getenv("AUTH_SWEEP_INTERVAL", "60"))
+
+@dataclass
+class Session:
+    claims: dict
+    expires_at: Optional[float]
+
+    def expired(self, now: float) -> bool:
+        return self.expires_at is not None and self.expires_at <= now
+
+class SessionRegistry:
+    # sid -> Session, bounded; oldest sessions are evicted first when full
+    def __init__(self, max_sessions: int = AUTH_MAX_SESSIONS):
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def add(self, sid: str, claims: dict) -> None:
+        exp = claims.get("exp")
+        self._sessions[sid] = Session(claims, float(exp) if exp is not None else None)
+        self._sessions.move_to_end(sid)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def get(self, sid: str) -> Optional[Session]:
+        session = self._sessions.get(sid)
+        if session is not None and session.expired(time.time()):
+            del self._sessions[sid]
+            return None
+        return session
+
+    def remove(self, sid: str) -> None:
+        self._sessions.pop(sid, None)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        expired = [sid for sid, s in self._sessions.items() if s.expired(now)]
+        for sid in expired:
+            del self._sessions[sid]
+        return len(expired)
+
+    def __contains__(self, sid: str) -> bool:
+        return self.get(sid) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+class TokenVerifier:
+    # Verifies JWTs and caches the claims of good tokens by digest, so reconnect
+    # storms skip signature checks. Entries never outlive the token's exp.
+    def __init__(
+        self,
+        secret: str | None = None,
+        algorithms: Optional[List[str]] = None,
+        jwks_file: str = "",
+        cache_size: int = JWT_CACHE_SIZE,
+        cache_ttl: float = JWT_CACHE_TTL,
+    ):
+        self.secret = secret
+        self.algorithms = algorithms or ["HS256"]
+        self.keys: Dict[str, Any] = self._load_jwks(jwks_file) if jwks_file else {}
+        self.cache = LRUCache(cache_size, name="jwt") if cache_size > 0 else None
+        self.cache_ttl = cache_ttl
+
+    @staticmethod
+    def _load_jwks(path: str) -> Dict[str, Any]:
+        with open(path, encoding="utf-8") as f:
+            jwks = jwt.PyJWKSet.from_dict(json.load(f))
+        return {k.key_id or "": k for k in jwks.keys}
+
+    @property
+    def asymmetric(self) -> bool:
+        return bool(self.keys) or any(not a.startswith("HS") for a in self.algorithms)
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def cached(self, token: str) -> Optional[dict]:
+        if self.cache is None:
+            return None
+        return self.cache.get(self._digest(token))
+
+    def _key(self, token: str) -> Any:
+        if not self.keys:
+            return self.secret
+        kid = jwt.get_unverified_header(token).get("kid") or ""
+        key = self.keys.get(kid)
+        if key is None and not kid and len(self.keys) == 1:
+            key = next(iter(self.keys.values()))
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown key id {kid!r}")
+        return key
+
+    def verify(self, token: str) -> dict:
+        claims = jwt.decode(token, self._key(token), algorithms=self.algorithms)
+        if self.cache is not None:
+            ttl = self.cache_ttl
+            if claims.get("exp") is not None:
+                ttl = min(ttl, float(claims["exp"]) - time.time())
+            if ttl > 0:
+                self.cache.set(self._digest(token), claims, ttl=ttl)
+        return claims
 
 class Auth:
-    sessions: list = []
+    def __init__(self, sessions: Optional[SessionRegistry] = None, verifier: Optional[TokenVerifier] = None):
+        self.sessions = sessions if sessions is not None else SessionRegistry()
+        self.verifier = verifier
+        self._sweeper: Optional[asyncio.Task] = None
 
-    def authenticate(self, sid, authData) -> dict[str, Any]:
+    def _verifier(self) -> TokenVerifier:
+        # built lazily so JWT_SECRET can still be set after import (tests, scripts)
+        if self.verifier is None:
+            self.verifier = TokenVerifier(JWT_SECRET, JWT_ALGORITHMS, JWT_JWKS_FILE)
+        return self.verifier
+
+    @staticmethod
+    def _token(sid, authData) -> tuple[str | None, dict[str, Any] | None]:
         if not authData or not sid:
-            return { "status": False, "message": "No auth data provided" }
+            return None, { "status": False, "message": "No auth data provided" }
 
         token: str | None = authData.get('token') if authData else None
-        if not token: return { "status": False, "message": "No token provided" }
+        if not token: return None, { "status": False, "message": "No token provided" }
+        return token, None
 
-        try:
-            jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        except jwt.ExpiredSignatureError:
+    @staticmethod
+    def _failure(e: Exception) -> dict[str, Any]:
+        if isinstance(e, jwt.ExpiredSignatureError):
             return { "status": False, "message": "Token has expired" }
-        except jwt.InvalidTokenError:
+        if isinstance(e, jwt.InvalidTokenError):
             return { "status": False, "message": "Invalid token" }
-        except Exception as e:
-            return { "status": False, "message": f"Authentication error: {str(e)}" }
+        return { "status": False, "message": f"Authentication error: {str(e)}" }
 
-        self.sessions.append(sid)
+    def _accept(self, sid, payload: dict) -> dict[str, Any]:
+        self.sessions.add(sid, payload)
         return { "status": True }
 
+    def authenticate(self, sid, authData) -> dict[str, Any]:
+        token, error = self._token(sid, authData)
+        if error: return error
+
+        verifier = self._verifier()
+        payload = verifier.cached(token)
+        if payload is None:
+            try:
+                payload = verifier.verify(token)
+            except Exception as e:
+                return self._failure(e)
+        return self._accept(sid, payload)
+
+    async def authenticate_async(self, sid, authData) -> dict[str, Any]:
+        # Asymmetric signature checks are slow enough to stall the event loop
+        # during reconnect storms, so they run in a worker thread.
+        token, error = self._token(sid, authData)
+        if error: return error
+
+        verifier = self._verifier()
+        payload = verifier.cached(token)
+        if payload is None:
+            try:
+                if verifier.asymmetric:
+                    payload = await asyncio.to_thread(verifier.verify, token)
+                else:
+                    payload = verifier.verify(token)
+            except Exception as e:
+                return self._failure(e)
+        return self._accept(sid, payload)
+
+    def logout(self, sid) -> None:
+        self.sessions.remove(sid)
+
+    def subject(self, sid) -> str:
+        # JWT subject when present, so limits follow the user across sockets
+        session = self.sessions.get(sid)
+        claims = session.claims if session else {}
+        return str(claims.get("sub") or sid)
+
+    async def _sweep_forever(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.sessions.sweep()
+
+    def start_sweeper(self, interval: float = AUTH_SWEEP_INTERVAL) -> None:
+        if self._sweeper is None and interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_forever(interval))
+
+    async def stop_sweeper(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
     def isAuthenticated(self, f: Callable) -> Callable:
         @wraps(f)
         async def async_wrapper(sid, *args, **kwargs) -> Any:
@@ -46,4 +230,4 @@ class Auth:
 
         if asyncio.iscoroutinefunction(f):
             return async_wrapper
-        return sync_wrapper
\ No newline at end of file
+        return sync_wrapper
@@ -1,114 +1,649 @@
+import asyncio
+import logging
+import time
 import socketio
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 from auth import Auth
 from app.prompts import PromptManager
-from app.ai import GenDefaults, LLMClient, ModelConfig, RPFormatter, sanitize_history
+from app.ai import (
+    BatchConfig,
+    CacheConfig,
+    GenDefaults,
+    LLMClient,
+    ModelConfig,
+    PromptConfig,
+    RPFormatter,
+    character_key,
+    sanitize_history,
+)
+from app.cache import LRUCache
+from app.templates import ChatTemplate, HistoryRenderer
+from app.tokenizer import PromptEncoder, TokenCounter
+from app.streaming import EmitGates, StreamConfig, TokenCoalescer
+from app.sessions import Conversation, SessionConfig, SessionStore, TurnLocks, create_session_store
+from app.rooms import RoomConfig, RoomRegistry, room_scope, room_target
+from app.cluster import ClusterConfig, create_client_manager
+from app.codec import EventTemplate, json_codec
+from app.warmup import PrefixWarmer, WarmupConfig
+from app.log import LogConfig, TokenLogSampler, bind, setup_logging
+from app.stops import StopConfig, character_stops, stop_matcher, trim_stops
+from app.budget import BudgetConfig, TokenBudget
+from app.metrics import (
+    RP_CANCELLED, RP_CONNECTED_SOCKETS, RP_ROOM_LATE_JOINS, RP_STOP_MATCHES, RP_STOP_TOKENS_SAVED, RP_TOKENS_SAVED, metrics_app,
+)
+from app.instrumentation import StreamStats, record_error, timed
+from app.admission import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    AdmissionConfig,
+    AdmissionController,
+    AdmissionRejected,
+)
 
 auth = Auth()
+log = logging.getLogger("rp.server")
 
 class RPServer:
-    def __init__(self, llm: LLMClient, formatter: RPFormatter, defaults: GenDefaults):
+    def __init__(
+        self,
+        llm: LLMClient,
+        formatter: RPFormatter,
+        defaults: GenDefaults,
+        stream_cfg: StreamConfig | None = None,
+        sessions: SessionStore | None = None,
+        session_cfg: SessionConfig | None = None,
+        admission: AdmissionController | None = None,
+        batch_cfg: BatchConfig | None = None,
+        rooms: RoomRegistry | None = None,
+        client_manager: socketio.AsyncManager | None = None,
+        warmer: PrefixWarmer | None = None,
+        log_cfg: LogConfig | None = None,
+        stop_cfg: StopConfig | None = None,
+        budget: TokenBudget | None = None,
+    ):
+        self.stream_cfg: StreamConfig = stream_cfg or StreamConfig()
+        self.json = json_codec(self.stream_cfg.json_codec)
         self.sio = socketio.AsyncServer(
             async_mode="asgi",
+            json=self.json,
+            # shared pub/sub manager when running several workers (see app/cluster.py)
+            client_manager=client_manager,
             cors_allowed_origins="*",
             # ping_interval=25,
             # ping_timeout=60,
-            logger=True,
-            engineio_logger=True,
+            # levels come from RP_SIO_LOG_LEVEL (see app/log.py); both log every packet at INFO
+            logger=logging.getLogger("socketio.server"),
+            engineio_logger=logging.getLogger("engineio.server"),
+        )
+        self.app: socketio.ASGIApp[socketio.AsyncServer] = socketio.ASGIApp(
+            self.sio, other_asgi_app=metrics_app(), on_startup=self._startup, on_shutdown=self._shutdown
         )
-        self.app: socketio.ASGIApp[socketio.AsyncServer] = socketio.ASGIApp(self.sio)
         self.llm: LLMClient = llm
         self.fmt: RPFormatter = formatter
         self.defaults: GenDefaults = defaults
+        self.gates: EmitGates = EmitGates(self.stream_cfg.max_inflight_emits)
+        self.session_cfg: SessionConfig = session_cfg or SessionConfig()
+        self.sessions: SessionStore = sessions or create_session_store(self.session_cfg)
+        self._turns = TurnLocks()
+        self.admission: AdmissionController = admission or AdmissionController(AdmissionConfig())
+        self.batch_cfg: BatchConfig = batch_cfg or BatchConfig()
+        self.rooms: RoomRegistry = rooms or RoomRegistry()
+        self.warmer: PrefixWarmer = warmer or PrefixWarmer(llm, formatter)
+        self.log_cfg: LogConfig = log_cfg or LogConfig()
+        self.stop_cfg: StopConfig = stop_cfg or StopConfig()
+        self._global_stops = self.stop_cfg.global_stops() if self.stop_cfg.enabled else ()
+        self.budget: TokenBudget = budget or TokenBudget(defaults)
+        # sid -> request_id -> handler tasks, so generations can be cancelled;
+        # a set, since clients may reuse an id (or send none)
+        self._generations: Dict[str, Dict[str, Set[asyncio.Task]]] = {}
+        self._cancel_reasons: Dict[asyncio.Task, str] = {}
         self._register_events()
 
+    async def _startup(self) -> None:
+        # at serve time, not import time: importing server must leave logging alone
+        setup_logging(self.log_cfg)
+        await self.llm.start()
+        auth.start_sweeper()
+
+    async def _shutdown(self) -> None:
+        await self.warmer.aclose()
+        await auth.stop_sweeper()
+        await self.llm.aclose()
+
+    def _cancellable(self, f: Callable) -> Callable:
+        @wraps(f)
+        async def wrapper(sid, data, *args, **kwargs) -> Any:
+            rid = data.get("request_id", "") if isinstance(data, dict) else ""
+            bind(sid, rid)
+            task = asyncio.current_task()
+            self._generations.setdefault(sid, {}).setdefault(rid, set()).add(task)
+            t0 = time.perf_counter()
+            try:
+                result = await f(sid, data, *args, **kwargs)
+                log.info("%s finished", f.__name__, extra={"event": f.__name__, "ms": round((time.perf_counter() - t0) * 1000, 1)})
+                return result
+            except asyncio.CancelledError:
+                reason = self._cancel_reasons.get(task)
+                if reason is None:
+                    raise
+                log.info("%s cancelled (%s)", f.__name__, reason, extra={"event": f.__name__, "reason": reason})
+                if reason == "client":
+                    await self.sio.emit("rp_cancelled", {"request_id": rid}, to=sid)
+            finally:
+                self._cancel_reasons.pop(task, None)
+                by_rid = self._generations.get(sid)
+                tasks = by_rid.get(rid) if by_rid is not None else None
+                if tasks is not None:
+                    tasks.discard(task)
+                    if not tasks:
+                        del by_rid[rid]
+                    if not by_rid:
+                        del self._generations[sid]
+        return wrapper
+
+    def cancel(self, sid: str, rid: Optional[str] = None, reason: str = "client") -> int:
+        by_rid = self._generations.get(sid) or {}
+        groups = by_rid.values() if rid is None else [by_rid.get(rid, ())]
+        cancelled = 0
+        for task in [t for tasks in groups for t in tasks]:
+            # a finished task is not cancelled, so it does not count
+            if not task.done():
+                self._cancel_reasons[task] = reason
+                task.cancel()
+                cancelled += 1
+        return cancelled
+
+    def _token_emitter(self, sid: str, rid: str) -> Callable[[str], Awaitable[Any]]:
+        # Hot path: when this worker owns the socket, rp_token frames are written
+        # straight to engine.io from a pre-encoded packet, so only the token is
+        # serialized per frame. Otherwise (or when disabled) a regular emit.
+        if self.stream_cfg.token_templates and self.sio.manager.is_connected(sid, "/"):
+            eio_sid = self.sio.manager.eio_sid_from_sid(sid, "/")
+            template = EventTemplate(self.json, "rp_token", {"request_id": rid}, "token")
+            send = self.sio.eio.send
+            return lambda text: send(eio_sid, template.encode(text))
+        return lambda text: self.sio.emit("rp_token", {"request_id": rid, "token": text}, to=sid)
+
+    async def _stream_reply(
+        self,
+        sid: str,
+        rid: str,
+        prompt: str,
+        affinity: str,
+        kwargs: Dict[str, Any],
+        event: str = "rp_start",
+        emit: Optional[Callable[[str], Awaitable[Any]]] = None,
+        gate_key: Optional[str] = None,
+        stops: Tuple[str, ...] = (),
+    ) -> str:
+        full = []
+        emit = emit or self._token_emitter(sid, rid)
+        sampler = TokenLogSampler(log, self.log_cfg.token_sample)
+        matcher = stop_matcher(stops)
+        finish: Optional[str] = None
+        with StreamStats(event) as stats:
+            stream = await self.llm.stream_completion(prompt, affinity, **kwargs)
+            try:
+                with self.gates.gate(gate_key or sid) as gate:
+                    async with TokenCoalescer(emit, self.stream_cfg, gate) as coalescer:
+                        async for chunk in stream:
+                            choice = chunk.choices[0] if chunk.choices else None
+                            if choice is not None and choice.finish_reason is not None:
+                                finish = choice.finish_reason
+                            tok = choice.text if choice is not None and choice.text else None
+                            if tok:
+                                stats.token()
+                                if sampler.enabled:
+                                    sampler.token(stats.chunks, tok)
+                                if matcher is not None:
+                                    # held-back text may be the start of a stop string
+                                    tok = matcher.feed(tok)
+                                if tok:
+                                    full.append(tok)
+                                    coalescer.push(tok)
+                                if matcher is not None and matcher.stopped:
+                                    # the model began the partner's turn: stop paying for tokens
+                                    RP_STOP_MATCHES.labels(event=event).inc()
+                                    RP_STOP_TOKENS_SAVED.labels(event=event).inc(
+                                        max(0, kwargs.get("max_tokens", 0) - stats.chunks)
+                                    )
+                                    break
+                            elif chunk.usage is not None:
+                                stats.usage = chunk.usage
+            except asyncio.CancelledError:
+                reason = self._cancel_reasons.get(asyncio.current_task(), "server")
+                RP_CANCELLED.labels(reason=reason).inc()
+                RP_TOKENS_SAVED.labels(reason=reason).inc(max(0, kwargs.get("max_tokens", 0) - len(full)))
+                raise
+            finally:
+                # closing the HTTP stream makes vLLM abort the request and free the sequence;
+                # on every exit, so a failed emit does not leave the replica's slot taken
+                await stream.close()
+        if "max_tokens" in kwargs:
+            # affinity is the character key; a stop match ended the reply before any limit
+            tokens = stats.usage.completion_tokens if stats.usage is not None else stats.chunks
+            stopped = matcher is not None and matcher.stopped
+            truncated = finish == "length" if finish is not None or stopped else None
+            self.budget.observe(event, affinity, tokens, kwargs["max_tokens"], truncated)
+        return "".join(full).strip()
+
+    async def _twitter_batch(self, sid: str, rid: str, items: List[Dict[str, Any]]) -> Tuple[int, int]:
+        if len(items) > self.batch_cfg.max_items:
+            raise ValueError(f"Batch has {len(items)} items, limit is {self.batch_cfg.max_items}")
+        user = auth.subject(sid)
+        sem = asyncio.Semaphore(max(1, self.batch_cfg.concurrency))
+
+        async def emit_item(item_id: Any, text: str | None = None, error: Exception | None = None) -> None:
+            payload = {"request_id": rid, "item_id": item_id}
+            if error is None:
+                payload["text"] = text
+            else:
+                payload["message"] = str(error)
+                if isinstance(error, AdmissionRejected):
+                    payload["retry_after"] = error.retry_after
+            await self.sio.emit("rp_twitter_batch_item", payload, to=sid)
+
+        # character key -> [(item_id, prompt)]; the preamble is rendered once per character
+        groups: Dict[str, List[Tuple[Any, str]]] = {}
+        stops: Dict[str, Tuple[str, ...]] = {}
+        invalid = 0
+        for i, item in enumerate(items):
+            item_id = item.get("item_id", i) if isinstance(item, dict) else i
+            try:
+                if not isinstance(item, dict) or not isinstance(item.get("character"), dict):
+                    raise ValueError("Batch item needs a character object")
+                character = item["character"]
+                key = character_key(character)
+                prompt = self.fmt.build_twitter_prompt(character, item.get("previous_mentions", ""), key)
+                item_stops = self._stops(character)
+            except Exception as e:
+                # one bad item gets its own error; the rest of the batch still runs
+                await emit_item(item_id, error=e)
+                invalid += 1
+                continue
+            groups.setdefault(key, []).append((item_id, prompt))
+            stops.setdefault(key, item_stops)
+
+        async def run_item(key: str, item_id: Any, prompt: str) -> int:
+            async with sem:
+                try:
+                    kwargs = self._gen_kwargs("rp_twitter_batch", key)
+                    async with self.admission.admit(user, PRIORITY_BATCH):
+                        text = await self.llm.completion_once(prompt, key, **kwargs)
+                except Exception as e:
+                    await emit_item(item_id, error=e)
+                    return 1
+                self._observe_text("rp_twitter_batch", key, text, kwargs["max_tokens"])
+                await emit_item(item_id, trim_stops(text, stops[key]).strip())
+                return 0
+
+        async def run_group(key: str, entries: List[Tuple[Any, str]]) -> int:
+            async with sem:
+                try:
+                    kwargs = self._gen_kwargs("rp_twitter_batch", key)
+                    # every prompt is a sequence on the backend: one admission slot each
+                    async with self.admission.admit(user, PRIORITY_BATCH, len(entries)):
+                        texts = await self.llm.completion_batch([p for _, p in entries], key, **kwargs)
+                except Exception as e:
+                    for item_id, _ in entries:
+                        await emit_item(item_id, error=e)
+                    return len(entries)
+                for (item_id, _), text in zip(entries, texts):
+                    self._observe_text("rp_twitter_batch", key, text, kwargs["max_tokens"])
+                    await emit_item(item_id, trim_stops(text, stops[key]).strip())
+                return 0
+
+        if self.batch_cfg.mode == "multi":
+            # no request may need more slots than a user can ever hold
+            size = self.admission.clamp(len(items))
+            jobs = [
+                run_group(key, entries[i:i + size])
+                for key, entries in groups.items() for i in range(0, len(entries), size)
+            ]
+        else:
+            jobs = [run_item(key, item_id, prompt) for key, entries in groups.items() for item_id, prompt in entries]
+        failed = invalid + sum(await asyncio.gather(*jobs))
+        return len(items), failed
+
+    def _observe_text(self, event: str, key: str, text: str, max_tokens: int) -> None:
+        # LLMClient replies carry vLLM's finish_reason and, for single prompts,
+        # usage; the text is only re-counted when the length is unknown
+        finish = getattr(text, "finish_reason", None)
+        truncated = finish == "length" if finish is not None else None
+        tokens = getattr(text, "completion_tokens", None)
+        if tokens is None and self.fmt.counter is not None:
+            tokens = self.fmt.counter.count(text)
+        if tokens is None and not truncated:
+            return
+        self.budget.observe(event, key, max_tokens if tokens is None else tokens, max_tokens, truncated)
+
+    def _gen_kwargs(self, event: str, key: str) -> Dict[str, Any]:
+        kwargs = self.budget.kwargs(event, key)
+        if self.stop_cfg.enabled:
+            # <start_of_turn> is a special token and vLLM drops those from the
+            # text by default; keep them so the stop matcher sees a new turn open
+            kwargs["extra_body"] = {**(kwargs.get("extra_body") or {}), "skip_special_tokens": False}
+        return kwargs
+
+    def _stops(self, character: Dict[str, Any]) -> Tuple[str, ...]:
+        return character_stops(character, self._global_stops) if self.stop_cfg.enabled else ()
+
+    async def _emit_error(self, sid: str, rid: str, e: Exception, event: str, **extra) -> None:
+        record_error(event, e)
+        log.warning("%s failed: %s", event, e, extra={"event": event, "error": type(e).__name__})
+        payload = {"request_id": rid, "message": str(e), **extra}
+        if isinstance(e, AdmissionRejected):
+            payload["retry_after"] = e.retry_after
+        await self.sio.emit("rp_error", payload, to=sid)
+
+    def _room_scope(self, sid: str, data: Dict[str, Any]) -> str:
+        # A room is (owner, name). The owner (by default the caller) opens it and
+        # may set its members; anyone else must be one of them.
+        room = data.get("room")
+        members = data.get("members")
+        if members is not None and not isinstance(members, list):
+            raise ValueError("members must be a list of user ids")
+        subject = auth.subject(sid)
+        owner = data.get("owner") or subject
+        scope = room_scope(owner, room)
+        if owner == subject:
+            self.rooms.open(scope, subject, members)
+        elif not self.rooms.allows(scope, subject):
+            raise PermissionError(f"Not a member of room {room!r}")
+        return scope
+
+    async def _room_reply(
+        self, sid: str, rid: str, room: str, scope: str, prompt: str, affinity: str, kwargs: Dict[str, Any],
+        stops: Tuple[str, ...] = (),
+    ) -> str:
+        # One generation for the whole room: frames are broadcast once and kept
+        # in the room's ring buffer for late joiners.
+        target = room_target(scope)
+        stream = self.rooms.start(scope, rid)
+        try:
+            await self.sio.enter_room(sid, target)
+
+            async def emit(text: str) -> None:
+                async with stream.lock:
+                    stream.record(text)
+                    await self.sio.emit("rp_token", {"request_id": rid, "room": room, "token": text}, to=target)
+
+            async with self.admission.admit(auth.subject(sid), PRIORITY_INTERACTIVE):
+                return await self._stream_reply(sid, rid, prompt, affinity, kwargs, "rp_room_start", emit, target, stops)
+        # the starter hears about failures and cancellation from the handler itself
+        except asyncio.CancelledError:
+            await self.sio.emit("rp_cancelled", {"request_id": rid, "room": room}, to=target, skip_sid=sid)
+            raise
+        except Exception as e:
+            await self.sio.emit("rp_error", {"request_id": rid, "room": room, "message": str(e)}, to=target, skip_sid=sid)
+            raise
+        finally:
+            # joiners from here on get the full text with rp_done
+            self.rooms.finish(stream)
+
+    async def _join_room(self, sid: str, room: str, scope: str) -> Dict[str, Any]:
+        target = room_target(scope)
+        stream = self.rooms.get(scope)
+        if stream is None:
+            await self.sio.enter_room(sid, target)
+            return {"status": True, "generating": False}
+        async with stream.lock:
+            await self.sio.enter_room(sid, target)
+            prefix = stream.prefix()
+            if prefix:
+                await self.sio.emit("rp_token", {
+                    "request_id": stream.rid, "room": room, "token": prefix,
+                    "replay": True, "truncated": stream.dropped > 0,
+                }, to=sid)
+        RP_ROOM_LATE_JOINS.inc()
+        return {"status": True, "generating": True, "request_id": stream.rid}
+
+    @asynccontextmanager
+    async def _conversation(
+        self, sid: str, data: Dict[str, Any],
+    ) -> AsyncIterator[Tuple[Dict, List[Dict[str, str]], Optional[Conversation]]]:
+        # Session mode: with a conversation_id the server owns character and history,
+        # so clients only send the new user input.
+        conversation_id = data.get("conversation_id")
+        if not conversation_id:
+            yield data["character"], sanitize_history(data.get("history")), None
+            return
+
+        # ids come from clients: scope them to the user so nobody can open another's conversation
+        key = f"{auth.subject(sid)}:{conversation_id}"
+        async with self._turns.hold(key):
+            stored = await self.sessions.get(key)
+            if stored is None:
+                if not data.get("character"):
+                    raise ValueError(f"Unknown conversation_id {conversation_id!r}; send the character to start it")
+                conv = Conversation(key, data["character"], sanitize_history(data.get("history")))
+            else:
+                # a new card, like the new exchange, is stored only by _remember
+                conv = stored.copy()
+                if data.get("character"):
+                    conv.character = data["character"]
+            yield conv.character, conv.history, conv
+
+    async def _remember(self, conv: Optional[Conversation], user_input: str, reply: str) -> None:
+        if conv is not None:
+            conv.append_exchange(user_input, reply, self.session_cfg.max_turns)
+            await self.sessions.put(conv)
+
     def _register_events(self):
         @self.sio.event
-        async def connect(sid, environ):
+        async def connect(sid, environ, auth_data=None):
+            bind(sid)
             try:
-                print(f"[SIO] TRIES TO CONNECT: {sid}", flush=True)
+                log.debug("connect attempt")
                 auth_header = environ.get("HTTP_AUTHORIZATION")
 
                 if auth_header and auth_header.startswith("Bearer "):
                     token = auth_header.split(" ", 1)[1]
                 else: return False
 
-                response = auth.authenticate(sid, { "token": token })
-                if response.get("status") is False: return False
+                response = await auth.authenticate_async(sid, { "token": token })
+                if response.get("status") is False:
+                    log.info("connect rejected: %s", response.get("message"))
+                    return False
+
+                RP_CONNECTED_SOCKETS.inc()
+                log.info("client connected", extra={"sub": auth.subject(sid)})
 
-                print("Client connected:", sid)
-                print("Successfully authenticated")
+                # clients may name the character up front so its prefix is warm by the first message
+                character = auth_data.get("character") if isinstance(auth_data, dict) else None
+                if character:
+                    try:
+                        self.warmer.warm(character, user=auth.subject(sid))
+                    except Exception as e:
+                        log.warning("warm-up skipped: %s", e)
 
                 return response
             except Exception as e:
-                print(f"Connection error for {sid}: {str(e)}", flush=True)
+                log.exception("connection error")
                 return False
 
+        @self.sio.event
+        async def disconnect(sid, reason=None):
+            RP_CONNECTED_SOCKETS.dec()
+            self.cancel(sid, reason="disconnect")
+            auth.logout(sid)
+
+        @self.sio.on("rp_cancel")
+        @auth.isAuthenticated
+        async def rp_cancel(sid, data):
+            cancelled = self.cancel(sid, (data or {}).get("request_id"), reason="client")
+            return {"status": cancelled > 0}
+
+        @self.sio.on("rp_prepare")
+        @auth.isAuthenticated
+        async def rp_prepare(sid, data):
+            try:
+                result = self.warmer.warm(data["character"], data.get("kind", "manual"), auth.subject(sid))
+            except Exception as e:
+                return {"status": False, "message": str(e)}
+            return {"status": True, "result": result}
+
         @self.sio.on("rp_start")
         @auth.isAuthenticated
+        @timed("rp_start")
+        @self._cancellable
         async def rp_start(sid, data):
             rid = data.get("request_id", "")
             try:
-                kwargs = self.defaults.as_kwargs()
-                character = data["character"]
                 user_input = data["user_input"]
-                history = sanitize_history(data.get("history"))
-
-                prompt = self.fmt.build_manual_prompt(character, history, user_input)
-                stream = await self.llm.stream_completion(prompt, **kwargs)
+                async with self._conversation(sid, data) as (character, history, conv):
+                    key = character_key(character)
+                    kwargs = self._gen_kwargs("rp_start", key)
+                    history = self.fmt.fit_history(character, history, user_input, kwargs["max_tokens"], key)
 
-                full = []
-                async for chunk in stream:
-                    tok = chunk.choices[0].text if (chunk.choices and chunk.choices[0].text) else None
-                    if tok:
-                        full.append(tok)
-                        await self.sio.emit("rp_token", {"request_id": rid, "token": tok}, to=sid)
-                await self.sio.emit("rp_done", {"request_id": rid, "text": "".join(full).strip()}, to=sid)
+                    prompt = self.fmt.build_manual_prompt(character, history, user_input, key)
+                    async with self.admission.admit(auth.subject(sid), PRIORITY_INTERACTIVE):
+                        text = await self._stream_reply(sid, rid, prompt, key, kwargs, stops=self._stops(character))
+                    await self.sio.emit("rp_done", {"request_id": rid, "text": text}, to=sid)
+                    await self._remember(conv, user_input, text)
 
             except Exception as e:
-                await self.sio.emit("rp_error", {"request_id": rid, "message": str(e)}, to=sid)
+                await self._emit_error(sid, rid, e, "rp_start")
 
         @self.sio.on("rp_once")
         @auth.isAuthenticated
+        @timed("rp_once")
+        @self._cancellable
         async def rp_once(sid, data):
             rid = data.get("request_id", "")
             try:
-                kwargs = self.defaults.as_kwargs()
-                character = data["character"]
                 user_input = data["user_input"]
-                history = sanitize_history(data.get("history"))
+                async with self._conversation(sid, data) as (character, history, conv):
+                    key = character_key(character)
+                    kwargs = self._gen_kwargs("rp_once", key)
+                    history = self.fmt.fit_history(character, history, user_input, kwargs["max_tokens"], key)
 
-                prompt = self.fmt.build_manual_prompt(character, history, user_input)
-                text = await self.llm.completion_once(prompt, **kwargs)
-                await self.sio.emit("rp_once_result", {"request_id": rid, "text": text}, to=sid)
+                    prompt = self.fmt.build_manual_prompt(character, history, user_input, key)
+                    async with self.admission.admit(auth.subject(sid), PRIORITY_INTERACTIVE):
+                        text = await self.llm.completion_once(prompt, key, **kwargs)
+                    self._observe_text("rp_once", key, text, kwargs["max_tokens"])
+                    text = trim_stops(text, self._stops(character)).strip()
+                    await self.sio.emit("rp_once_result", {"request_id": rid, "text": text}, to=sid)
+                    await self._remember(conv, user_input, text)
 
             except Exception as e:
-                await self.sio.emit("rp_error", {"request_id": rid, "message": str(e)}, to=sid)
+                await self._emit_error(sid, rid, e, "rp_once")
 
         @self.sio.on("rp_twitter")
         @auth.isAuthenticated
+        @timed("rp_twitter")
+        @self._cancellable
         async def rp_twitter(sid, data):
             rid = data.get("request_id", "")
             try:
-                kwargs = self.defaults.as_kwargs()
                 character = data["character"]
+                key = character_key(character)
+                kwargs = self._gen_kwargs("rp_twitter", key)
                 previous_mentions = data.get("previous_mentions", "")
 
-                prompt = self.fmt.build_twitter_prompt(character, previous_mentions)
-                text = await self.llm.completion_once(prompt, **kwargs)
+                prompt = self.fmt.build_twitter_prompt(character, previous_mentions, key)
+                async with self.admission.admit(auth.subject(sid), PRIORITY_BATCH):
+                    text = await self.llm.completion_once(prompt, key, **kwargs)
+                self._observe_text("rp_twitter", key, text, kwargs["max_tokens"])
+                text = trim_stops(text, self._stops(character)).strip()
                 await self.sio.emit("rp_twitter_result", {"request_id": rid, "text": text}, to=sid)
 
             except Exception as e:
-                await self.sio.emit("rp_error", {"request_id": rid, "message": str(e)}, to=sid)
+                await self._emit_error(sid, rid, e, "rp_twitter")
+
+        @self.sio.on("rp_twitter_batch")
+        @auth.isAuthenticated
+        @timed("rp_twitter_batch")
+        @self._cancellable
+        async def rp_twitter_batch(sid, data):
+            rid = data.get("request_id", "")
+            try:
+                count, failed = await self._twitter_batch(sid, rid, data.get("items") or [])
+                await self.sio.emit("rp_twitter_batch_done", {"request_id": rid, "count": count, "failed": failed}, to=sid)
+
+            except Exception as e:
+                await self._emit_error(sid, rid, e, "rp_twitter_batch")
+
+        @self.sio.on("rp_room_join")
+        @auth.isAuthenticated
+        async def rp_room_join(sid, data):
+            data = data or {}
+            room = data.get("room")
+            if not room:
+                return {"status": False, "message": "room is required"}
+            try:
+                scope = self._room_scope(sid, data)
+            except (PermissionError, ValueError) as e:
+                return {"status": False, "message": str(e)}
+            return await self._join_room(sid, room, scope)
+
+        @self.sio.on("rp_room_leave")
+        @auth.isAuthenticated
+        async def rp_room_leave(sid, data):
+            data = data or {}
+            room = data.get("room")
+            if room:
+                owner = data.get("owner") or auth.subject(sid)
+                await self.sio.leave_room(sid, room_target(room_scope(owner, room)))
+            return {"status": bool(room)}
+
+        @self.sio.on("rp_room_start")
+        @auth.isAuthenticated
+        @timed("rp_room_start")
+        @self._cancellable
+        async def rp_room_start(sid, data):
+            rid = data.get("request_id", "")
+            room = data.get("room")
+            try:
+                if not room:
+                    raise ValueError("room is required")
+                scope = self._room_scope(sid, data)
+                user_input = data["user_input"]
+                async with self._conversation(sid, data) as (character, history, conv):
+                    key = character_key(character)
+                    kwargs = self._gen_kwargs("rp_room_start", key)
+                    history = self.fmt.fit_history(character, history, user_input, kwargs["max_tokens"], key)
+
+                    prompt = self.fmt.build_manual_prompt(character, history, user_input, key)
+                    text = await self._room_reply(sid, rid, room, scope, prompt, key, kwargs, self._stops(character))
+                    await self.sio.emit("rp_done", {"request_id": rid, "room": room, "text": text}, to=room_target(scope))
+                    await self._remember(conv, user_input, text)
+
+            except Exception as e:
+                await self._emit_error(sid, rid, e, "rp_room_start", room=room)
 
 def create_app() -> socketio.ASGIApp:
+    log_cfg = LogConfig()
     cfg = ModelConfig()
+    cache_cfg = CacheConfig()
+    prompt_cfg = PromptConfig()
+    session_cfg = SessionConfig()
 
-    llm = LLMClient(cfg)
+    response_cache = None
+    if cache_cfg.response_ttl > 0:
+        response_cache = LRUCache(cache_cfg.response_size, cache_cfg.response_ttl, name="response")
+    counter = TokenCounter.load(cache=LRUCache(cache_cfg.token_count_size, name="token_count"))
+    encoder = None
+    if counter.tokenizer is not None:
+        encoder = PromptEncoder(counter.tokenizer, LRUCache(cache_cfg.segment_size, name="prompt_segments"))
+    llm = LLMClient(cfg, dedup=cache_cfg.dedup, response_cache=response_cache, encoder=encoder)
     defaults = GenDefaults()
-    formatter = RPFormatter(PromptManager())
+    preamble_cache = LRUCache(cache_cfg.preamble_size, cache_cfg.preamble_ttl, name="preamble")
+    pm = PromptManager()
+    history = HistoryRenderer(pm.turn_block, maxsize=cache_cfg.history_size)
+    chat = ChatTemplate.from_tokenizer(counter.tokenizer) if prompt_cfg.layout == "chat" else None
+    formatter = RPFormatter(pm, preamble_cache, prompt_cfg.layout, counter, cfg.max_model_len, history, chat)
 
-    server = RPServer(llm, formatter, defaults)
+    sessions = create_session_store(session_cfg)
+    admission = AdmissionController(AdmissionConfig())
+    server = RPServer(
+        llm, formatter, defaults, StreamConfig(), sessions, session_cfg, admission, BatchConfig(), RoomRegistry(RoomConfig()),
+        create_client_manager(ClusterConfig()), PrefixWarmer(llm, formatter, WarmupConfig()), log_cfg, StopConfig(),
+        TokenBudget(defaults, BudgetConfig()),
+    )
     return server.app
 
 app = create_app()
\ No newline at end of file
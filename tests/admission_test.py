@@ -0,0 +1,102 @@
+import asyncio
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+from app.admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionConfig, AdmissionController, AdmissionRejected
+
+def test_global_cap_and_priority_order():
+    async def main():
+        ctl = AdmissionController(AdmissionConfig(max_inflight=1, max_per_user=10, max_queue=10, max_wait=5))
+        order = []
+
+        async def job(name, priority, hold):
+            async with ctl.admit(name, priority):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.create_task(job("first", PRIORITY_INTERACTIVE, 0.02))
+        await asyncio.sleep(0)
+        batch = asyncio.create_task(job("batch", PRIORITY_BATCH, 0))
+        await asyncio.sleep(0)
+        chat = asyncio.create_task(job("chat", PRIORITY_INTERACTIVE, 0))
+        await asyncio.gather(first, batch, chat)
+        return order, ctl.inflight
+
+    order, inflight = asyncio.run(main())
+    assert order == ["first", "chat", "batch"]
+    assert inflight == 0
+
+def test_per_user_limit_lets_other_users_through():
+    async def main():
+        ctl = AdmissionController(AdmissionConfig(max_inflight=4, max_per_user=1, max_queue=10, max_wait=5))
+        release = asyncio.Event()
+        order = []
+
+        async def job(user):
+            async with ctl.admit(user):
+                order.append(user)
+                await release.wait()
+
+        tasks = [asyncio.create_task(job(u)) for u in ("alice", "alice", "bob")]
+        await asyncio.sleep(0.01)
+        snapshot = list(order)
+        release.set()
+        await asyncio.gather(*tasks)
+        return snapshot, order
+
+    snapshot, order = asyncio.run(main())
+    assert snapshot == ["alice", "bob"]
+    assert order == ["alice", "bob", "alice"]
+
+def test_rejects_with_retry_after_when_queue_full():
+    async def main():
+        ctl = AdmissionController(AdmissionConfig(max_inflight=1, max_per_user=5, max_queue=1, max_wait=5))
+        await ctl.acquire("a")
+        waiting = asyncio.create_task(ctl.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as exc:
+            await ctl.acquire("c")
+        ctl.release("a")
+        await waiting
+        ctl.release("b")
+        return exc.value.retry_after, ctl.inflight
+
+    retry_after, inflight = asyncio.run(main())
+    assert retry_after >= 1.0
+    assert inflight == 0
+
+def test_wait_timeout_rejects_and_cleans_queue():
+    async def main():
+        ctl = AdmissionController(AdmissionConfig(max_inflight=1, max_per_user=5, max_queue=5, max_wait=0.01))
+        await ctl.acquire("a")
+        with pytest.raises(AdmissionRejected):
+            await ctl.acquire("b")
+        ctl.release("a")
+        return len(ctl._queue), ctl.inflight
+
+    assert asyncio.run(main()) == (0, 0)
+
+def test_weighted_requests_take_one_slot_each():
+    async def main():
+        ctl = AdmissionController(AdmissionConfig(max_inflight=4, max_per_user=8, max_queue=10, max_wait=5))
+        seen = []
+
+        async def job(user, weight, hold):
+            async with ctl.admit(user, PRIORITY_BATCH, weight):
+                seen.append((user, ctl.inflight))
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(job("a", 3, 0.02), job("b", 2, 0.0), job("c", 1, 0.0))
+        # over the cap: clamped to what one request can ever be granted
+        async with ctl.admit("d", PRIORITY_BATCH, 100):
+            seen.append(("d", ctl.inflight))
+        return seen, ctl.inflight
+
+    seen, inflight = asyncio.run(main())
+    assert seen == [("a", 3), ("c", 4), ("b", 2), ("d", 4)]
+    assert inflight == 0
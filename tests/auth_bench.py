@@ -0,0 +1,88 @@
+# Reconnect-storm microbenchmark for Auth: connects/sec and worst event-loop
+# stall while every client reconnects with its existing token.
+#
+# usage: python tests/auth_bench.py [--users 500] [--connects 20000]
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import jwt
+
+from auth import Auth, SessionRegistry, TokenVerifier
+
+SECRET = "bench-secret-with-at-least-32-bytes!!"
+
+async def storm(name, auth, tokens, connects, use_async=True):
+    lag = 0.0
+    stop = False
+
+    async def ticker():
+        nonlocal lag
+        while not stop:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - t0 - 0.001)
+
+    async def connect(i):
+        data = {"token": tokens[i % len(tokens)]}
+        if use_async:
+            ok = await auth.authenticate_async(f"sid-{i}", data)
+        else:
+            ok = auth.authenticate(f"sid-{i}", data)
+        assert ok["status"], ok
+        auth.logout(f"sid-{i}")
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    t0 = time.perf_counter()
+    for start in range(0, connects, 100):
+        await asyncio.gather(*(connect(i) for i in range(start, min(connects, start + 100))))
+    wall = time.perf_counter() - t0
+    stop = True
+    await tick
+    print(f"{name:<32} {connects / wall:10.0f} connects/s   max loop stall {lag * 1000:7.2f} ms")
+
+def rsa_setup(users):
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+    f = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump({"keys": [{**jwk, "kid": "bench", "alg": "RS256", "use": "sig"}]}, f)
+    f.close()
+    tokens = [
+        jwt.encode({"sub": f"user-{u}", "exp": int(time.time()) + 3600}, key, algorithm="RS256", headers={"kid": "bench"})
+        for u in range(users)
+    ]
+    return f.name, tokens
+
+async def main(users, connects):
+    hs_tokens = [jwt.encode({"sub": f"user-{u}", "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256") for u in range(users)]
+    await storm("HS256 no cache (baseline)", Auth(SessionRegistry(), TokenVerifier(SECRET, ["HS256"], cache_size=0)), hs_tokens, connects, use_async=False)
+    await storm("HS256 cached", Auth(SessionRegistry(), TokenVerifier(SECRET, ["HS256"])), hs_tokens, connects)
+
+    try:
+        jwks, rs_tokens = rsa_setup(users)
+    except ImportError:
+        print("RS256 skipped (install PyJWT[crypto])")
+        return
+    rs_connects = max(users, connects // 10)
+    await storm("RS256 on loop, no cache", Auth(SessionRegistry(), TokenVerifier(None, ["RS256"], jwks, cache_size=0)), rs_tokens, rs_connects, use_async=False)
+    await storm("RS256 off loop, no cache", Auth(SessionRegistry(), TokenVerifier(None, ["RS256"], jwks, cache_size=0)), rs_tokens, rs_connects)
+    await storm("RS256 off loop, cached", Auth(SessionRegistry(), TokenVerifier(None, ["RS256"], jwks)), rs_tokens, rs_connects)
+    os.unlink(jwks)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--connects", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.connects))
@@ -0,0 +1,67 @@
+import time
+import tracemalloc
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import jwt
+
+import auth as auth_module
+from auth import Auth, SessionRegistry
+
+SECRET = "test-secret-with-at-least-32-bytes!!"
+auth_module.JWT_SECRET = SECRET
+
+def token(**claims):
+    return jwt.encode({"sub": "user-1", **claims}, SECRET, algorithm="HS256")
+
+def test_session_lifecycle():
+    a = Auth(SessionRegistry())
+    assert a.authenticate("sid-1", {"token": token()})["status"]
+    assert "sid-1" in a.sessions
+    assert a.subject("sid-1") == "user-1"
+    a.logout("sid-1")
+    assert "sid-1" not in a.sessions
+    assert a.subject("sid-1") == "sid-1"
+
+def test_expired_sessions_are_rejected_and_swept():
+    a = Auth(SessionRegistry())
+    a.authenticate("short", {"token": token(exp=int(time.time()) + 60)})
+    a.authenticate("long", {"token": token(exp=int(time.time()) + 3600)})
+    a.authenticate("forever", {"token": token()})
+    assert a.sessions.sweep(now=time.time() + 120) == 1
+    assert len(a.sessions) == 2
+    a.sessions.add("stale", {"exp": time.time() - 1})
+    assert "stale" not in a.sessions
+
+def test_registry_is_bounded():
+    registry = SessionRegistry(max_sessions=100)
+    for i in range(1000):
+        registry.add(f"sid-{i}", {"sub": "u"})
+    assert len(registry) == 100
+    assert "sid-999" in registry and "sid-0" not in registry
+
+def test_connect_disconnect_soak_keeps_memory_flat():
+    a = Auth(SessionRegistry())
+    tok = token(exp=int(time.time()) + 3600)
+
+    def churn(start, n):
+        for i in range(start, start + n):
+            sid = f"sid-{i}"
+            a.authenticate(sid, {"token": tok})
+            if i % 10:
+                a.logout(sid)
+        a.sessions.sweep(now=time.time() + 7200)
+
+    churn(0, 2000)  # warm up allocator and caches
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    churn(2000, 20000)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    assert len(a.sessions) == 0
+    assert growth < 256 * 1024
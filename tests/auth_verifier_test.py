@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import jwt
+import pytest
+
+from auth import Auth, SessionRegistry, TokenVerifier
+
+SECRET = "test-secret-with-at-least-32-bytes!!"
+
+def test_verified_tokens_are_cached(monkeypatch):
+    verifier = TokenVerifier(SECRET, ["HS256"])
+    a = Auth(SessionRegistry(), verifier)
+    tok = jwt.encode({"sub": "u1", "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+
+    calls = []
+    decode = jwt.decode
+    monkeypatch.setattr(jwt, "decode", lambda *args, **kw: calls.append(1) or decode(*args, **kw))
+    for i in range(5):
+        assert a.authenticate(f"sid-{i}", {"token": tok})["status"]
+    assert len(calls) == 1
+    assert a.subject("sid-4") == "u1"
+
+def test_cache_entry_does_not_outlive_token(monkeypatch):
+    import app.cache
+
+    verifier = TokenVerifier(SECRET, ["HS256"], cache_ttl=300)
+    tok = jwt.encode({"sub": "u1", "exp": int(time.time()) + 10}, SECRET, algorithm="HS256")
+    assert verifier.verify(tok)["sub"] == "u1"
+    assert verifier.cached(tok) is not None
+
+    later = time.monotonic() + 11
+    monkeypatch.setattr(app.cache.time, "monotonic", lambda: later)
+    assert verifier.cached(tok) is None
+
+def test_invalid_tokens_are_not_cached():
+    a = Auth(SessionRegistry(), TokenVerifier(SECRET, ["HS256"]))
+    bad = jwt.encode({"sub": "u1"}, "another-secret-with-at-least-32-bytes", algorithm="HS256")
+    assert a.authenticate("sid", {"token": bad}) == {"status": False, "message": "Invalid token"}
+    assert a.verifier.cached(bad) is None
+
+def test_jwks_key_lookup_off_loop(tmp_path):
+    pytest.importorskip("cryptography")
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    keys, jwks = {}, {"keys": []}
+    for kid in ("k1", "k2"):
+        keys[kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(keys[kid].public_key()))
+        jwks["keys"].append({**jwk, "kid": kid, "alg": "RS256", "use": "sig"})
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps(jwks))
+
+    a = Auth(SessionRegistry(), TokenVerifier(algorithms=["RS256"], jwks_file=str(path)))
+    good = jwt.encode({"sub": "u2"}, keys["k2"], algorithm="RS256", headers={"kid": "k2"})
+    wrong = jwt.encode({"sub": "u2"}, keys["k1"], algorithm="RS256", headers={"kid": "k2"})
+    unknown = jwt.encode({"sub": "u2"}, keys["k1"], algorithm="RS256", headers={"kid": "nope"})
+
+    async def main():
+        return [await a.authenticate_async(sid, {"token": t}) for sid, t in (("s1", good), ("s2", wrong), ("s3", unknown))]
+
+    ok, bad_sig, bad_kid = asyncio.run(main())
+    assert ok["status"] and a.subject("s1") == "u2"
+    assert not bad_sig["status"] and not bad_kid["status"]
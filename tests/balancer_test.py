@@ -0,0 +1,91 @@
+import asyncio
+import json
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import httpx
+
+from app.ai import LLMClient, ModelConfig
+from app.balancer import Backend, BackendPool
+
+def pool(n, **kw):
+    return BackendPool([Backend(f"http://replica-{i}:4001/v1", client=None) for i in range(n)], **kw)
+
+def test_affinity_is_sticky_until_backend_is_much_busier():
+    p = pool(3, sticky_slack=2)
+    owner = p.candidates("iron-man")[0]
+    assert all(p.candidates("iron-man")[0] is owner for _ in range(5))
+
+    owner.outstanding = 2
+    assert p.candidates("iron-man")[0] is owner
+    owner.outstanding = 3
+    assert p.candidates("iron-man")[0] is not owner
+
+def test_unhealthy_backends_are_skipped_but_kept_as_last_resort():
+    p = pool(2)
+    a, b = p.backends
+    a.healthy = False
+    assert p.candidates()[0] is b
+    assert p.candidates()[-1] is a
+    b.healthy = False
+    assert len(p.candidates()) == 2
+
+def test_kv_cache_policy_prefers_emptier_cache():
+    p = pool(2, policy="kv_cache")
+    a, b = p.backends
+    a.kv_cache_usage, b.kv_cache_usage = 0.9, 0.1
+    assert p.candidates()[0] is b
+
+def sse(*texts):
+    chunks = [
+        {"id": "x", "object": "text_completion", "created": 0, "model": "m",
+         "choices": [{"index": 0, "text": t, "logprobs": None, "finish_reason": None}]}
+        for t in texts
+    ]
+    return "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+
+def test_stream_fails_over_before_start_and_releases_slot():
+    def handler(request: httpx.Request):
+        if request.url.host == "down":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, text=sse("Hel", "lo"), headers={"content-type": "text/event-stream"})
+
+    async def main():
+        http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        cfg = ModelConfig(base_urls="http://down/v1,http://up/v1", max_retries=0)
+        llm = LLMClient(cfg, http_client=http)
+        down, up = llm.pool.backends
+        up.outstanding = 10  # make "down" the least loaded so it is tried first
+
+        stream = await llm.stream_completion("hi", max_tokens=4)
+        assert up.outstanding == 11
+        text = "".join([c.choices[0].text async for c in stream])
+        return text, down.healthy, down.outstanding, up.outstanding
+
+    text, down_healthy, down_out, up_out = asyncio.run(main())
+    assert text == "Hello"
+    assert not down_healthy
+    assert (down_out, up_out) == (0, 10)
+
+def test_timeout_leaves_backend_healthy():
+    def handler(request: httpx.Request):
+        if request.url.host == "slow":
+            raise httpx.ReadTimeout("read timed out", request=request)
+        return httpx.Response(200, text=sse("ok"), headers={"content-type": "text/event-stream"})
+
+    async def main():
+        http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        llm = LLMClient(ModelConfig(base_urls="http://slow/v1,http://up/v1", max_retries=0), http_client=http)
+        slow, up = llm.pool.backends
+        up.outstanding = 10
+        try:
+            await llm.stream_completion("hi", max_tokens=4)
+        except Exception as e:
+            error = e
+        llm._mark_down(slow, error)
+        return type(error).__name__, slow.healthy, slow.outstanding
+
+    assert asyncio.run(main()) == ("APITimeoutError", True, 0)
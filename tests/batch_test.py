@@ -0,0 +1,73 @@
+import asyncio
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+import server as srv
+from app.ai import BatchConfig, GenDefaults, RPFormatter
+from app.prompts import PromptManager
+
+class FakeLLM:
+    async def completion_once(self, prompt, affinity=None, **kwargs):
+        return "reply"
+
+    async def completion_batch(self, prompts, affinity=None, **kwargs):
+        return ["reply"] * len(prompts)
+
+@pytest.mark.parametrize("mode", ["fanout", "multi"])
+def test_malformed_items_fail_alone(mode):
+    async def main():
+        server = srv.RPServer(FakeLLM(), RPFormatter(PromptManager()), GenDefaults(), batch_cfg=BatchConfig(mode=mode))
+        items = {}
+
+        async def emit(event, data, to=None, **kw):
+            items[data["item_id"]] = data
+
+        server.sio.emit = emit
+        result = await server._twitter_batch("sid", "r1", [
+            {"item_id": "ok", "character": {"name": "A"}},
+            "not an item",
+            {"item_id": "no-character"},
+            {"item_id": "bad-character", "character": "A"},
+        ])
+        return result, items
+
+    (count, failed), items = asyncio.run(main())
+    assert (count, failed) == (4, 3)
+    assert items["ok"]["text"] == "reply"
+    for item_id in (1, "no-character", "bad-character"):
+        assert "message" in items[item_id] and "text" not in items[item_id]
+
+def test_multi_mode_takes_a_slot_per_prompt():
+    from app.admission import AdmissionConfig, AdmissionController
+
+    class CountingLLM(FakeLLM):
+        def __init__(self, admission):
+            self.admission = admission
+            self.calls = []
+
+        async def completion_batch(self, prompts, affinity=None, **kwargs):
+            self.calls.append((len(prompts), self.admission.inflight))
+            return await super().completion_batch(prompts, affinity, **kwargs)
+
+    async def main():
+        admission = AdmissionController(AdmissionConfig(max_inflight=64, max_per_user=4))
+        llm = CountingLLM(admission)
+        server = srv.RPServer(
+            llm, RPFormatter(PromptManager()), GenDefaults(), admission=admission, batch_cfg=BatchConfig(mode="multi", concurrency=1),
+        )
+
+        async def emit(event, data, to=None, **kw):
+            pass
+
+        server.sio.emit = emit
+        result = await server._twitter_batch("sid", "r1", [{"character": {"name": "A"}} for _ in range(6)])
+        return result, llm.calls
+
+    result, calls = asyncio.run(main())
+    assert result == (6, 0)
+    assert calls == [(4, 4), (2, 2)]
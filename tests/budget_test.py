@@ -0,0 +1,121 @@
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.ai import GenDefaults
+from app.budget import BudgetConfig, TokenBudget
+
+def _budget(**kw):
+    cfg = dict(start_tokens=512, once_tokens=400, twitter_tokens=160, learn=True, percentile=0.9,
+               headroom=1.25, min_tokens=64, min_samples=10, window=50, max_characters=8)
+    cfg.update(kw)
+    return TokenBudget(GenDefaults(), BudgetConfig(**cfg))
+
+def test_profiles_per_endpoint():
+    budget = _budget(learn=False)
+    assert budget.kwargs("rp_start")["max_tokens"] == 512
+    assert budget.kwargs("rp_room_start")["max_tokens"] == 512
+    assert budget.kwargs("rp_once")["max_tokens"] == 400
+    assert budget.kwargs("rp_twitter", "char")["max_tokens"] == 160
+    # unknown events keep the generation defaults
+    assert budget.kwargs("other")["max_tokens"] == GenDefaults().max_tokens
+    assert budget.kwargs("rp_start")["temperature"] == GenDefaults().temperature
+
+def test_learns_percentile_with_headroom_after_min_samples():
+    budget = _budget()
+    for n in range(1, 10):
+        budget.observe("rp_start", "char", 80 + n, 512)
+    assert budget.max_tokens("rp_start", "char") == 512
+    budget.observe("rp_start", "char", 100, 512)
+    # p90 of 81..89,100 is 100 -> 125
+    assert budget.max_tokens("rp_start", "char") == 125
+    # rooms share the rp_start profile; other characters and profiles are unaffected
+    assert budget.max_tokens("rp_room_start", "char") == 125
+    assert budget.max_tokens("rp_start", "other") == 512
+    assert budget.max_tokens("rp_once", "char") == 400
+
+def test_budget_is_clamped():
+    budget = _budget()
+    for _ in range(10):
+        budget.observe("rp_twitter", "short", 5, 160)
+        budget.observe("rp_twitter", "long", 150, 160)
+    assert budget.max_tokens("rp_twitter", "short") == 64
+    assert budget.max_tokens("rp_twitter", "long") == 160
+
+def test_truncation_raises_the_budget_again():
+    budget = _budget()
+    for _ in range(10):
+        budget.observe("rp_start", "char", 60, 512)
+    assert budget.max_tokens("rp_start", "char") == 75
+    for _ in range(2):
+        budget.observe("rp_start", "char", 75, 75)
+    assert budget.max_tokens("rp_start", "char") == 512
+
+def test_prompt_building_reuses_the_request_character_key(monkeypatch):
+    import app.ai as ai
+    from app.prompts import PromptManager
+    from app.tokenizer import TokenCounter
+
+    character = {"name": "A", "description": "Test."}
+    key = ai.character_key(character)
+    calls = []
+    monkeypatch.setattr(ai, "character_key", lambda c: calls.append(c) or key)
+    fmt = ai.RPFormatter(PromptManager(), counter=TokenCounter(None))
+    history = fmt.fit_history(character, [], "hi", 128, key)
+    fmt.build_manual_prompt(character, history, "hi", key)
+    fmt.build_twitter_prompt(character, "@a hi", key)
+    assert calls == []
+
+def test_truncation_comes_from_finish_reason():
+    budget = _budget()
+    for _ in range(10):
+        budget.observe("rp_start", "char", 60, 512)
+    assert budget.max_tokens("rp_start", "char") == 75
+    # a reply exactly at its budget that ended on its own is not truncated
+    budget.observe("rp_start", "char", 75, 75, truncated=False)
+    assert budget.max_tokens("rp_start", "char") == 75
+    for _ in range(2):
+        budget.observe("rp_start", "char", 70, 75, truncated=True)
+    assert budget.max_tokens("rp_start", "char") == 512
+
+def test_server_reads_finish_reason_and_usage():
+    import asyncio
+    import httpx
+    import server as srv
+    from app.ai import LLMClient, ModelConfig, RPFormatter
+    from app.prompts import PromptManager
+    from app.streaming import StreamConfig
+    from app.stops import StopConfig
+    from fake_vllm import create_fake_app
+
+    seen = []
+
+    async def main(script, max_tokens, stream):
+        app = create_fake_app(ttft=0, tokens_per_sec=0, script=script)
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+        llm = LLMClient(ModelConfig(base_url="http://vllm/v1"), http_client=http)
+        server = srv.RPServer(llm, RPFormatter(PromptManager()), GenDefaults(), StreamConfig(coalesce_ms=0), stop_cfg=StopConfig())
+        server.budget.observe = lambda event, key, tokens, max_tokens, truncated=None: seen.append((tokens, truncated))
+        kwargs = dict(server._gen_kwargs("rp_start", "key"), max_tokens=max_tokens)
+
+        async def emit(text):
+            pass
+
+        if stream:
+            await server._stream_reply("sid", "r1", "prompt", "key", kwargs, emit=emit, stops=server._stops({}))
+        else:
+            text = await llm.completion_once("prompt", **kwargs)
+            server._observe_text("rp_once", "key", text, max_tokens)
+        await http.aclose()
+
+    for stream in (True, False):
+        seen.clear()
+        asyncio.run(main(["a"] * 6, 4, stream))
+        asyncio.run(main(["a"] * 4, 4, stream))
+        assert seen == [(4, True), (4, False)], stream
+    # a stop match closes the stream before vLLM reports why it finished
+    seen.clear()
+    asyncio.run(main(["a", "b", "<start_of_turn>"] + ["c"] * 10, 8, True))
+    assert seen[0][1] is False
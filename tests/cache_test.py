@@ -0,0 +1,50 @@
+import time
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.cache import LRUCache
+from app.ai import RPFormatter, character_key
+from app.prompts import PromptManager
+
+CHARACTER = {
+    "name": "Iron Man",
+    "description": "Billionaire genius inventor.",
+    "personality": "Witty, confident.",
+    "speakingStyle": "Fast-paced and sarcastic.",
+    "samples": ["I am Iron Man."],
+}
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, name="test-lru")
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+def test_ttl_expires_entries():
+    cache = LRUCache(maxsize=4, ttl=0.01, name="test-ttl")
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+def test_character_key_is_stable_across_field_spellings():
+    snake = dict(CHARACTER)
+    snake["speaking_style"] = snake.pop("speakingStyle")
+    assert character_key(CHARACTER) == character_key(dict(reversed(list(snake.items()))))
+    assert character_key(CHARACTER) != character_key({**CHARACTER, "name": "Tony"})
+
+def test_formatter_reuses_cached_preamble():
+    fmt = RPFormatter(PromptManager(), LRUCache(maxsize=8, name="test-preamble"))
+    first = fmt.build_manual_prompt(CHARACTER, [], "Hi")
+    second = fmt.build_manual_prompt(dict(CHARACTER), [], "Hi")
+    fmt.build_twitter_prompt(CHARACTER, "@stark hey")
+    fmt.build_twitter_prompt(CHARACTER, "@stark again")
+    assert first == second
+    assert fmt.cache.hits == 2 and fmt.cache.misses == 2
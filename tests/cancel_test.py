@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import server as srv
+from app.ai import GenDefaults, RPFormatter
+from app.prompts import PromptManager
+
+def _server():
+    return srv.RPServer(None, RPFormatter(PromptManager()), GenDefaults())
+
+def test_requests_without_request_id_are_all_cancelled_on_disconnect():
+    async def main():
+        server = _server()
+        started, cancelled = [], []
+
+        @server._cancellable
+        async def handler(sid, data):
+            started.append(data)
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(data)
+                raise
+
+        tasks = [asyncio.create_task(handler("s1", {"n": n})) for n in range(2)]
+        while len(started) < 2:
+            await asyncio.sleep(0)
+        tracked = len(server._generations["s1"][""])
+        count = server.cancel("s1", reason="disconnect")
+        await asyncio.gather(*tasks)
+        return tracked, count, cancelled, server._generations
+
+    tracked, count, cancelled, generations = asyncio.run(main())
+    assert tracked == 2 and count == 2
+    assert sorted(d["n"] for d in cancelled) == [0, 1]
+    assert generations == {}
+
+def test_finished_request_does_not_untrack_its_twin():
+    async def main():
+        server = _server()
+        release = asyncio.Event()
+
+        @server._cancellable
+        async def handler(sid, data):
+            if data["wait"]:
+                await asyncio.Event().wait()
+            else:
+                await release.wait()
+
+        waiting = asyncio.create_task(handler("s1", {"request_id": "r", "wait": True}))
+        quick = asyncio.create_task(handler("s1", {"request_id": "r", "wait": False}))
+        await asyncio.sleep(0)
+        release.set()
+        await quick
+        left = len(server._generations["s1"]["r"])
+        count = server.cancel("s1", "r", reason="server")
+        await waiting
+        return left, count, server._generations
+
+    left, count, generations = asyncio.run(main())
+    assert left == 1 and count == 1
+    assert generations == {}
+
+def test_cancel_counts_only_tasks_it_cancelled():
+    async def main():
+        server = _server()
+        done = asyncio.get_running_loop().create_future()
+        done.set_result(None)
+        running = asyncio.create_task(asyncio.Event().wait())
+        await asyncio.sleep(0)
+        # a finished task still tracked, e.g. between completion and its cleanup
+        server._generations["s1"] = {"r": {done, running}}
+        count = server.cancel("s1", "r")
+        await asyncio.gather(running, return_exceptions=True)
+        return count, running.cancelled()
+
+    assert asyncio.run(main()) == (1, True)
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import httpx
+import pytest
+
+from app.ai import LLMClient, ModelConfig, RPFormatter
+from app.fix_tokenizer import CHAT_TEMPLATE
+from app.prompts import PromptManager
+from app.templates import ChatTemplate, chat_messages
+from app.tokenizer import PromptEncoder
+
+CHARACTER = {"name": "Geralt", "description": "Witcher.", "personality": "Stoic.", "speakingStyle": "Terse.", "samples": ["Hmm."]}
+
+def toy_tokenizer():
+    # word-level tokenizer with Gemma's special tokens, enough to exercise encode and apply_chat_template
+    transformers = pytest.importorskip("transformers")
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    words = ["<pad>", "<eos>", "<bos>", "<unk>", "hi", "yo", "go", "user", "model"]
+    backend = Tokenizer(models.WordLevel({w: i for i, w in enumerate(words)}, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tok = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend, bos_token="<bos>", eos_token="<eos>", unk_token="<unk>", pad_token="<pad>",
+    )
+    tok.add_special_tokens({"additional_special_tokens": ["<start_of_turn>", "<end_of_turn>"]})
+    tok.chat_template = CHAT_TEMPLATE
+    return tok
+
+def test_chat_layout_alternates_turns_and_keeps_prefix():
+    fmt = RPFormatter(PromptManager(), layout="chat")
+    history, prompts = [], []
+    for turn in range(3):
+        prompt = fmt.build_manual_prompt(CHARACTER, history, f"question {turn}")
+        prompts.append(prompt)
+        history = history + [{"role": "user", "content": f"question {turn}"}, {"role": "assistant", "content": f"answer {turn}"}]
+
+    last = prompts[-1]
+    assert not last.startswith("<bos>")
+    assert last.startswith("<start_of_turn>user\n## System Instructions")
+    assert last.count("<start_of_turn>user\n") == 3 and last.count("<start_of_turn>model\n") == 3
+    assert "<start_of_turn>model\nanswer 0<end_of_turn>\n" in last
+    assert last.endswith("<start_of_turn>user\nquestion 2<end_of_turn>\n<start_of_turn>model\n")
+    # each turn's prompt is a prefix of the next one, so vLLM can reuse its KV blocks
+    assert prompts[1].startswith(prompts[0]) and prompts[2].startswith(prompts[1])
+    assert last.startswith(fmt.warmup_prompt(CHARACTER))
+    assert fmt.build_twitter_prompt(CHARACTER, "@a hi").startswith(fmt.warmup_prompt(CHARACTER, "twitter"))
+
+def test_template_rejects_non_alternating_roles():
+    with pytest.raises(ValueError):
+        ChatTemplate().render([{"role": "assistant", "content": "x"}])
+
+def test_render_matches_transformers_apply_chat_template():
+    tok = toy_tokenizer()
+    messages = chat_messages("rules", [{"role": "user", "content": "hi"}, {"role": "assistant", "content": " yo "}], "go")
+    expected = tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    assert tok.bos_token + ChatTemplate.from_tokenizer(tok).render(messages) == expected
+
+def test_token_id_prompts_start_with_a_single_bos():
+    tok = toy_tokenizer()
+    seen = []
+
+    def handler(request):
+        seen.append(json.loads(request.content)["prompt"])
+        return httpx.Response(200, json={
+            "id": "x", "object": "text_completion", "created": 0, "model": "m",
+            "choices": [{"index": 0, "text": "ok", "logprobs": None, "finish_reason": "stop"}],
+        })
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    llm = LLMClient(ModelConfig(base_url="http://vllm/v1", prompt_token_ids=True), http_client=http, encoder=PromptEncoder(tok))
+    prompt = "<start_of_turn>user\nhi<end_of_turn>\n<start_of_turn>model\n"
+    assert asyncio.run(llm.completion_once(prompt, max_tokens=4)) == "ok"
+    ids = seen[0]
+    assert ids[0] == tok.bos_token_id and ids.count(tok.bos_token_id) == 1
+    assert tok.decode(ids[1:]).replace(" ", "") == prompt.replace("\n", "")
+
+def test_broken_tokenizer_template_falls_back_to_builtin():
+    tok = toy_tokenizer()
+    # the pre-fix template: a chained comparison that rejects every user turn
+    tok.chat_template = CHAT_TEMPLATE.replace(
+        '(message["role"] == "user") != (loop.index0 % 2 == 0)', 'message["role"] == "user" != loop.index0 % 2 == 0'
+    )
+    assert tok.chat_template != CHAT_TEMPLATE
+    messages = [{"role": "user", "content": "hi"}]
+    assert ChatTemplate.from_tokenizer(tok).render(messages) == ChatTemplate().render(messages)
@@ -0,0 +1,88 @@
+# Load test for the LLMClient transport against a local fake completions server.
+# Reports p50/p99 latency added on top of the emulated backend time, for the
+# stock AsyncOpenAI client vs LLMClient with the ModelConfig-tuned transport.
+#
+# usage: python tests/client_load_bench.py [--requests 2000] [--concurrency 50 200 500]
+
+import argparse
+import asyncio
+import statistics
+import time
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from openai import AsyncOpenAI
+
+from app.ai import LLMClient, ModelConfig
+from fake_vllm import free_port, start_fake_backend
+
+TTFT = 0.02
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def run(name, once, stream, requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    once_lat, stream_lat = [], []
+
+    async def one(i):
+        async with sem:
+            t0 = time.perf_counter()
+            if i % 2:
+                await once("hello", max_tokens=1)
+                once_lat.append(time.perf_counter() - t0)
+            else:
+                s = await stream("hello", max_tokens=1)
+                async for _ in s:
+                    stream_lat.append(time.perf_counter() - t0)
+                    break
+                await s.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - t0
+    for kind, lat in (("once", once_lat), ("stream", stream_lat)):
+        over = [(x - TTFT) * 1000 for x in lat]
+        print(
+            f"{name:<8} c={concurrency:<4} {kind:<6} n={len(over):<5} "
+            f"p50 +{percentile(over, 0.5):7.2f} ms  p99 +{percentile(over, 0.99):7.2f} ms  "
+            f"mean +{statistics.mean(over):7.2f} ms  {requests / wall:7.0f} req/s"
+        )
+
+async def bench(base_url, requests, concurrency):
+    cfg = ModelConfig(base_url=base_url)
+
+    stock = AsyncOpenAI(base_url=base_url, api_key="EMPTY")
+    async def stock_once(prompt, **kw):
+        r = await stock.completions.create(model=cfg.model_name, prompt=prompt, **kw)
+        return r.choices[0].text
+    async def stock_stream(prompt, **kw):
+        return await stock.completions.create(model=cfg.model_name, prompt=prompt, stream=True, **kw)
+
+    tuned = LLMClient(cfg)
+    for c in concurrency:
+        await run("stock", stock_once, stock_stream, requests, c)
+        await run("tuned", tuned.completion_once, tuned.stream_completion, requests, c)
+    await stock.close()
+    await tuned.aclose()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500])
+    args = parser.parse_args()
+
+    port = free_port()
+    proc = start_fake_backend(port, ttft=TTFT, tps=0, tokens=1)
+    try:
+        asyncio.run(bench(f"http://127.0.0.1:{port}/v1", args.requests, args.concurrency))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    main()
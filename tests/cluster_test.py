@@ -0,0 +1,47 @@
+import asyncio
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import socketio
+
+from app.cluster import InProcessBus, InProcessManager
+
+def worker(bus):
+    sio = socketio.AsyncServer(async_mode="asgi", client_manager=InProcessManager(bus))
+    sent = []
+
+    async def send(eio_sid, pkt):
+        sent.append(pkt.data)
+
+    sio._send_eio_packet = send
+    return sio, sent
+
+def test_emit_reaches_sockets_on_other_workers():
+    async def main():
+        bus = InProcessBus()
+        (a, a_sent), (b, b_sent) = worker(bus), worker(bus)
+        for sio in (a, b):
+            sio.manager.initialize()
+        published = []
+        a.manager._publish = lambda data, orig=a.manager._publish: published.append(data) or orig(data)
+
+        local = await a.manager.connect("eio-a", "/")
+        remote = await b.manager.connect("eio-b", "/")
+        await a.manager.enter_room(local, "/", "lobby")
+        await b.manager.enter_room(remote, "/", "lobby")
+
+        await a.emit("rp_token", {"token": "local"}, to=local)
+        await a.emit("rp_token", {"token": "remote"}, to=remote)
+        await a.emit("rp_done", {"text": "all"}, to="lobby")
+        await asyncio.sleep(0.05)
+        return a_sent, b_sent, [m["event"] for m in published]
+
+    a_sent, b_sent, published = asyncio.run(main())
+    assert any("local" in p for p in a_sent) and not any("local" in p for p in b_sent)
+    assert any("remote" in p for p in b_sent)
+    assert sum("rp_done" in p for p in a_sent + b_sent) == 2
+    # the local sid was delivered without a pub/sub round trip
+    assert published == ["rp_token", "rp_done"]
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+from socketio import packet
+
+import server as srv
+from app.ai import GenDefaults, RPFormatter
+from app.codec import EventTemplate, OrjsonCodec, json_codec, orjson
+from app.prompts import PromptManager
+from app.streaming import StreamConfig
+
+CODECS = [json] + ([OrjsonCodec] if orjson is not None else [])
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_template_matches_socketio_encoding(codec, monkeypatch):
+    # AsyncServer(json=...) installs the codec on the packet class
+    monkeypatch.setattr(packet.Packet, "json", codec)
+    template = EventTemplate(codec, "rp_token", {"request_id": 'r"1'}, "token")
+    for token in ["Hello", ' "quoted"\n', "héllo ☃", "\\", ""]:
+        expected = packet.Packet(packet.EVENT, data=["rp_token", {"request_id": 'r"1', "token": token}]).encode()
+        assert template.encode(token) == expected
+
+def test_codec_selection():
+    assert json_codec("stdlib") is json
+    assert json_codec("auto") is (OrjsonCodec if orjson is not None else json)
+    with pytest.raises(ValueError):
+        json_codec("ujson")
+
+def test_local_sid_uses_template_and_remote_falls_back():
+    async def main():
+        server = srv.RPServer(None, RPFormatter(PromptManager()), GenDefaults(), StreamConfig(json_codec="stdlib"))
+        sent, emitted = [], []
+
+        async def send(eio_sid, data):
+            sent.append((eio_sid, data))
+
+        async def emit(event, data, to=None, **kw):
+            emitted.append((event, data, to))
+
+        server.sio.eio.send = send
+        server.sio.emit = emit
+        sid = await server.sio.manager.connect("eio-1", "/")
+        await server._token_emitter(sid, "r1")("Hi")
+        await server._token_emitter("elsewhere", "r2")("Yo")
+        return sent, emitted
+
+    sent, emitted = asyncio.run(main())
+    assert sent == [("eio-1", '2["rp_token",{"request_id":"r1","token":"Hi"}]')]
+    assert emitted == [("rp_token", {"request_id": "r2", "token": "Yo"}, "elsewhere")]
+
+@pytest.mark.skipif(orjson is None, reason="orjson not installed")
+def test_orjson_codec_matches_json_for_what_it_is_asked():
+    obj = {"b": 1, 2: [True, None], "a": "é", "big": 2 ** 70}
+    compact = json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+    assert OrjsonCodec.dumps(obj, separators=(",", ":")) == compact
+    assert json.loads(OrjsonCodec.dumps(obj)) == json.loads(compact)
+    assert OrjsonCodec.dumps({"b": 1, "a": 2}, sort_keys=True) == '{"a":2,"b":1}'
+    assert OrjsonCodec.dumps({1: "é", None: 0}) == json.dumps({1: "é", None: 0}, separators=(",", ":"), ensure_ascii=False)
+    # options orjson has no equivalent for are served by json
+    assert OrjsonCodec.dumps(obj, indent=2) == json.dumps(obj, indent=2)
+    assert OrjsonCodec.dumps({"a": 1}, separators=(", ", ": ")) == '{"a": 1}'
@@ -0,0 +1,72 @@
+# Microbenchmark: rp_token emits per CPU-second for a socket owned by this
+# process, through the real python-socketio/engineio encode path with the
+# transport write stubbed out. Compares sio.emit vs the pre-encoded packet
+# template, each with the stdlib json module and orjson.
+#
+# usage: python tests/emit_bench.py [--emits 200000]
+
+import argparse
+import asyncio
+import time
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from engineio import packet as eio_packet
+
+import server as srv
+from app.ai import GenDefaults, RPFormatter
+from app.codec import orjson
+from app.prompts import PromptManager
+from app.streaming import StreamConfig
+
+TOKENS = [" Well", ",", " well", ".", " *smirks*", " You're", " back", " again", "?", " Don't", " worry", " — I’m", " fine", "."]
+
+async def run(codec, templates, emits):
+    server = srv.RPServer(
+        None, RPFormatter(PromptManager()), GenDefaults(),
+        StreamConfig(json_codec=codec, token_templates=templates),
+    )
+    server.sio.logger.disabled = True
+    server.sio.eio.logger.disabled = True
+
+    # stop where the engine.io packet would be queued on the websocket;
+    # both paths still build and encode it
+    async def send_eio_packet(eio_sid, pkt):
+        pkt.encode()
+
+    async def eio_send(eio_sid, data):
+        await send_eio_packet(eio_sid, eio_packet.Packet(eio_packet.MESSAGE, data=data))
+
+    server.sio._send_eio_packet = send_eio_packet
+    server.sio.eio.send = eio_send
+    sid = await server.sio.manager.connect("eio-bench", "/")
+    emit = server._token_emitter(sid, "0f8e2a4c9b7d41e6a3c5b2d1e0f9a8b7")
+
+    n = len(TOKENS)
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    for i in range(emits):
+        await emit(TOKENS[i % n])
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    return emits / cpu, emits / wall
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emits", type=int, default=200000)
+    args = parser.parse_args()
+
+    codecs = ["stdlib"] + (["orjson"] if orjson is not None else [])
+    baseline = None
+    for templates in (False, True):
+        for codec in codecs:
+            per_cpu, per_wall = asyncio.run(run(codec, templates, args.emits))
+            baseline = baseline or per_cpu
+            path = "template" if templates else "sio.emit"
+            print(f"{path:<9} {codec:<7} {per_cpu:10.0f} emits/cpu-s  {per_wall:10.0f} emits/s  x{per_cpu / baseline:4.2f}")
+    if orjson is None:
+        print("orjson not installed: stdlib only")
+
+if __name__ == "__main__":
+    main()
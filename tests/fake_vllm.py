@@ -0,0 +1,159 @@
+# Fake OpenAI-compatible completions server for benchmarks and local tests.
+# Emulates vLLM's /v1/completions (streamed and not, single or list prompts)
+# with a configurable time-to-first-token and tokens/sec. No GPU, no network.
+#
+# usage: python tests/fake_vllm.py --port 4101 --ttft 0.05 --tps 50 --tokens 40
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+WORDS = ["Well", ",", " well", ".", " *smirks*", " You", " again", "?", " Fine", " then", "."]
+# Gemma's special tokens: like vLLM, their text is dropped unless skip_special_tokens is false
+SPECIAL = ("<bos>", "<eos>", "<start_of_turn>", "<end_of_turn>")
+
+def create_fake_app(
+    ttft: float = 0.05, tokens_per_sec: float = 50.0, tokens: int = 40, reply: str | None = None, script: list | None = None,
+) -> Starlette:
+    # script: the exact tokens to generate, special tokens included
+    gap = 1.0 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+    stats = {"requests": 0, "prompts": 0, "completion_tokens": 0, "aborted": 0, "last_body": None}
+
+    def pieces(max_tokens: int, skip_special: bool = True):
+        if script is not None:
+            return ["" if skip_special and t in SPECIAL else t for t in script[:max_tokens]]
+        if reply is not None:
+            return [reply][:max_tokens]
+        return [WORDS[i % len(WORDS)] for i in range(min(tokens, max_tokens))]
+
+    def prompt_len(prompt) -> int:
+        return len(prompt) if isinstance(prompt, list) and prompt and isinstance(prompt[0], int) else len(str(prompt).split())
+
+    async def completions(request: Request):
+        body = await request.json()
+        prompts = body.get("prompt")
+        if not (isinstance(prompts, list) and prompts and not isinstance(prompts[0], int)):
+            prompts = [prompts]
+        max_tokens = int(body.get("max_tokens") or 16)
+        skip_special = body.get("skip_special_tokens", True)
+        stats["last_body"] = body
+        stats["requests"] += 1
+        stats["prompts"] += len(prompts)
+        rid, created, model = f"cmpl-{uuid.uuid4().hex}", int(time.time()), body.get("model", "fake")
+        wanted = len(script) if script is not None else 1 if reply is not None else tokens
+        finish = "length" if wanted > max_tokens else "stop"
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + gap * max(0, len(pieces(max_tokens, skip_special)) - 1))
+            choices = [
+                {"index": i, "text": "".join(pieces(max_tokens, skip_special)), "logprobs": None, "finish_reason": finish}
+                for i in range(len(prompts))
+            ]
+            n = len(pieces(max_tokens, skip_special)) * len(prompts)
+            stats["completion_tokens"] += n
+            usage = {"prompt_tokens": sum(prompt_len(p) for p in prompts), "completion_tokens": n}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            return JSONResponse({"id": rid, "object": "text_completion", "created": created, "model": model, "choices": choices, "usage": usage})
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def events():
+            sent = 0
+            try:
+                await asyncio.sleep(ttft)
+                out = pieces(max_tokens, skip_special)
+                for i, piece in enumerate(out):
+                    if i:
+                        await asyncio.sleep(gap)
+                    sent += 1
+                    last = i == len(out) - 1
+                    chunk = {
+                        "id": rid, "object": "text_completion", "created": created, "model": model,
+                        "choices": [{"index": 0, "text": piece, "logprobs": None, "finish_reason": finish if last else None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                if include_usage:
+                    usage = {"prompt_tokens": prompt_len(prompts[0]), "completion_tokens": sent, "total_tokens": prompt_len(prompts[0]) + sent}
+                    chunk = {"id": rid, "object": "text_completion", "created": created, "model": model, "choices": [], "usage": usage}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            except asyncio.CancelledError:
+                stats["aborted"] += 1
+                raise
+            finally:
+                stats["completion_tokens"] += sent
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def models(request: Request):
+        return JSONResponse({"object": "list", "data": [{"id": "fake", "object": "model"}]})
+
+    async def health(request: Request):
+        return Response(status_code=200)
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats)
+
+    app = Starlette(routes=[
+        Route("/v1/completions", completions, methods=["POST"]),
+        Route("/v1/models", models),
+        Route("/health", health),
+        Route("/stats", get_stats),
+    ])
+    app.state.stats = stats
+    return app
+
+# ----------- SUBPROCESS HELPERS -----------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_http(url: str, proc: subprocess.Popen, timeout: float = 20.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process exited with {proc.returncode} before {url} came up")
+        try:
+            if httpx.get(url).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{url} did not come up")
+
+def start_fake_backend(port: int, ttft: float = 0.05, tps: float = 50.0, tokens: int = 40) -> subprocess.Popen:
+    proc = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__),
+        "--port", str(port), "--ttft", str(ttft), "--tps", str(tps), "--tokens", str(tokens),
+    ])
+    wait_http(f"http://127.0.0.1:{port}/health", proc)
+    return proc
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4101)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--tps", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=40)
+    args = parser.parse_args()
+    app = create_fake_app(args.ttft, args.tps, args.tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+from app.ai import RPFormatter, sanitize_history, truncate_history
+from app.prompts import PromptManager
+from app.tokenizer import TokenCounter
+
+CHARACTER = {"name": "Iron Man", "description": "Inventor.", "personality": "Witty.", "speakingStyle": "Fast."}
+
+class WordTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, add_special_tokens=False):
+        self.calls += 1
+        return text.split()
+
+def pairs(n, words=10):
+    hist = []
+    for i in range(n):
+        hist.append({"role": "user", "content": " ".join([f"u{i}"] * words)})
+        hist.append({"role": "assistant", "content": " ".join([f"a{i}"] * words)})
+    return hist
+
+def test_sanitize_history_no_longer_caps_pairs_by_default():
+    assert len(sanitize_history(pairs(25))) == 50
+    assert len(sanitize_history(pairs(25), max_pairs=10)) == 20
+
+def test_truncate_drops_oldest_pairs_to_fit_budget():
+    count = lambda text: len(text.split())
+    hist = pairs(5)  # each turn: 10 words + overhead
+    kept = truncate_history(hist, fixed_tokens=100, budget=100 + 3 * 2 * 16, count=count)
+    assert kept == hist[4:]
+
+def test_truncate_raises_when_nothing_fits():
+    with pytest.raises(ValueError):
+        truncate_history([], fixed_tokens=200, budget=100, count=len)
+
+def test_fit_history_respects_context_and_memoizes_counts():
+    tok = WordTokenizer()
+    fmt = RPFormatter(PromptManager(), counter=TokenCounter(tok), context_len=1200)
+    hist = sanitize_history(pairs(40))
+    kept = fmt.fit_history(CHARACTER, hist, "hello there", max_tokens=256)
+    assert 0 < len(kept) < len(hist) and len(kept) % 2 == 0
+    assert kept == hist[-len(kept):]
+
+    prompt = fmt.build_manual_prompt(CHARACTER, kept, "hello there")
+    assert len(prompt.split()) + 256 <= 1200
+
+    calls = tok.calls
+    new_pair = [{"role": "user", "content": "brand new question"}, {"role": "assistant", "content": "brand new answer"}]
+    fmt.fit_history(CHARACTER, hist + new_pair, "again", max_tokens=256)
+    assert tok.calls - calls <= 3  # only the new pair and the new input are tokenized
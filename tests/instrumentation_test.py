@@ -0,0 +1,66 @@
+import asyncio
+import json
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import httpx
+from prometheus_client import REGISTRY
+from starlette.testclient import TestClient
+
+from app.ai import LLMClient, ModelConfig
+from app.instrumentation import StreamStats
+from app.metrics import metrics_app
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_stream_stats_observe_once_per_stream():
+    before = sample("rp_inter_token_latency_seconds_count", event="test")
+    ttft_before = sample("rp_time_to_first_token_seconds_count", event="test")
+    tokens_before = sample("rp_completion_tokens_total", call="stream")
+
+    with StreamStats("test") as stats:
+        assert sample("rp_active_streams") >= 1
+        for _ in range(50):
+            stats.token()
+
+    assert sample("rp_inter_token_latency_seconds_count", event="test") == before + 1
+    assert sample("rp_time_to_first_token_seconds_count", event="test") == ttft_before + 1
+    # no usage chunk: fall back to the number of streamed chunks
+    assert sample("rp_completion_tokens_total", call="stream") == tokens_before + 50
+
+def test_llm_client_records_usage_and_errors():
+    def handler(request: httpx.Request):
+        body = json.loads(request.content)
+        if body["prompt"] == "fail":
+            return httpx.Response(400, json={"error": {"message": "bad"}})
+        return httpx.Response(200, json={
+            "id": "x", "object": "text_completion", "created": 0, "model": "m",
+            "choices": [{"index": 0, "text": " hi", "logprobs": None, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 7, "completion_tokens": 2, "total_tokens": 9},
+        })
+
+    async def main():
+        llm = LLMClient(ModelConfig(max_retries=0), http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        assert await llm.completion_once("hello") == "hi"
+        try:
+            await llm.completion_once("fail")
+        except Exception:
+            pass
+        await llm.aclose()
+
+    prompt_before = sample("rp_prompt_tokens_total", call="once")
+    errors_before = sample("rp_llm_errors_total", call="once", type="BadRequestError")
+    asyncio.run(main())
+    assert sample("rp_prompt_tokens_total", call="once") == prompt_before + 7
+    assert sample("rp_llm_errors_total", call="once", type="BadRequestError") == errors_before + 1
+
+def test_metrics_route():
+    client = TestClient(metrics_app())
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert "rp_active_streams" in resp.text
+    assert client.get("/other").status_code == 404
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import httpx
+
+from app.ai import LLMClient, ModelConfig
+from app.cache import LRUCache
+
+def completion(*choices):
+    return {
+        "id": "x", "object": "text_completion", "created": 0, "model": "m",
+        "choices": [{"index": i, "text": t, "logprobs": None, "finish_reason": "stop"} for i, t in choices],
+    }
+
+def client(handler, dedup=True, response_cache=None, **cfg):
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return LLMClient(ModelConfig(base_url="http://vllm/v1", **cfg), http_client=http, dedup=dedup, response_cache=response_cache)
+
+def test_completion_batch_maps_choices_by_index():
+    seen = []
+
+    def handler(request):
+        seen.append(json.loads(request.content)["prompt"])
+        return httpx.Response(200, json=completion((1, " second "), (0, "first")))
+
+    texts = asyncio.run(client(handler).completion_batch(["a", "b"], max_tokens=8))
+    assert texts == ["first", "second"]
+    assert seen == [["a", "b"]]
+
+def test_completion_once_retries_transient_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        if len(calls) < 3:
+            return httpx.Response(503, json={"error": "overloaded"})
+        return httpx.Response(200, json=completion((0, "ok")))
+
+    llm = client(handler, max_retries=2, retry_backoff=0.001)
+    assert asyncio.run(llm.completion_once("hi", max_tokens=8)) == "ok"
+    assert len(calls) == 3
+
+def test_completion_once_does_not_retry_client_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(400, json={"error": "bad prompt"})
+
+    llm = client(handler, max_retries=2, retry_backoff=0.001)
+    try:
+        asyncio.run(llm.completion_once("hi", max_tokens=8))
+    except Exception:
+        pass
+    assert len(calls) == 1
+
+def slow_handler(calls, delay=0.05):
+    async def handler(request):
+        calls.append(json.loads(request.content)["prompt"])
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json=completion((0, "reply")))
+    return handler
+
+def test_concurrent_duplicates_share_one_backend_call():
+    calls = []
+    llm = client(slow_handler(calls))
+
+    async def main():
+        return await asyncio.gather(
+            llm.completion_once("same", max_tokens=8),
+            llm.completion_once("same", max_tokens=8),
+            llm.completion_once("same", max_tokens=16),
+        )
+
+    assert asyncio.run(main()) == ["reply"] * 3
+    # different kwargs are a different request
+    assert calls == ["same", "same"]
+    assert not llm._inflight
+
+def test_cancelled_caller_does_not_fail_the_others():
+    calls = []
+    llm = client(slow_handler(calls))
+
+    async def main():
+        first = asyncio.create_task(llm.completion_once("same", max_tokens=8))
+        second = asyncio.create_task(llm.completion_once("same", max_tokens=8))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ("reply", True)
+    assert len(calls) == 1
+
+def test_flight_is_aborted_when_every_caller_cancels():
+    calls = []
+    llm = client(slow_handler(calls, delay=1.0))
+
+    async def main():
+        task = asyncio.create_task(llm.completion_once("same", max_tokens=8))
+        await asyncio.sleep(0.01)
+        flight = llm._inflight[llm.request_key("same", {"max_tokens": 8})]
+        task.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return flight.task.cancelled(), dict(llm._inflight)
+
+    assert asyncio.run(main()) == (True, {})
+
+def test_response_cache_only_for_temperature_zero():
+    calls = []
+    llm = client(slow_handler(calls, delay=0), response_cache=LRUCache(8, ttl=30, name="response_test"))
+
+    async def main():
+        for _ in range(3):
+            await llm.completion_once("det", temperature=0, max_tokens=8)
+            await llm.completion_once("sampled", temperature=0.9, max_tokens=8)
+
+    asyncio.run(main())
+    assert calls.count("det") == 1
+    assert calls.count("sampled") == 3
+
+def test_completion_once_does_not_retry_timeouts():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        raise httpx.ReadTimeout("read timed out", request=request)
+
+    llm = client(handler, max_retries=2, retry_backoff=0.001)
+    try:
+        asyncio.run(llm.completion_once("hi", max_tokens=8))
+    except Exception as e:
+        error = e
+    assert type(error).__name__ == "APITimeoutError"
+    assert len(calls) == 1
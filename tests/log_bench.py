@@ -0,0 +1,89 @@
+# Microbenchmark: per-token server cost of logging on the rp_token path.
+# Streams tokens through the real emit path into a real engine.io socket
+# (queue stubbed) and compares the old setup (logger=True /
+# engineio_logger=True: every packet logged at INFO, synchronously, to a
+# stream) with setup_logging() defaults (socketio/engineio at WARNING, app
+# records handed to a queue listener thread).
+#
+# usage: python tests/log_bench.py [--tokens 100000]
+
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from engineio.async_socket import AsyncSocket
+
+import server as srv
+from app.ai import GenDefaults, RPFormatter
+from app.log import LogConfig, TokenLogSampler, setup_logging, shutdown_logging
+from app.prompts import PromptManager
+from app.streaming import StreamConfig
+
+TOKENS = [" Well", ",", " well", ".", " *smirks*", " You're", " back", " again", "?", " Don't", " worry", "."]
+
+class NullQueue:
+    async def put(self, item):
+        pass
+
+def legacy_logging(path):
+    # what logger=True / engineio_logger=True configured: INFO + a direct stream handler
+    shutdown_logging()
+    root = logging.getLogger()
+    root.handlers[:] = []
+    handler = logging.StreamHandler(open(path, "a", encoding="utf-8"))
+    for name in ("socketio.server", "engineio.server"):
+        logger = logging.getLogger(name)
+        logger.handlers[:] = [handler]
+        logger.setLevel(logging.INFO)
+        logging.getLogger(name.split(".")[0]).setLevel(logging.INFO)
+
+def new_logging(path):
+    for name in ("socketio.server", "engineio.server"):
+        logging.getLogger(name).handlers[:] = []
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    setup_logging(LogConfig(), stream=open(path, "a", encoding="utf-8"))
+
+async def run(tokens):
+    server = srv.RPServer(None, RPFormatter(PromptManager()), GenDefaults(), StreamConfig())
+    eio = server.sio.eio
+    socket = AsyncSocket(eio, "eio-bench")
+    socket.queue = NullQueue()
+    socket.connected = True
+    eio.sockets["eio-bench"] = socket
+    sid = await server.sio.manager.connect("eio-bench", "/")
+    emit = server._token_emitter(sid, "0f8e2a4c9b7d41e6a3c5b2d1e0f9a8b7")
+    sampler = TokenLogSampler(srv.log, server.log_cfg.token_sample)
+
+    n = len(TOKENS)
+    cpu0 = time.process_time()
+    for i in range(tokens):
+        await emit(TOKENS[i % n])
+        if sampler.enabled:
+            sampler.token(i, TOKENS[i % n])
+    return (time.process_time() - cpu0) / tokens * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, configure in (("legacy", legacy_logging), ("queue", new_logging)):
+            path = os.path.join(tmp, f"{name}.log")
+            configure(path)
+            results[name] = asyncio.run(run(args.tokens))
+            shutdown_logging()
+            size = os.path.getsize(path)
+            print(f"{name:<7} {results[name]:7.2f} us/token  log {size / 1e6:7.1f} MB")
+        print(f"speed-up x{results['legacy'] / results['queue']:.2f}")
+
+if __name__ == "__main__":
+    main()
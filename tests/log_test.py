@@ -0,0 +1,79 @@
+import asyncio
+import io
+import json
+import logging
+import queue
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.log import (
+    ContextFilter, DroppingQueueHandler, JsonFormatter, LogConfig, TokenLogSampler, bind, setup_logging, shutdown_logging,
+)
+
+def _record(logger, msg, *args, **extra):
+    return logger.makeRecord(logger.name, logging.INFO, __file__, 0, msg, args, None, extra=extra or None)
+
+def test_context_fields_are_per_task():
+    logger = logging.getLogger("rp.test.ctx")
+    flt, fmt = ContextFilter(), JsonFormatter()
+
+    async def request(sid, rid):
+        bind(sid, rid)
+        await asyncio.sleep(0)
+        record = _record(logger, "done %s", rid, event="rp_start")
+        flt.filter(record)
+        return json.loads(fmt.format(record))
+
+    async def main():
+        return await asyncio.gather(request("s1", "r1"), request("s2", "r2"))
+
+    a, b = asyncio.run(main())
+    assert (a["sid"], a["request_id"], a["msg"], a["event"]) == ("s1", "r1", "done r1", "rp_start")
+    assert (b["sid"], b["request_id"]) == ("s2", "r2")
+    assert a["level"] == "INFO" and a["logger"] == "rp.test.ctx"
+
+def test_queue_handler_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(2))
+    logger = logging.getLogger("rp.test.drop")
+    for i in range(5):
+        handler.handle(_record(logger, "m %d", i))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    # args are resolved before the record crosses to the listener thread
+    assert handler.queue.get_nowait().msg == "m 0"
+
+def test_setup_logging_writes_json_and_quiets_socketio():
+    out = io.StringIO()
+    root = logging.getLogger()
+    saved = (list(root.handlers), root.level)
+    try:
+        setup_logging(LogConfig(level="INFO", sio_level="WARNING", format="json"), stream=out)
+        bind("sid-x", "rid-x")
+        logging.getLogger("rp.test.setup").info("hello", extra={"ms": 1.5})
+        logging.getLogger("engineio.server").info("packet noise")
+        shutdown_logging()  # flushes the listener
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert len(lines) == 1
+        assert lines[0]["msg"] == "hello" and lines[0]["sid"] == "sid-x" and lines[0]["ms"] == 1.5
+    finally:
+        shutdown_logging()
+        root.handlers[:] = saved[0]
+        root.setLevel(saved[1])
+
+def test_token_sampler_only_active_at_debug():
+    logger = logging.getLogger("rp.test.sampler")
+    logger.setLevel(logging.INFO)
+    assert not TokenLogSampler(logger, 1.0).enabled
+    logger.setLevel(logging.DEBUG)
+    assert TokenLogSampler(logger, 1.0).enabled
+    assert not TokenLogSampler(logger, 0.0).enabled
+
+def test_importing_server_leaves_root_logger_alone():
+    # a fresh interpreter, so the check does not depend on what other tests imported
+    import subprocess
+    code = "import logging, server; print(len(logging.getLogger().handlers))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=parent_dir, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "0"
@@ -0,0 +1,101 @@
+# Multi-worker scaling: the same Socket.IO load against `uvicorn --workers N`
+# for several N, reporting rp_token emits/sec received by the clients. Coalescing
+# is off (RP_COALESCE_MS=0), so each token is its own frame while a worker keeps
+# up; once its loop saturates, tokens merge and emits/sec flattens. Clients
+# connect websocket-only, which needs no sticky sessions. Scaling is bounded by
+# the cores available to the run.
+#
+# usage: python tests/multiworker_bench.py [--workers 1 2 4] [--clients 128] [--requests 512]
+
+import argparse
+import asyncio
+import tempfile
+import time
+import uuid
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import jwt
+import socketio
+
+from fake_vllm import free_port, start_fake_backend
+from replay_bench import SECRET, start_server
+
+PAYLOAD = {"character": {"name": "Bench", "description": "A benchmark character."}, "user_input": "Talk to me."}
+
+async def client(idx, url, requests, counts):
+    token = jwt.encode({"sub": f"mw-{idx}", "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+    sio = socketio.AsyncClient()
+    done = asyncio.Event()
+
+    @sio.on("rp_token")
+    async def on_token(msg):
+        counts["frames"] += 1
+
+    @sio.on("rp_done")
+    async def on_done(msg):
+        counts["replies"] += 1
+        done.set()
+
+    @sio.on("rp_error")
+    async def on_error(msg):
+        counts["errors"] += 1
+        counts.setdefault("messages", set()).add(msg.get("message"))
+        done.set()
+
+    await sio.connect(url, headers={"Authorization": f"Bearer {token}"}, transports=["websocket"])
+    try:
+        for _ in range(requests):
+            done.clear()
+            await sio.emit("rp_start", {**PAYLOAD, "request_id": uuid.uuid4().hex})
+            await asyncio.wait_for(done.wait(), 120)
+    finally:
+        await sio.disconnect()
+
+async def drive(url, clients, requests):
+    counts = {"frames": 0, "errors": 0, "replies": 0}
+    per_client = max(1, requests // clients)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(i, url, per_client, counts) for i in range(clients)))
+    return counts, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=128)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--tps", type=float, default=100.0, help="per-stream tokens/sec of the fake backend")
+    args = parser.parse_args()
+
+    backend_port = free_port()
+    backend = start_fake_backend(backend_port, ttft=0.02, tps=args.tps, tokens=args.tokens)
+    baseline = None
+    try:
+        for workers in args.workers:
+            port = free_port()
+            with tempfile.TemporaryDirectory() as prom_dir:
+                env = {"RP_COALESCE_MS": "0", "RP_COALESCE_BYTES": "1", "PROMETHEUS_MULTIPROC_DIR": prom_dir,
+                       "RP_MAX_INFLIGHT": str(args.clients)}
+                server = start_server(port, backend_port, env, workers)
+                try:
+                    counts, wall = asyncio.run(drive(f"http://127.0.0.1:{port}", args.clients, args.requests))
+                finally:
+                    server.terminate()
+                    server.wait()
+            rate = counts["frames"] / wall
+            baseline = baseline or rate
+            print(f"workers={workers:<3} {rate:10.0f} emits/s   x{rate / baseline:4.2f}   "
+                  f"{counts['replies'] / wall:7.1f} replies/s   errors={counts['errors']}   "
+                  f"wall={wall:.2f}s   cpus={os.cpu_count()}")
+            if counts.get("messages"):
+                print("  errors:", "; ".join(sorted(counts["messages"])))
+    finally:
+        backend.terminate()
+        backend.wait()
+
+if __name__ == "__main__":
+    main()
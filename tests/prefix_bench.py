@@ -0,0 +1,121 @@
+# Prefix-cache benchmark: how many prompt tokens could vLLM's automatic
+# prefix caching reuse for the legacy vs prefix prompt layout?
+#
+# usage: python tests/prefix_bench.py [--corpus corpus.jsonl] [--tokenizer /tokenizer/tokenizer.fixed]
+# corpus lines: {"character": {...}, "history": [...], "user_input": "..."}
+
+import argparse
+import json
+import random
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.ai import RPFormatter, sanitize_history
+from app.prompts import PromptManager
+from app.tokenizer import TOKENIZER_PATH, load_tokenizer
+
+CHARACTERS = [
+    {
+        "name": "Iron Man",
+        "description": "Billionaire genius inventor who built a high-tech suit to escape captivity.",
+        "personality": "Witty, confident, sometimes reckless; passionate about technology.",
+        "speakingStyle": "Fast-paced, humorous, filled with sarcasm and one-liners.",
+        "samples": ["I am Iron Man.", "Genius, billionaire, playboy, philanthropist."],
+    },
+    {
+        "name": "Sherlock Holmes",
+        "description": "Consulting detective in Victorian London with unmatched powers of deduction.",
+        "personality": "Cold, analytical, easily bored, secretly loyal.",
+        "speakingStyle": "Precise, clipped, condescending, rapid-fire observations.",
+        "samples": ["The game is afoot.", "You have been in Afghanistan, I perceive."],
+    },
+    {
+        "name": "Geralt of Rivia",
+        "description": "Monster hunter for hire, mutated witcher with white hair and two swords.",
+        "personality": "Stoic, pragmatic, dry humour, strong private moral code.",
+        "speakingStyle": "Terse, gravelly, few words.",
+        "samples": ["Hmm.", "Evil is evil. Lesser, greater, middling, it's all the same."],
+    },
+]
+
+INPUTS = [
+    "What's your name?",
+    "How was your day?",
+    "Tell me about your biggest fear.",
+    "What would you do if I betrayed you?",
+    "Give me one piece of advice.",
+]
+
+def synthetic_corpus(seed: int = 0):
+    rng = random.Random(seed)
+    corpus = []
+    for character in CHARACTERS:
+        history = []
+        for user_input in INPUTS:
+            corpus.append({"character": character, "history": list(history), "user_input": user_input})
+            history += [
+                {"role": "user", "content": user_input},
+                {"role": "assistant", "content": f"*{character['name']} shrugs* Reply {len(history)}."},
+            ]
+    rng.shuffle(corpus)
+    return corpus
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def common_prefix(a, b) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+def measure(tok, fmt: RPFormatter, corpus):
+    prompts = []
+    for item in corpus:
+        history = sanitize_history(item.get("history"))
+        text = fmt.build_manual_prompt(item["character"], history, item.get("user_input", ""))
+        prompts.append(tok.encode(text, add_special_tokens=False))
+
+    total = sum(len(p) for p in prompts)
+    shared_by_all = min(common_prefix(prompts[0], p) for p in prompts)
+    # Ideal prefix cache: each request reuses its longest prefix with any earlier request.
+    reusable = 0
+    for i, p in enumerate(prompts):
+        reusable += max((common_prefix(p, q) for q in prompts[:i]), default=0)
+    return {
+        "requests": len(prompts),
+        "avg_prompt_tokens": total / len(prompts),
+        "shared_by_all": shared_by_all,
+        "reusable_tokens": reusable,
+        "reuse_ratio": reusable / total if total else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="JSONL corpus of rp requests")
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH)
+    args = parser.parse_args()
+
+    try:
+        tok = load_tokenizer(args.tokenizer)
+    except Exception as e:
+        sys.exit(f"Could not load tokenizer at {args.tokenizer} (run app/fix_tokenizer.py first): {e}")
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    pm = PromptManager()
+
+    print(f"{'layout':<8} {'reqs':>5} {'avg tok':>8} {'shared':>7} {'reusable':>9} {'ratio':>6}")
+    for layout in RPFormatter.LAYOUTS:
+        r = measure(tok, RPFormatter(pm, layout=layout), corpus)
+        print(
+            f"{layout:<8} {r['requests']:>5} {r['avg_prompt_tokens']:>8.0f} {r['shared_by_all']:>7} "
+            f"{r['reusable_tokens']:>9} {r['reuse_ratio']:>6.1%}"
+        )
+
+if __name__ == "__main__":
+    main()
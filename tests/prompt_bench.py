@@ -0,0 +1,90 @@
+# Microbenchmark: manual prompt build time vs history length. Replays a
+# growing conversation (one exchange per turn) and times build_manual_prompt
+# per turn, comparing the previous f-string renderer (every message
+# re-stripped and re-formatted each turn) with the incremental history
+# renderer. "resent" rebuilds the history dicts every
+# turn, like a stateless client; "session" keeps them, like conversation_id.
+#
+# usage: python tests/prompt_bench.py [--turns 200] [--reps 5]
+
+import argparse
+import time
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.ai import RPFormatter
+from app.prompts import PromptManager
+
+CHARACTER = {
+    "name": "Sherlock Holmes",
+    "description": "Consulting detective in Victorian London with unmatched powers of deduction.",
+    "personality": "Cold, analytical, easily bored, secretly loyal.",
+    "speakingStyle": "Precise, clipped, condescending, rapid-fire observations.",
+    "samples": ["The game is afoot.", "You have been in Afghanistan, I perceive."],
+}
+USER = "Tell me what you deduce about the man who just walked in, and be quick about it, {}."
+REPLY = "*narrows his eyes* Left-handed, recently back from the coast, owes money to his tailor. Turn {} of our little game, Watson."
+MARKS = (10, 50, 100, 200, 400)
+
+class LegacyFormatter(RPFormatter):
+    # the renderer before HistoryRenderer, kept here as the baseline
+    def _render_turns(self, hist):
+        blocks = []
+        for m in hist:
+            role = (m.get("role") or "").lower()
+            content = (m.get("content") or "").strip()
+            if role in ("user", "assistant") and content:
+                blocks.append(f"<start_of_turn>{role}\n{content}\n<end_of_turn>")
+        return "\n".join(blocks)
+
+    def _manual_layout(self, pre, hist_txt, ui):
+        return (
+            "<start_of_turn>user\n"
+            f"{pre}\n\n"
+            "## Conversation So Far\n"
+            f"{hist_txt}\n"
+            "## Conversation Continues\n"
+            f"{ui}\n"
+            "<end_of_turn>\n"
+            "<start_of_turn>model\n"
+        )
+
+def replay(fmt, turns, resent):
+    # seconds per build, indexed by history length in messages
+    history, times = [], {}
+    for t in range(turns):
+        if resent:
+            history = [dict(m, content=(" " + m["content"])[1:]) for m in history]
+        t0 = time.perf_counter()
+        prompt = fmt.build_manual_prompt(CHARACTER, history, USER.format(t))
+        times[len(history)] = time.perf_counter() - t0
+        history = history + [{"role": "user", "content": USER.format(t)}, {"role": "assistant", "content": REPLY.format(t)}]
+    return times, prompt
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=201)
+    parser.add_argument("--reps", type=int, default=5)
+    args = parser.parse_args()
+
+    marks = [m for m in MARKS if m < 2 * args.turns]
+    print("history msgs " + "".join(f"{m:>9}" for m in marks) + "   (us per prompt, best of reps)")
+    for mode in ("resent", "session"):
+        results = {}
+        for name, cls in (("f-string", LegacyFormatter), ("increment", RPFormatter)):
+            best = {}
+            for _ in range(args.reps):
+                times, prompt = replay(cls(PromptManager()), args.turns, mode == "resent")
+                for k, v in times.items():
+                    best[k] = min(best.get(k, v), v)
+            results[name] = (best, prompt)
+            print(f"{mode:<7} {name:<9}" + "".join(f"{best[m] * 1e6:9.1f}" for m in marks))
+        assert results["f-string"][1] == results["increment"][1], "renderers disagree"
+        total = {name: sum(best.values()) for name, (best, _) in results.items()}
+        print(f"{mode:<7} whole session x{total['f-string'] / total['increment']:.2f}")
+
+if __name__ == "__main__":
+    main()
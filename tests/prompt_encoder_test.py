@@ -0,0 +1,96 @@
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+from app.ai import RPFormatter
+from app.cache import LRUCache
+from app.prompts import PromptManager
+from app.tokenizer import PromptEncoder, PromptText
+
+CHARACTER = {"name": "Geralt", "description": "Witcher of Rivia.", "personality": "Stoic, dry.", "speakingStyle": "Terse.", "samples": ["Hmm.", "Wind's howling."]}
+
+def bpe_tokenizer():
+    # byte-level BPE trained on prompt-like text, so merges do cross whitespace and newlines
+    transformers = pytest.importorskip("transformers")
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=400, special_tokens=["<pad>", "<eos>", "<bos>", "<unk>"], show_progress=False)
+    corpus = [
+        "Geralt: Hmm.\n\nUser: Where are you going?\n",
+        "You are Geralt, a witcher of Rivia.\nStay in character.\n\n",
+        "<start_of_turn>user\nquestion\n<end_of_turn>\n<start_of_turn>model\n",
+    ] * 50
+    backend.train_from_iterator(corpus, trainer)
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend, bos_token="<bos>", eos_token="<eos>", unk_token="<unk>", pad_token="<pad>",
+    )
+
+class GlueTokenizer:
+    # one id per character, except that "a\n" is a single token: a prefix ending
+    # in "a" tokenizes differently on its own than inside the prompt
+    bos_token_id = 0
+
+    def encode(self, text, add_special_tokens=False):
+        ids, i = [], 0
+        while i < len(text):
+            if text.startswith("a\n", i):
+                ids.append(1)
+                i += 2
+            else:
+                ids.append(ord(text[i]) + 2)
+                i += 1
+        return ids
+
+@pytest.mark.parametrize("layout", ["legacy", "prefix", "chat"])
+def test_cached_prefix_matches_full_tokenization(layout):
+    tok = bpe_tokenizer()
+    enc = PromptEncoder(tok, LRUCache(16, name="test_segments"))
+    fmt = RPFormatter(PromptManager(), layout=layout)
+    history = []
+    for turn in range(6):
+        prompt = fmt.build_manual_prompt(CHARACTER, history, f"Where now, {turn}?\n\n  ")
+        assert isinstance(prompt, PromptText) and 0 < prompt.prefix_len <= len(prompt)
+        assert enc.encode(prompt) == [tok.bos_token_id] + tok.encode(prompt, add_special_tokens=False)
+        history += [{"role": "user", "content": f"Where now, {turn}?"}, {"role": "assistant", "content": "Hmm.\n"}]
+    # one verified miss, then every later turn reuses the preamble ids
+    assert len(enc.cache) == 1
+
+def test_every_boundary_matches_full_tokenization():
+    tok = bpe_tokenizer()
+    enc = PromptEncoder(tok)
+    text = "You are Geralt.\n\n\nStay in character.\nUser: Where are you going?\n\nGeralt:"
+    full = [tok.bos_token_id] + tok.encode(text, add_special_tokens=False)
+    for prefix_len in range(len(text) + 1):
+        # twice: the verifying miss, then the cached hit (or the remembered full encode)
+        assert enc.encode(PromptText(text, prefix_len)) == full
+        assert enc.encode(PromptText(text, prefix_len)) == full
+
+def test_cut_starts_at_newline_run():
+    assert PromptEncoder.cut("ab\n\n\ncd", 6) == 2
+    assert PromptEncoder.cut("ab\n\n\ncd", 1) == 0
+    assert PromptEncoder.cut("abcd", 4) == 0
+
+def test_boundary_merge_falls_back_to_full_encoding():
+    tok = GlueTokenizer()
+    enc = PromptEncoder(tok)
+    for text in ("rules a\nhello", "rules a\nagain"):
+        prompt = PromptText(text, len("rules a"))
+        assert enc.encode(prompt) == [0] + tok.encode(text)
+    assert enc.cache.get("rules a") is not None and not isinstance(enc.cache.get("rules a"), list)
+
+    safe = PromptText("rules b\nhello", len("rules b"))
+    assert enc.encode(safe) == [0] + tok.encode(safe)
+    assert enc.cache.get("rules b") == tok.encode("rules b")
+
+def test_plain_str_is_encoded_in_full():
+    tok = GlueTokenizer()
+    enc = PromptEncoder(tok)
+    assert enc.encode("rules\nhello") == [0] + tok.encode("rules\nhello")
+    assert len(enc.cache) == 0
@@ -0,0 +1,191 @@
+# Replay/load harness: runs server:app (create_app) under uvicorn against the
+# fake completions backend, replays a JSONL corpus from N concurrent Socket.IO
+# clients and reports throughput, TTFT/latency percentiles and server CPU per
+# token. No GPU, no network; the tokenizer falls back to its heuristic if absent.
+#
+# corpus lines: {"event": "rp_start" | "rp_once" | "rp_twitter", "data": {...}}
+#
+# usage: python tests/replay_bench.py [--corpus tests/replay_corpus.jsonl] [--clients 20]
+#            [--requests 400] [--ttft 0.05] [--tps 80] [--tokens 60] [--json out.json]
+
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import subprocess
+import time
+import uuid
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import httpx
+import jwt
+import socketio
+
+from fake_vllm import free_port, start_fake_backend, wait_http
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "replay_corpus.jsonl")
+SECRET = "replay-bench-secret-at-least-32-bytes"
+# terminal event per request event
+RESULTS = {"rp_start": "rp_done", "rp_once": "rp_once_result", "rp_twitter": "rp_twitter_result"}
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    for item in items:
+        if item.get("event") not in RESULTS:
+            raise ValueError(f"Unsupported corpus event: {item.get('event')!r}")
+    return items
+
+def start_server(port, backend_port, env_overrides, workers=1):
+    env = dict(
+        os.environ,
+        VLLM_BASE_URL=f"http://127.0.0.1:{backend_port}/v1",
+        JWT_SECRET=SECRET,
+        JWT_ALGORITHMS="HS256",
+        **env_overrides,
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=parent_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_http(f"http://127.0.0.1:{port}/metrics", proc, timeout=60)
+    return proc
+
+def scrape(url):
+    # sum of every sample of the metrics we compare before/after the run
+    text = httpx.get(url).text
+    out = {}
+    for name in ("process_cpu_seconds_total", "rp_completion_tokens_total", "rp_prompt_tokens_total"):
+        out[name] = sum(float(v) for v in re.findall(rf"^{name}(?:{{[^}}]*}})? ([0-9.eE+-]+)$", text, re.M))
+    return out
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def client(idx, url, queue, results):
+    token = jwt.encode({"sub": f"bench-{idx}", "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+    sio = socketio.AsyncClient()
+    pending = {}
+
+    def finish(msg, ok):
+        entry = pending.pop(msg.get("request_id"), None)
+        if entry is not None:
+            entry["done"] = time.perf_counter()
+            entry["ok"] = ok
+            entry["event"].set()
+
+    @sio.on("rp_token")
+    async def on_token(msg):
+        entry = pending.get(msg["request_id"])
+        if entry is not None and entry["first"] is None:
+            entry["first"] = time.perf_counter()
+
+    for name in RESULTS.values():
+        sio.on(name, lambda msg: finish(msg, True))
+    sio.on("rp_error", lambda msg: finish(msg, False))
+
+    await sio.connect(url, headers={"Authorization": f"Bearer {token}"}, transports=["websocket"])
+    try:
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            rid = uuid.uuid4().hex
+            entry = {"kind": item["event"], "first": None, "done": None, "ok": False, "event": asyncio.Event()}
+            pending[rid] = entry
+            entry["start"] = time.perf_counter()
+            await sio.emit(item["event"], {**item["data"], "request_id": rid})
+            try:
+                await asyncio.wait_for(entry["event"].wait(), 120)
+            except asyncio.TimeoutError:
+                pending.pop(rid, None)
+            results.append(entry)
+    finally:
+        await sio.disconnect()
+
+async def drive(url, corpus, clients, requests):
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(corpus[i % len(corpus)])
+    results = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(i, url, queue, results) for i in range(clients)))
+    return results, time.perf_counter() - t0
+
+def report(results, wall, before, after, clients):
+    ok = [r for r in results if r["ok"]]
+    latency = [(r["done"] - r["start"]) * 1000 for r in ok]
+    ttft = [(r["first"] - r["start"]) * 1000 for r in ok if r["first"] is not None]
+    cpu = after["process_cpu_seconds_total"] - before["process_cpu_seconds_total"]
+    tokens = after["rp_completion_tokens_total"] - before["rp_completion_tokens_total"]
+    summary = {
+        "clients": clients,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "wall_s": wall,
+        "req_per_s": len(ok) / wall,
+        "tokens_per_s": tokens / wall,
+        "ttft_p50_ms": percentile(ttft, 0.5),
+        "ttft_p99_ms": percentile(ttft, 0.99),
+        "latency_p50_ms": percentile(latency, 0.5),
+        "latency_p99_ms": percentile(latency, 0.99),
+        "latency_mean_ms": statistics.mean(latency) if latency else float("nan"),
+        "server_cpu_s": cpu,
+        "server_cpu_util": cpu / wall,
+        "server_cpu_us_per_token": cpu / tokens * 1e6 if tokens else float("nan"),
+    }
+    print(
+        f"clients={clients} requests={summary['requests']} errors={summary['errors']} wall={wall:.2f}s\n"
+        f"  throughput   {summary['req_per_s']:8.1f} req/s   {summary['tokens_per_s']:8.0f} tokens/s\n"
+        f"  TTFT         p50 {summary['ttft_p50_ms']:8.1f} ms   p99 {summary['ttft_p99_ms']:8.1f} ms\n"
+        f"  latency      p50 {summary['latency_p50_ms']:8.1f} ms   p99 {summary['latency_p99_ms']:8.1f} ms\n"
+        f"  server CPU   {cpu:.2f}s ({summary['server_cpu_util'] * 100:.0f}% of one core), "
+        f"{summary['server_cpu_us_per_token']:.1f} us/token"
+    )
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--tps", type=float, default=80.0)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra server environment, e.g. --env RP_COALESCE_MS=0")
+    parser.add_argument("--json", help="write the summary here, for comparing runs")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    overrides = dict(kv.split("=", 1) for kv in args.env)
+    backend_port, server_port = free_port(), free_port()
+    backend = start_fake_backend(backend_port, args.ttft, args.tps, args.tokens)
+    server = None
+    try:
+        server = start_server(server_port, backend_port, overrides)
+        metrics_url = f"http://127.0.0.1:{server_port}/metrics"
+        before = scrape(metrics_url)
+        results, wall = asyncio.run(drive(f"http://127.0.0.1:{server_port}", corpus, args.clients, args.requests))
+        summary = report(results, wall, before, scrape(metrics_url), args.clients)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({**summary, "env": overrides, "ttft": args.ttft, "tps": args.tps, "tokens": args.tokens}, f, indent=2)
+    finally:
+        for proc in (server, backend):
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import asyncio
+import types
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+import server as srv
+from app.ai import GenDefaults, RPFormatter
+from app.prompts import PromptManager
+from app.rooms import RoomRegistry, RoomStream
+from app.streaming import StreamConfig
+
+def test_ring_buffer_keeps_newest_frames():
+    stream = RoomStream("lobby", "r1", max_frames=3)
+    for frame in "abcde":
+        stream.record(frame)
+    assert stream.prefix() == "cde"
+    assert stream.dropped == 2
+
+def test_one_generation_per_room():
+    rooms = RoomRegistry()
+    first = rooms.start("lobby", "r1")
+    with pytest.raises(ValueError):
+        rooms.start("lobby", "r2")
+    rooms.finish(first)
+    assert rooms.get("lobby") is None
+    rooms.start("lobby", "r3")
+
+class FakeStream:
+    def __init__(self, tokens, started):
+        self.tokens = tokens
+        self.started = started
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for i, tok in enumerate(self.tokens):
+            if i == 3:
+                self.started.set()
+            await asyncio.sleep(0.002)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(text=tok, finish_reason=None)], usage=None)
+
+    async def close(self):
+        pass
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+        self.started = asyncio.Event()
+
+    async def stream_completion(self, prompt, affinity=None, **kwargs):
+        self.calls += 1
+        return FakeStream([f"t{i} " for i in range(10)], self.started)
+
+def test_late_joiner_gets_prefix_then_live_tokens():
+    async def main():
+        llm = FakeLLM()
+        server = srv.RPServer(llm, RPFormatter(PromptManager()), GenDefaults(), StreamConfig(coalesce_ms=0, coalesce_bytes=1))
+        received = {}
+
+        async def emit(event, data, to=None, skip_sid=None, **kw):
+            members = server.sio.manager.rooms["/"].get(to, {}) if to.startswith("rp-room:") else [to]
+            for sid in members:
+                if sid != skip_sid:
+                    received[sid].append((event, data))
+
+        server.sio.emit = emit
+        starter = await server.sio.manager.connect("eio-starter", "/")
+        late = await server.sio.manager.connect("eio-late", "/")
+        for sid in (starter, late):
+            received[sid] = []
+            srv.auth.sessions.add(sid, {})
+        handlers = server.sio.handlers["/"]
+
+        start = asyncio.create_task(handlers["rp_room_start"](starter, {
+            "request_id": "r1", "room": "lobby", "character": {"name": "A"}, "user_input": "hi", "members": [late],
+        }))
+        await llm.started.wait()
+        join = await handlers["rp_room_join"](late, {"room": "lobby", "owner": starter})
+        await start
+        return llm.calls, join, received[starter], received[late]
+
+    calls, join, starter, late = asyncio.run(main())
+    assert calls == 1
+    assert join["generating"] and join["request_id"] == "r1"
+    expected = "".join(f"t{i} " for i in range(10))
+    for events in (starter, late):
+        assert "".join(d["token"] for e, d in events if e == "rp_token") == expected
+        assert events[-1] == ("rp_done", {"request_id": "r1", "room": "lobby", "text": expected.strip()})
+    assert late[0][1]["replay"] is True
+
+def test_non_members_cannot_join_or_start():
+    async def main():
+        llm = FakeLLM()
+        server = srv.RPServer(llm, RPFormatter(PromptManager()), GenDefaults(), StreamConfig(coalesce_ms=0, coalesce_bytes=1))
+        errors = []
+
+        async def emit(event, data, to=None, skip_sid=None, **kw):
+            if event == "rp_error":
+                errors.append(data["message"])
+
+        server.sio.emit = emit
+        owner = await server.sio.manager.connect("eio-owner", "/")
+        other = await server.sio.manager.connect("eio-other", "/")
+        srv.auth.sessions.add(owner, {"sub": "alice"})
+        srv.auth.sessions.add(other, {"sub": "mallory"})
+        handlers = server.sio.handlers["/"]
+
+        opened = await handlers["rp_room_join"](owner, {"room": "lobby", "members": ["bob"]})
+        joined = await handlers["rp_room_join"](other, {"room": "lobby", "owner": "alice"})
+        await handlers["rp_room_start"](other, {
+            "request_id": "r1", "room": "lobby", "owner": "alice", "character": {"name": "A"}, "user_input": "hi",
+        })
+        # the same name opened by mallory is mallory's own room
+        own = await handlers["rp_room_join"](other, {"room": "lobby"})
+        members = server.sio.manager.rooms["/"].get("rp-room:alice:lobby", {})
+        return opened, joined, errors, own, llm.calls, other in members
+
+    opened, joined, errors, own, calls, listening = asyncio.run(main())
+    assert opened["status"] is True
+    assert joined["status"] is False and "member" in joined["message"]
+    assert len(errors) == 1 and "member" in errors[0]
+    assert own["status"] is True
+    assert calls == 0 and not listening
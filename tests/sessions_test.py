@@ -0,0 +1,140 @@
+import asyncio
+import time
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+from app.sessions import Conversation, InMemorySessionStore, RedisSessionStore
+
+CHARACTER = {"name": "Iron Man", "description": "Inventor."}
+
+class LocalRedis:
+    # Minimal stand-in for redis.asyncio.Redis
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = (value.encode(), time.monotonic() + ex if ex else None)
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+def test_append_exchange_caps_turns_on_pair_boundary():
+    conv = Conversation("c1", CHARACTER)
+    for i in range(10):
+        conv.append_exchange(f"q{i}", f"a{i}", max_turns=7)
+    assert len(conv.history) == 6
+    assert conv.history[0] == {"role": "user", "content": "q7"}
+    conv.append_exchange("q", "", max_turns=7)
+    assert len(conv.history) == 6
+
+def test_in_memory_store_evicts_least_recent():
+    async def main():
+        store = InMemorySessionStore(max_conversations=2)
+        for cid in ("a", "b", "c"):
+            await store.put(Conversation(cid, CHARACTER))
+        return await store.get("a"), await store.get("c"), len(store)
+
+    evicted, kept, size = asyncio.run(main())
+    assert evicted is None and kept.conversation_id == "c" and size == 2
+
+def test_redis_store_round_trips_conversation():
+    async def main():
+        store = RedisSessionStore(LocalRedis(), ttl=60)
+        conv = Conversation("c1", CHARACTER)
+        conv.append_exchange("Hi", "*waves* Hey.", max_turns=10)
+        await store.put(conv)
+        loaded = await store.get("c1")
+        await store.delete("c1")
+        return conv, loaded, await store.get("c1")
+
+    conv, loaded, deleted = asyncio.run(main())
+    assert loaded == conv
+    assert deleted is None
+
+def test_append_exchange_keeps_last_exchange_for_tiny_caps():
+    for max_turns in (0, 1, 2):
+        conv = Conversation("c1", CHARACTER)
+        for i in range(3):
+            conv.append_exchange(f"q{i}", f"a{i}", max_turns=max_turns)
+        assert conv.history == [{"role": "user", "content": "q2"}, {"role": "assistant", "content": "a2"}]
+
+def _server():
+    import server as srv
+    from app.ai import GenDefaults, RPFormatter
+    from app.prompts import PromptManager
+    return srv.RPServer(None, RPFormatter(PromptManager()), GenDefaults())
+
+def test_conversation_ids_are_scoped_to_the_user():
+    async def main():
+        server = _server()
+        async with server._conversation("alice", {"conversation_id": "c1", "character": CHARACTER}) as (_, _, conv):
+            await server._remember(conv, "secret", "kept")
+        async with server._conversation("alice", {"conversation_id": "c1"}) as (_, history, _):
+            pass
+        with pytest.raises(ValueError):
+            async with server._conversation("mallory", {"conversation_id": "c1"}):
+                pass
+        async with server._conversation("mallory", {"conversation_id": "c1", "character": CHARACTER}) as (_, other, _):
+            pass
+        return history, other
+
+    history, other = asyncio.run(main())
+    assert history[0]["content"] == "secret"
+    assert other == []
+
+def test_failed_turn_leaves_stored_conversation_alone():
+    async def main():
+        server = _server()
+        async with server._conversation("alice", {"conversation_id": "c1", "character": CHARACTER}) as (_, _, conv):
+            await server._remember(conv, "q", "a")
+        with pytest.raises(RuntimeError):
+            async with server._conversation("alice", {"conversation_id": "c1", "character": {"name": "New"}}) as (_, history, _):
+                history.append({"role": "user", "content": "lost"})
+                raise RuntimeError("backend down")
+        return await server.sessions.get("alice:c1"), len(server._turns)
+
+    stored, locks = asyncio.run(main())
+    assert stored.character == CHARACTER
+    assert [m["content"] for m in stored.history] == ["q", "a"]
+    assert locks == 0
+
+def test_concurrent_turns_on_one_conversation_are_serialized():
+    async def main():
+        server = _server()
+
+        async def turn(n):
+            async with server._conversation("alice", {"conversation_id": "c1", "character": CHARACTER}) as (_, history, conv):
+                seen = len(history)
+                await asyncio.sleep(0.01)
+                await server._remember(conv, f"q{n}", f"a{n}")
+                return seen
+
+        seen = await asyncio.gather(*(turn(n) for n in range(3)))
+        return seen, await server.sessions.get("alice:c1")
+
+    seen, stored = asyncio.run(main())
+    # each turn saw every earlier exchange, and none was lost
+    assert sorted(seen) == [0, 2, 4]
+    assert len(stored.history) == 6
+
+def test_incomplete_store_fails_on_construction():
+    from app.sessions import SessionStore
+
+    class GetOnly(SessionStore):
+        async def get(self, conversation_id):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
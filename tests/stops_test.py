@@ -0,0 +1,161 @@
+import asyncio
+import random
+import types
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+import server as srv
+from app.ai import GenDefaults, RPFormatter
+from app.prompts import PromptManager
+from app.stops import DEFAULT_STOPS, StopConfig, character_stops, stop_matcher, trim_stops
+from app.streaming import StreamConfig
+
+def _run(chunks, patterns):
+    matcher = stop_matcher(patterns)
+    out = "".join(matcher.feed(c) for c in chunks)
+    return out + (matcher.finish() if not matcher.stopped else ""), matcher.stopped
+
+def _reference(text, patterns):
+    # cut before the stop string that completes first
+    ends = [(text.find(p) + len(p), text.find(p)) for p in patterns if p in text]
+    return (text[:min(ends)[1]], True) if ends else (text, False)
+
+def test_marker_split_across_chunks_is_never_emitted():
+    stops = character_stops({"user_name": "Ann"})
+    matcher = stop_matcher(stops)
+    assert matcher.feed("She smiles.") == "She smiles."
+    assert matcher.feed(" <start_") == " "
+    assert matcher.feed("of_tu") == ""
+    assert matcher.feed("rn>user\nhi") == ""
+    assert matcher.stopped
+    assert matcher.feed("more") == ""
+    assert _run(["Yes.\nAn", "n: no"], stops) == ("Yes.", True)
+
+def test_held_text_is_released_when_no_marker_follows():
+    assert _run(["a\nUs", "ually"], DEFAULT_STOPS) == ("a\nUsually", False)
+    assert _run(["a <b>", " c"], DEFAULT_STOPS) == ("a <b> c", False)
+
+def test_partial_marker_at_end_is_dropped():
+    assert _run(["Bye.<end_of"], DEFAULT_STOPS) == ("Bye.", False)
+    assert trim_stops("Bye.\nuser: hi", DEFAULT_STOPS) == "Bye."
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_reference_for_any_chunking(seed):
+    rng = random.Random(seed)
+    patterns = ("aab", "ab", "bca", "\nX:", "<s>")
+    text = "".join(rng.choice("abc<>s\nX: ") for _ in range(60))
+    cuts = sorted(rng.sample(range(1, len(text)), 8))
+    chunks = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+    out, stopped = _run(chunks, patterns)
+    expected, matched = _reference(text, patterns)
+    assert stopped == matched
+    if matched:
+        assert out == expected
+    else:
+        assert expected.startswith(out) and len(expected) - len(out) < 3
+
+def test_extra_stops_from_config():
+    cfg = StopConfig(sequences='["\\nNarrator:"]')
+    assert "\nNarrator:" in cfg.global_stops()
+    with pytest.raises(ValueError):
+        StopConfig(sequences='{"a": 1}').global_stops()
+    assert "\nBob:" in character_stops({"partner_name": "Bob", "stop": ["END"]}) and "END" in character_stops({"stop": ["END"]})
+    assert character_stops({"stop": "END"}) == character_stops({"stop": ["END"]})
+
+class FakeStream:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for tok in self.tokens:
+            self.sent += 1
+            await asyncio.sleep(0)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(text=tok, finish_reason=None)], usage=None)
+
+    async def close(self):
+        self.closed = True
+
+class FakeLLM:
+    def __init__(self, tokens):
+        self.stream = FakeStream(tokens)
+
+    async def stream_completion(self, prompt, affinity=None, **kwargs):
+        return self.stream
+
+def test_stream_is_closed_on_stop_match():
+    async def main():
+        tokens = ["Hello", " there", ".\n", "Us", "er:", " what", " now"] + [" x"] * 50
+        llm = FakeLLM(tokens)
+        server = srv.RPServer(llm, RPFormatter(PromptManager()), GenDefaults(), StreamConfig(coalesce_ms=0))
+        frames = []
+
+        async def emit(text):
+            frames.append(text)
+
+        text = await server._stream_reply(
+            "sid", "r1", "prompt", "key", {"max_tokens": 768}, emit=emit, stops=server._stops({})
+        )
+        return text, frames, llm.stream
+
+    text, frames, stream = asyncio.run(main())
+    assert text == "Hello there."
+    assert "".join(frames) == "Hello there."
+    assert stream.closed and stream.sent == 5
+
+def test_stream_is_closed_when_emit_fails():
+    async def main():
+        llm = FakeLLM(["Hello", " there"] + [" x"] * 50)
+        server = srv.RPServer(llm, RPFormatter(PromptManager()), GenDefaults(), StreamConfig(coalesce_ms=0, coalesce_bytes=1))
+
+        async def emit(text):
+            raise ConnectionError("socket gone")
+
+        with pytest.raises(ConnectionError):
+            await server._stream_reply("sid", "r1", "prompt", "key", {"max_tokens": 64}, emit=emit)
+        return llm.stream
+
+    stream = asyncio.run(main())
+    assert stream.closed
+
+def test_turn_marker_from_vllm_stops_the_stream():
+    # the model writes its reply, then opens the user's turn; vLLM sends special
+    # tokens' text only when skip_special_tokens is false
+    import httpx
+    from app.ai import LLMClient, ModelConfig
+    from fake_vllm import create_fake_app
+
+    script = ["Sure", ".", "\n", "<start_of_turn>", "user", "\n", "And", " then", "?"] + [" x"] * 20
+    app = create_fake_app(ttft=0, tokens_per_sec=0, script=script)
+
+    async def main(stop_cfg):
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+        llm = LLMClient(ModelConfig(base_url="http://vllm/v1"), http_client=http)
+        server = srv.RPServer(llm, RPFormatter(PromptManager()), GenDefaults(), StreamConfig(coalesce_ms=0), stop_cfg=stop_cfg)
+        frames = []
+
+        async def emit(text):
+            frames.append(text)
+
+        text = await server._stream_reply(
+            "sid", "r1", "prompt", "key", server._gen_kwargs("rp_start", "key"), emit=emit, stops=server._stops({})
+        )
+        await http.aclose()
+        return text, app.state.stats["last_body"]
+
+    text, body = asyncio.run(main(StopConfig()))
+    assert text == "Sure."
+    assert body["skip_special_tokens"] is False and body["repetition_penalty"] == 1.08
+    # what used to happen: the marker's text is dropped and the reply runs on
+    text, body = asyncio.run(main(StopConfig(enabled=False)))
+    assert "skip_special_tokens" not in body
+    assert text.startswith("Sure.\nuser\nAnd then?")
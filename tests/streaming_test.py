@@ -0,0 +1,101 @@
+import asyncio
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.streaming import EmitGates, StreamConfig, TokenCoalescer
+
+def test_coalescer_merges_tokens_within_window():
+    async def main():
+        frames = []
+        async def emit(text):
+            frames.append(text)
+
+        cfg = StreamConfig(coalesce_ms=50, coalesce_bytes=10_000)
+        async with TokenCoalescer(emit, cfg) as coalescer:
+            for tok in ["Hel", "lo", ", ", "world"]:
+                coalescer.push(tok)
+        return frames, coalescer.frames
+
+    frames, count = asyncio.run(main())
+    assert frames == ["Hello, world"]
+    assert count == 1
+
+def test_coalescer_flushes_on_byte_budget():
+    async def main():
+        frames = []
+        async def emit(text):
+            frames.append(text)
+
+        cfg = StreamConfig(coalesce_ms=10_000, coalesce_bytes=4)
+        async with TokenCoalescer(emit, cfg) as coalescer:
+            for tok in ["ab", "cd", "ef", "gh"]:
+                coalescer.push(tok)
+                await asyncio.sleep(0.005)
+        return frames
+
+    frames = asyncio.run(main())
+    assert "".join(frames) == "abcdefgh"
+    assert len(frames) >= 2
+    assert all(len(f) >= 4 for f in frames[:-1])
+
+def test_coalescer_flushes_after_window_without_new_tokens():
+    async def main():
+        frames = []
+        async def emit(text):
+            frames.append(text)
+
+        cfg = StreamConfig(coalesce_ms=10, coalesce_bytes=10_000)
+        async with TokenCoalescer(emit, cfg) as coalescer:
+            coalescer.push("first")
+            await asyncio.sleep(0.05)
+            assert frames == ["first"]
+            coalescer.push("second")
+        return frames
+
+    assert asyncio.run(main()) == ["first", "second"]
+
+def test_slow_emit_coalesces_instead_of_queueing():
+    async def main():
+        frames = []
+        async def emit(text):
+            frames.append(text)
+            await asyncio.sleep(0.02)
+
+        gates = EmitGates(1)
+        cfg = StreamConfig(coalesce_ms=0, coalesce_bytes=1)
+        with gates.gate("sid") as gate:
+            async with TokenCoalescer(emit, cfg, gate) as coalescer:
+                for i in range(50):
+                    coalescer.push(str(i % 10))
+                    await asyncio.sleep(0.001)
+        return frames, len(gates)
+
+    frames, open_gates = asyncio.run(main())
+    assert "".join(frames) == "".join(str(i % 10) for i in range(50))
+    assert len(frames) < 50
+    assert open_gates == 0
+
+def test_emit_failure_surfaces_on_push():
+    async def main():
+        async def emit(text):
+            raise ConnectionError("gone")
+
+        cfg = StreamConfig(coalesce_ms=0, coalesce_bytes=1)
+        coalescer = TokenCoalescer(emit, cfg)
+        coalescer.push("a")
+        await asyncio.sleep(0.01)
+        try:
+            coalescer.push("b")
+        except ConnectionError:
+            return True
+        finally:
+            try:
+                await coalescer.close()
+            except ConnectionError:
+                pass
+        return False
+
+    assert asyncio.run(main())
@@ -0,0 +1,57 @@
+import random
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+from app.prompts import PromptManager
+from app.templates import HistoryRenderer
+
+def _naive(history):
+    blocks = []
+    for m in history:
+        role = (m.get("role") or "").lower()
+        content = (m.get("content") or "").strip()
+        if role in ("user", "assistant") and content:
+            blocks.append(f"<start_of_turn>{role}\n{content}\n<end_of_turn>")
+    return "\n".join(blocks)
+
+def test_growing_and_truncated_conversation():
+    renderer = HistoryRenderer(PromptManager().turn_block, min_messages=0)
+    history = []
+    for turn in range(30):
+        history = history + [{"role": "user", "content": f"q{turn} "}, {"role": "assistant", "content": f"a{turn}"}]
+        # like fit_history: keep at most the last 10 pairs
+        kept = history[-20:]
+        assert renderer.render(kept) == _naive(kept)
+        # the same history resent with fresh dicts and strings
+        resent = [dict(m, content=(" " + m["content"])[1:]) for m in kept]
+        assert renderer.render(resent) == _naive(kept)
+
+def test_short_histories_are_not_stored():
+    renderer = HistoryRenderer(PromptManager().turn_block, min_messages=4)
+    short = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+    assert renderer.render(short) == _naive(short)
+    assert not renderer._rendered
+    assert renderer.render(short * 2) == _naive(short * 2)
+    assert len(renderer._rendered) == 1
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_histories_match_naive(seed):
+    rng = random.Random(seed)
+    renderer = HistoryRenderer(PromptManager().turn_block, maxsize=4, min_messages=0)
+    pool = [{"role": r, "content": c} for r in ("user", "assistant", "USER", "system") for c in ("x", " y ", "", "z")]
+    history = []
+    for _ in range(60):
+        op = rng.random()
+        if op < 0.5:
+            history = history + rng.sample(pool, rng.randint(1, 2))
+        elif op < 0.7 and history:
+            history = history[rng.randint(1, len(history)):]
+        elif op < 0.8:
+            history = []
+        assert renderer.render(history) == _naive(history)
+    assert len(renderer._rendered) <= 4
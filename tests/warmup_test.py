@@ -0,0 +1,93 @@
+import asyncio
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+import pytest
+
+from app.ai import RPFormatter
+from app.prompts import PromptManager
+from app.warmup import PrefixWarmer, WarmupConfig
+
+class FakeLLM:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def completion_once(self, prompt, affinity=None, **kwargs):
+        self.calls.append((prompt, affinity, kwargs))
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("backend down")
+        return ""
+
+def character(name):
+    return {"name": name, "description": f"{name} is a test character."}
+
+def test_warmup_prompt_is_a_prefix_of_real_prompts():
+    fmt = RPFormatter(PromptManager())
+    ch = character("A")
+    assert fmt.build_manual_prompt(ch, [{"role": "user", "content": "x"}, {"role": "assistant", "content": "y"}], "hi").startswith(
+        fmt.warmup_prompt(ch)
+    )
+    assert fmt.build_twitter_prompt(ch, "@a hi").startswith(fmt.warmup_prompt(ch, "twitter"))
+
+def test_warm_dedups_per_character_and_sends_one_token():
+    async def main():
+        llm = FakeLLM()
+        warmer = PrefixWarmer(llm, RPFormatter(PromptManager()), WarmupConfig(burst=10))
+        results = [warmer.warm(character("A")), warmer.warm(character("A"))]
+        await asyncio.sleep(0.05)
+        results.append(warmer.warm(character("A")))
+        results.append(warmer.warm(character("A"), "twitter"))
+        await warmer.aclose()
+        return llm.calls, results
+
+    calls, results = asyncio.run(main())
+    assert results == ["scheduled", "duplicate", "duplicate", "scheduled"]
+    assert calls[0][2] == {"max_tokens": 1}
+
+def test_warm_is_rate_limited_and_bounded():
+    now = [0.0]
+
+    async def main():
+        llm = FakeLLM()
+        cfg = WarmupConfig(rate=1.0, burst=2, max_inflight=10)
+        warmer = PrefixWarmer(llm, RPFormatter(PromptManager()), cfg, clock=lambda: now[0])
+        results = [warmer.warm(character(n)) for n in "ABC"]
+        now[0] += 1.0
+        results.append(warmer.warm(character("D")))
+
+        busy = PrefixWarmer(llm, RPFormatter(PromptManager()), WarmupConfig(max_inflight=1, burst=10))
+        results += [busy.warm(character("E")), busy.warm(character("F"))]
+        await warmer.aclose()
+        await busy.aclose()
+        return results
+
+    assert asyncio.run(main()) == ["scheduled", "scheduled", "rate_limited", "scheduled", "scheduled", "busy"]
+
+def test_failed_warmup_can_be_retried():
+    async def main():
+        warmer = PrefixWarmer(FakeLLM(fail=True), RPFormatter(PromptManager()), WarmupConfig(burst=10))
+        first = warmer.warm(character("A"))
+        await asyncio.sleep(0.05)
+        return first, warmer.warm(character("A"))
+
+    assert asyncio.run(main()) == ("scheduled", "scheduled")
+
+def test_rate_limit_is_per_user_and_kind_is_checked():
+    async def main():
+        warmer = PrefixWarmer(FakeLLM(), RPFormatter(PromptManager()), WarmupConfig(rate=0.0, burst=1, max_inflight=10), clock=lambda: 0.0)
+        results = [
+            warmer.warm(character("A"), user="u1"),
+            warmer.warm(character("B"), user="u1"),
+            warmer.warm(character("B"), user="u2"),
+        ]
+        with pytest.raises(ValueError):
+            warmer.warm(character("C"), "manual-2", user="u3")
+        await warmer.aclose()
+        return results
+
+    assert asyncio.run(main()) == ["scheduled", "rate_limited", "scheduled"]